@@ -0,0 +1,155 @@
+"""
+Module for analysing the graph of "Blocks" relationships between issues.
+
+The graph is built once from the issue links. Strongly connected components
+(cycles of blocks) are found with an iterative version of Tarjan's
+algorithm, and the set of Milestones reachable from each component is
+computed once over the resulting acyclic condensation, so that the
+dependents of every issue are available without repeated traversals. The
+sets hold only the issues reached, and are shared between components where
+possible, so that their size follows the number of dependents rather than
+the square of the number of issues.
+"""
+
+
+class BlocksGraph:
+    """Index of the "Blocks" links between a set of issues.
+
+    Args:
+        issues: Dict mapping issue key to issue. Only links between issues
+            in the dict are considered.
+        link_type: Name of the link type which forms the graph edges.
+        dependent_type: Issue type of the issues reported as dependents.
+    """
+
+    def __init__(self, issues, link_type="Blocks", dependent_type="Milestone"):
+        self.keys = list(issues)
+        self.index = {key: n for n, key in enumerate(self.keys)}
+        self.successors = [[] for _ in self.keys]
+        self.is_dependent = [False] * len(self.keys)
+
+        for n, key in enumerate(self.keys):
+            for link in issues[key].fields.issuelinks:
+                if (
+                    link.type.name == link_type
+                    and hasattr(link, "outwardIssue")
+                    and link.outwardIssue.key in self.index
+                ):
+                    target = self.index[link.outwardIssue.key]
+                    self.successors[n].append(target)
+                    if (
+                        link.outwardIssue.fields.issuetype.name
+                        == dependent_type
+                    ):
+                        self.is_dependent[target] = True
+
+        self.components, self.component_of = self._find_components()
+        self._reach = self._component_reach()
+
+    def dependents(self, key):
+        """Return the set of keys of all dependent-type issues which are
+        blocked, directly or indirectly, by key.
+        """
+        reach = self._reach[self.component_of[self.index[key]]]
+        return {self.keys[n] for n in reach}
+
+    def iter_dependents(self, key):
+        """Yield the keys of dependents of key, in the order of the issues
+        the graph was built from.
+        """
+        reach = self._reach[self.component_of[self.index[key]]]
+        for n in sorted(reach):
+            yield self.keys[n]
+
+    def cycles(self):
+        """Return a list of cycles of blocks, each a list of keys.
+
+        Each cycle is a strongly connected component of the graph containing
+        more than one issue, or a single issue which blocks itself.
+        """
+        return [
+            [self.keys[n] for n in sorted(component)]
+            for component in self.components
+            if len(component) > 1
+            or component[0] in self.successors[component[0]]
+        ]
+
+    def _find_components(self):
+        # Iterative Tarjan's algorithm. Components are produced in reverse
+        # topological order: every component appears after all of the
+        # components it blocks.
+        count = len(self.keys)
+        index = [-1] * count
+        lowlink = [0] * count
+        on_stack = [False] * count
+        component_of = [-1] * count
+        stack = []
+        components = []
+        counter = 0
+
+        for root in range(count):
+            if index[root] >= 0:
+                continue
+            work = [(root, 0)]
+            while work:
+                node, edge = work.pop()
+                if edge == 0:
+                    index[node] = lowlink[node] = counter
+                    counter += 1
+                    stack.append(node)
+                    on_stack[node] = True
+                successors = self.successors[node]
+                while edge < len(successors):
+                    target = successors[edge]
+                    edge += 1
+                    if index[target] < 0:
+                        work.append((node, edge))
+                        work.append((target, 0))
+                        break
+                    elif on_stack[target]:
+                        lowlink[node] = min(lowlink[node], index[target])
+                else:
+                    if lowlink[node] == index[node]:
+                        component = []
+                        while True:
+                            member = stack.pop()
+                            on_stack[member] = False
+                            component_of[member] = len(components)
+                            component.append(member)
+                            if member == node:
+                                break
+                        components.append(component)
+                    if work:
+                        parent = work[-1][0]
+                        lowlink[parent] = min(lowlink[parent], lowlink[node])
+        return components, component_of
+
+    def _component_reach(self):
+        # For each component, a frozenset of the positions of the dependents
+        # reachable from it by at least one edge. Components are visited in
+        # reverse topological order, so everything a component blocks has
+        # already been computed. A component which reaches nothing beyond
+        # the set of the one component it blocks shares that set.
+        empty = frozenset()
+        reach = [empty] * len(self.components)
+        for c, component in enumerate(self.components):
+            own = set()
+            inherited = {}
+            for node in component:
+                for target in self.successors[node]:
+                    if self.is_dependent[target]:
+                        own.add(target)
+                    other = reach[self.component_of[target]]
+                    if self.component_of[target] != c and other:
+                        inherited[id(other)] = other
+            # Within a cycle every member reaches every other (and itself).
+            if len(component) > 1:
+                own.update(
+                    node for node in component if self.is_dependent[node]
+                )
+            sets = list(inherited.values())
+            if len(sets) == 1 and own <= sets[0]:
+                reach[c] = sets[0]
+            elif sets or own:
+                reach[c] = frozenset(own.union(*sets))
+        return reach
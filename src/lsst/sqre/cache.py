@@ -0,0 +1,219 @@
+"""
+Module for caching rendered responses in jiraserver.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+DEFAULT_TTL = 300  # Seconds for which a response is served from the cache
+DEFAULT_SIZE = 128  # Maximum number of responses held in the cache
+
+CachedResponse = namedtuple(
+    "CachedResponse", ["body", "mimetype", "etag", "created"]
+)
+
+
+def make_response(body, mimetype, created=None):
+    """Make a `CachedResponse` from a body (str or bytes) and mimetype."""
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    return CachedResponse(
+        body,
+        mimetype,
+        hashlib.sha1(body).hexdigest(),
+        time.time() if created is None else created,
+    )
+
+
+class _Flight:
+    # A computation which is in progress on behalf of one or more requests.
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ResponseCache:
+    """A thread-safe, size-bounded cache of rendered responses which expire
+    after a fixed time.
+
+    Concurrent requests for the same key while it is being computed wait for
+    that computation rather than starting their own.
+
+    Args:
+        ttl: Time in seconds for which an entry is valid. If zero, nothing is
+            cached, but concurrent identical requests are still collapsed.
+        max_entries: Maximum number of entries; the least recently used are
+            evicted first.
+        clock: Function returning the current time in seconds.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL, max_entries=DEFAULT_SIZE, clock=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = time.time if clock is None else clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._flights = {}
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, key):
+        """Return the live entry for key, or None."""
+        with self._lock:
+            return self._get(key)
+
+    def get_or_compute(self, key, compute):
+        """Return the entry for key, calling compute to create it if needed.
+
+        Args:
+            key: Any hashable value identifying the response.
+            compute: Function taking no arguments and returning a
+                `CachedResponse`.
+        """
+        with self._lock:
+            entry = self._get(key)
+            if entry is not None:
+                return entry
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = compute()
+        except BaseException as error:
+            flight.error = error
+            raise
+        finally:
+            with self._lock:
+                if flight.error is None:
+                    self._put(key, flight.result)
+                del self._flights[key]
+            flight.done.set()
+        return flight.result
+
+    def get_or_stream(self, key, produce, mimetype):
+        """Return the entry for key, or an iterator which streams it.
+
+        If the entry is not available, the returned iterator yields the
+        chunks (str) from produce() as they are made, and stores the
+        complete response in the cache once the last one has been sent.
+        Concurrent streams for the same key wait for it to be stored; if
+        the first stream is abandoned or fails, they produce their own.
+
+        Args:
+            key: Any hashable value identifying the response.
+            produce: Function taking no arguments and returning an iterable
+                of str.
+            mimetype: Mimetype of the response.
+
+        Returns:
+            A `CachedResponse`, or an iterator of str.
+        """
+        entry = self.get(key)
+        if entry is not None:
+            return entry
+        return self._stream(key, produce, mimetype)
+
+    def _stream(self, key, produce, mimetype):
+        # The flight is only joined once iteration starts, so an iterator
+        # which is never consumed cannot hold up other requests.
+        with self._lock:
+            entry = self._get(key)
+            flight = self._flights.get(key)
+            leader = entry is None and flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if entry is None and not leader:
+            flight.done.wait()
+            entry = flight.result
+        if entry is not None:
+            yield entry.body.decode("utf-8")
+            return
+        if not leader:
+            yield from produce()
+            return
+
+        chunks = []
+        try:
+            for chunk in produce():
+                chunks.append(chunk)
+                yield chunk
+            flight.result = make_response("".join(chunks), mimetype)
+        finally:
+            with self._lock:
+                if flight.result is not None:
+                    self._put(key, flight.result)
+                del self._flights[key]
+            flight.done.set()
+
+    def refresh(self, key, compute):
+        """Call compute to make a new entry for key, and replace any entry
+        already held with it.
+
+        Unlike `get_or_compute`, the existing entry (if any) is ignored, but
+        it continues to be served to other requests until the new one is
+        ready, so they never miss the cache.
+
+        Args:
+            key: Any hashable value identifying the response.
+            compute: Function taking no arguments and returning a
+                `CachedResponse`.
+        """
+        entry = compute()
+        with self._lock:
+            self._put(key, entry)
+        return entry
+
+    def items(self):
+        """Return a list of the keys and live entries in the cache, least
+        recently used first.
+        """
+        now = self.clock()
+        with self._lock:
+            return [
+                (key, entry)
+                for key, entry in self._entries.items()
+                if now - entry.created < self.ttl
+            ]
+
+    def discard(self, key):
+        """Remove the entry for key, if there is one."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _get(self, key):
+        # Must be called with the lock held.
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if self.clock() - entry.created >= self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _put(self, key, entry):
+        # Must be called with the lock held.
+        if self.ttl <= 0 or self.max_entries <= 0:
+            return
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
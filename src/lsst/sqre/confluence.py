@@ -1,6 +1,17 @@
 """
 Module for Confluence text processing.
+
+A `PageBuilder` assembles a page from keyed sections, each made from some
+JIRA issues. With a `SectionCache`, a section whose issues have not been
+updated since the page was last built is copied from the cache rather than
+made again.
 """
+
+import hashlib
+import json
+import os
+from tempfile import mkstemp
+
 try:
     # Python 3
     from itertools import zip_longest
@@ -62,3 +73,130 @@ def table(headings, *columns, **kwargs):
             table.append(" ".join(row))
 
     return os.linesep.join(table)
+
+
+def section_digest(issues, *args):
+    """Return a digest of the keys and ``updated`` stamps of issues, and of
+    args, or None if any of the issues has no ``updated`` stamp.
+    """
+    sha = hashlib.sha1(repr(args).encode("utf-8"))
+    for issue in issues:
+        updated = getattr(issue.fields, "updated", None)
+        if not updated:
+            return None
+        sha.update(f"{issue.key}@{updated}\n".encode("utf-8"))
+    return sha.hexdigest()
+
+
+class SectionCache:
+    """The sections of a page as last built, stored as JSON in a file.
+
+    Args:
+        path: Path of the file; it need not exist yet.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(path) as f:
+                self._sections = json.load(f)
+        except (OSError, ValueError):
+            self._sections = {}
+        self._used = {}
+
+    def get(self, key, digest):
+        """Return the lines of section key if they were made from issues
+        with the given digest, or None.
+        """
+        entry = self._sections.get(key)
+        if digest is None or entry is None or entry["digest"] != digest:
+            return None
+        self._used[key] = entry
+        return entry["lines"]
+
+    def put(self, key, digest, lines):
+        """Store the lines of section key, made from issues with digest."""
+        if digest is not None:
+            self._used[key] = {"digest": digest, "lines": list(lines)}
+
+    def save(self):
+        """Write the sections used since the cache was loaded to the file,
+        dropping the rest.
+
+        The file is written in full before it replaces the old one, so that
+        an interrupted build does not leave a partial cache.
+        """
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp = mkstemp(dir=directory, suffix=".json")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(self._used, f)
+            os.replace(temp, self.path)
+        except BaseException:
+            os.unlink(temp)
+            raise
+
+
+class PageBuilder:
+    """A Confluence page made of blocks of lines.
+
+    Fixed blocks are added with `add`. Sections made from JIRA issues are
+    added with `section`, and are only made (or fetched from the cache) as
+    the page is written, so the start of the page is written while the rest
+    is still being made.
+
+    Args:
+        cache: A `SectionCache`, or None to make every section afresh.
+    """
+
+    def __init__(self, cache=None):
+        self.cache = cache
+        self.made = []  # Keys of the sections which were not cached
+        self._blocks = []
+
+    def add(self, *lines):
+        """Add lines to the page."""
+        self._blocks.append((None, None, list(lines)))
+
+    def section(self, key, issues, make, salt=None):
+        """Add a section to the page.
+
+        Args:
+            key: A key identifying the section; unique within the page.
+            issues: The issues from which the section is made.
+            make: Function taking no arguments which makes the section,
+                returning a list of lines. It is not called if the section
+                is cached and none of issues has been updated since.
+            salt: Any other value, with a stable repr, on which the section
+                depends (e.g. command line options).
+        """
+        digest = section_digest(issues, key, salt)
+        self._blocks.append((key, digest, make))
+
+    def iter_lines(self):
+        """Yield the lines of the page, making each section as it is
+        reached.
+        """
+        for key, digest, block in self._blocks:
+            if key is None:
+                yield from block
+                continue
+            lines = None
+            if self.cache is not None:
+                lines = self.cache.get(key, digest)
+            if lines is None:
+                lines = block()
+                self.made.append(key)
+                if self.cache is not None:
+                    self.cache.put(key, digest, lines)
+            yield from lines
+
+    def write(self, out):
+        """Write the page to the file object out, a line at a time, then
+        save the cache (if any).
+        """
+        for line in self.iter_lines():
+            out.write(line)
+            out.write("\n")
+        if self.cache is not None:
+            self.cache.save()
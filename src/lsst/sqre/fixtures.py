@@ -0,0 +1,121 @@
+"""
+Module for recording the responses of a JIRA server to fixture files.
+
+`RecordingAdapter` is a `requests` transport which saves the JSON body of
+every successful REST response it carries to a directory, one file per
+distinct request. `lsst.sqre.jirastub` serves the recorded responses again,
+so that anything which talks to JIRA can be run offline, repeatably.
+
+Set the ``JIRAKIT_RECORD`` environment variable to a directory to record
+every request made through `lsst.sqre.jirakit`.
+"""
+
+import hashlib
+import json
+import os
+from tempfile import mkstemp
+from urllib.parse import parse_qsl, urlsplit
+
+from requests.adapters import HTTPAdapter
+
+RECORD_ENV = "JIRAKIT_RECORD"
+
+# The part of a request path from which fixtures are keyed, so that
+# responses recorded from one server can be served from another URL.
+REST_PREFIX = "/rest/"
+
+
+def fixture_key(method, path, params):
+    """Return the name of the fixture file for a request.
+
+    Args:
+        method: HTTP method, e.g. "GET".
+        path: Path of the request URL.
+        params: Iterable of (name, value) query parameters.
+    """
+    if REST_PREFIX in path:
+        start = path.index(REST_PREFIX)
+        path = path[start:]
+    request = [method.upper(), path, sorted(params)]
+    digest = hashlib.sha1(json.dumps(request).encode("utf-8")).hexdigest()
+    return f"{digest}{os.path.extsep}json"
+
+
+def load_fixtures(directory):
+    """Return a dict mapping fixture_key to the recorded response for every
+    fixture in directory. Each response is a dict with the request
+    ``method``, ``path`` and ``params``, and the response ``status`` and
+    ``body``.
+    """
+    fixtures = {}
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(f"{os.path.extsep}json"):
+            with open(os.path.join(directory, name)) as f:
+                fixtures[name] = json.load(f)
+    return fixtures
+
+
+def fixture_issues(fixtures):
+    """Return a list of the raw JSON of every distinct issue in the search
+    and issue responses in fixtures. Where an issue was recorded more than
+    once, the fields of each recording are merged.
+    """
+    issues = {}
+    for fixture in fixtures.values():
+        body = fixture["body"]
+        if not isinstance(body, dict):
+            continue
+        raws = body.get("issues", [body] if "key" in body else [])
+        for raw in raws:
+            if "key" not in raw:
+                continue
+            issue = issues.setdefault(raw["key"], {"fields": {}})
+            issue.update({k: v for k, v in raw.items() if k != "fields"})
+            issue["fields"].update(raw.get("fields", {}))
+    return list(issues.values())
+
+
+class RecordingAdapter(HTTPAdapter):
+    """A `requests` transport which saves successful JSON responses to
+    directory.
+
+    Args:
+        directory: Directory for the fixture files; created if necessary.
+        **kwargs: Passed to `requests.adapters.HTTPAdapter`.
+    """
+
+    def __init__(self, directory, **kwargs):
+        super().__init__(**kwargs)
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+
+    def send(self, request, **kwargs):
+        response = super().send(request, **kwargs)
+        if response.ok and "json" in response.headers.get("Content-Type", ""):
+            url = urlsplit(request.url)
+            params = parse_qsl(url.query, keep_blank_values=True)
+            fixture = {
+                "method": request.method,
+                "path": url.path,
+                "params": params,
+                "status": response.status_code,
+                "body": response.json(),
+            }
+            path = os.path.join(
+                self.directory, fixture_key(request.method, url.path, params)
+            )
+            # Written to a temporary file first, so that concurrent requests
+            # never leave a partial fixture.
+            fd, temp = mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(fixture, f, indent=1, sort_keys=True)
+            os.replace(temp, path)
+        return response
+
+
+def record_to(session, directory, **kwargs):
+    """Mount a `RecordingAdapter` saving to directory on session."""
+    adapter = RecordingAdapter(directory, **kwargs)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return adapter
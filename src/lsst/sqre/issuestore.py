@@ -0,0 +1,233 @@
+"""
+Module for a persistent local store of JIRA issues.
+
+The store keeps the raw JSON of every issue it has seen in an SQLite
+database, along with the time at which each query was last synchronized.
+After the first full load of a query, later synchronizations only fetch the
+issues which have been updated since.
+"""
+
+import json
+import math
+import re
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+
+from .records import IssueRecord
+
+# Incremental queries ask for the issues updated within a number of minutes
+# of the present, which JIRA resolves only to the nearest minute and by its
+# own clock. Re-fetching issues updated during this period before the last
+# synchronization guards against both.
+DEFAULT_OVERLAP = timedelta(minutes=5)
+
+# Maximum number of keys to request in a single "issuekey in" query.
+MISSING_CHUNK_SIZE = 200
+
+# Matches the (optional) ORDER BY clause at the end of a JQL query.
+ORDER_BY = re.compile(r"\s*\bORDER\s+BY\b.*$", re.IGNORECASE | re.DOTALL)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS issues (
+    server TEXT NOT NULL,
+    key TEXT NOT NULL,
+    updated TEXT,
+    raw TEXT NOT NULL,
+    PRIMARY KEY (server, key)
+);
+CREATE TABLE IF NOT EXISTS queries (
+    server TEXT NOT NULL,
+    query TEXT NOT NULL,
+    last_sync TEXT NOT NULL,
+    PRIMARY KEY (server, query)
+);
+"""
+
+
+def split_order_by(query):
+    """Split a JQL query into its filter and ORDER BY clause."""
+    match = ORDER_BY.search(query)
+    if match is None:
+        return query.strip(), ""
+    return query[: match.start()].strip(), match.group(0).strip()
+
+
+def updated_since_query(query, since):
+    """Restrict a JQL query to issues updated at or after since (an aware
+    `datetime.datetime`).
+
+    The restriction is written as a number of minutes before the present,
+    which, unlike a date, JIRA does not interpret in the timezone of the
+    user making the request.
+    """
+    jql, order_by = split_order_by(query)
+    elapsed = datetime.now(timezone.utc) - since
+    minutes = max(math.ceil(elapsed.total_seconds() / 60), 0)
+    restricted = '({}) AND updated >= "-{}m"'.format(jql, minutes)
+    return f"{restricted} {order_by}".strip()
+
+
+def _project(raw, fields):
+    # Return a copy of raw with only the given fields.
+    projected = dict(raw)
+    projected["fields"] = {
+        name: value
+        for name, value in raw.get("fields", {}).items()
+        if name in fields
+    }
+    return projected
+
+
+class IssueStore:
+    """A persistent store of JIRA issues, keyed by server and issue key.
+
+    Args:
+        path: Path to the SQLite database file (created if necessary), or
+            ":memory:" for a store which lasts only as long as the process.
+        overlap: A `datetime.timedelta` by which to extend each incremental
+            synchronization back in time.
+    """
+
+    def __init__(self, path, overlap=DEFAULT_OVERLAP):
+        self.path = path
+        self.overlap = overlap
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def sync(self, jira, query, max_results=None, fields=None):
+        """Bring the store up to date for query and return its results.
+
+        The first synchronization of a query fetches every matching issue.
+        Subsequent synchronizations fetch only the keys of the matching
+        issues (to find their order, and any that have left the result
+        set) plus the full content of issues updated since the last
+        synchronization.
+
+        Args:
+            jira: A `jira.JIRA` client.
+            query: JQL query string.
+            max_results: Maximum number of issues to return, or None for all.
+            fields: If given, compact `lsst.sqre.records.IssueRecord` objects
+                with only these fields are returned. The store itself always
+                holds complete issues.
+
+        Returns:
+            A list of `jira.resources.Issue` objects, in the order given by
+            the query.
+        """
+        server = jira._options["server"]
+        started = datetime.now(timezone.utc)
+        last_sync = self._last_sync(server, query)
+
+        if last_sync is None:
+            fetched = jira.search_issues(query, maxResults=False)
+            keys = [issue.key for issue in fetched]
+        else:
+            keys = [
+                issue.key
+                for issue in jira.search_issues(
+                    query, maxResults=False, fields="key"
+                )
+            ]
+            fetched = list(
+                jira.search_issues(
+                    updated_since_query(query, last_sync - self.overlap),
+                    maxResults=False,
+                )
+            )
+            # Issues which have joined the result set without having been
+            # updated (e.g. because the query changed) must be fetched too.
+            known = self._known_keys(server, keys)
+            fetched_keys = {issue.key for issue in fetched}
+            missing = [
+                key
+                for key in keys
+                if key not in known and key not in fetched_keys
+            ]
+            for start in range(0, len(missing), MISSING_CHUNK_SIZE):
+                end = start + MISSING_CHUNK_SIZE
+                fetched.extend(
+                    jira.search_issues(
+                        "issuekey in ({})".format(
+                            ", ".join(missing[start:end])
+                        ),
+                        maxResults=False,
+                    )
+                )
+
+        self._save(server, query, fetched, started)
+
+        if max_results:
+            keys = keys[:max_results]
+        if fields is not None:
+            return [
+                IssueRecord.from_raw(_project(raw, fields), server)
+                for raw in self._load(server, keys)
+            ]
+        from jira.resources import Issue
+
+        return [
+            Issue(jira._options, jira._session, raw=raw)
+            for raw in self._load(server, keys)
+        ]
+
+    def _last_sync(self, server, query):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT last_sync FROM queries WHERE server = ? AND query = ?",
+                (server, query),
+            ).fetchone()
+        return None if row is None else datetime.fromisoformat(row[0])
+
+    def _known_keys(self, server, keys):
+        return set(self._select(server, keys))
+
+    def _save(self, server, query, issues, started):
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO issues VALUES (?, ?, ?, ?)",
+                [
+                    (
+                        server,
+                        issue.key,
+                        issue.raw.get("fields", {}).get("updated"),
+                        json.dumps(issue.raw),
+                    )
+                    for issue in issues
+                ],
+            )
+            self._db.execute(
+                "INSERT OR REPLACE INTO queries VALUES (?, ?, ?)",
+                (server, query, started.isoformat()),
+            )
+
+    def _load(self, server, keys):
+        rows = self._select(server, keys)
+        return [json.loads(rows[key]) for key in keys if key in rows]
+
+    def _select(self, server, keys, chunk_size=500):
+        # Return a dict mapping each of keys which is in the store to its
+        # raw JSON. Keys are looked up in chunks to stay within SQLite's
+        # limit on the number of query parameters.
+        keys = list(keys)
+        rows = {}
+        with self._lock:
+            for start in range(0, len(keys), chunk_size):
+                end = start + chunk_size
+                chunk = keys[start:end]
+                rows.update(
+                    self._db.execute(
+                        "SELECT key, raw FROM issues "
+                        "WHERE server = ? AND key IN ({})".format(
+                            ", ".join("?" * len(chunk))
+                        ),
+                        [server] + chunk,
+                    ).fetchall()
+                )
+        return rows
@@ -2,6 +2,8 @@
 Module for Confluence helper functions.
 """
 
+from .confluence import table
+
 
 def check_description(descr):
     """Check a JIRA description field."""
@@ -25,3 +27,14 @@ def create_list_from_numbered_description(desrc, bulletType="*"):
         numbered = bulletType * lenlist
         olist.append("{} {}".format(numbered, " ".join(values[1:])))
     return olist
+
+
+def issue_table(nodes):
+    """Make a Confluence table of the key, summary and status of the issues
+    in a list of `lsst.sqre.jirakit.EpicNode`.
+    """
+    headers = ["Key", "Description", "Status"]
+    keys = [node.issue.key for node in nodes]
+    summaries = [node.issue.fields.summary for node in nodes]
+    status_names = [node.issue.fields.status.name for node in nodes]
+    return table(headers, keys, summaries, status_names)
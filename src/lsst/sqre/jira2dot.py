@@ -1,6 +1,5 @@
 import logging
 import textwrap
-from io import StringIO
 
 
 def attr_func(issue):
@@ -39,6 +38,36 @@ def jira2dot(
     """Generate a GraphViz dot file displaying the relationships between
     JIRA issues.
 
+    Arguments are as for iter_jira2dot; the complete graph is returned as a
+    single string.
+    """
+    return "".join(
+        iter_jira2dot(
+            issues,
+            link_types=link_types,
+            attr_func=attr_func,
+            rank_func=rank_func,
+            ranks=ranks,
+            diag_name=diag_name,
+        )
+    )
+
+
+def iter_jira2dot(
+    issues,
+    link_types=("Blocks",),
+    attr_func=None,
+    rank_func=None,
+    ranks=None,
+    diag_name="Diagram",
+):
+    """Generate a GraphViz dot file displaying the relationships between
+    JIRA issues, yielding it piece by piece as the issues are processed.
+
+    Each node is written as soon as its issue arrives. Each edge is written
+    as soon as both of its ends have been written, so only the keys of the
+    issues (and not the issues themselves) are retained.
+
     Arguments:
       issues ---------------- Iterable of issues to process
       link_types ------------ Sequence of link types to include in the graph
@@ -53,20 +82,21 @@ def jira2dot(
                               rank_func returns a result other than None)
       diag_name ------------- Name for the top-level graph node.
     """
-    output = StringIO()
-    output.write(f'digraph "{diag_name}" {{\n')
-    output.write('  node [fontname="monospace", shape="box"]')
-    by_key = {}
+    yield f'digraph "{diag_name}" {{\n'
+    yield '  node [fontname="monospace", shape="box"]'
+    seen = set()
     by_rank = {}
+    # Edges whose source has been written, indexed by the key of the target.
+    pending = {}
 
     for issue in issues:
-        by_key[issue.key] = issue
+        seen.add(issue.key)
 
         # Populate a dict indexed by caller-defined rank.
         if rank_func is not None:
             rank = rank_func(issue)
             if rank:
-                by_rank.setdefault(str(rank), []).append(issue)
+                by_rank.setdefault(str(rank), []).append(issue.key)
                 logging.debug(f"Set rank {rank} for issue {issue.key}")
 
         # Get any custom attributes from the caller.
@@ -112,40 +142,38 @@ def jira2dot(
 
         # Write the node's attributes.
         attr.append(f'URL="{issue.permalink()}"')
-        output.write('  "{}" [{}]\n'.format(issue.key, ", ".join(attr)))
+        yield '  "{}" [{}]\n'.format(issue.key, ", ".join(attr))
 
-    # Setup ranks (caller-defined, but probably indicate a release or cycle)
-    if ranks:
-        output.write('  node [fontname="monospace", shape=none]\n')
-        output.write("  {}\n".format(" -> ".join(f'"{r}"' for r in ranks)))
-        for rank in ranks:
-            items = [rank] + [i.key for i in by_rank.get(str(rank), [])]
-            output.write(
-                "  {{ rank=same; {} }}\n".format(
-                    "; ".join(f'"{item}"' for item in items)
-                )
-            )
-
-    # Declare issue links
-    for issue in by_key.values():
+        # Declare issue links, deferring those whose target is yet to come.
         for link in issue.fields.issuelinks:
             if link.type.name in link_types:
                 if hasattr(link, "outwardIssue"):
-                    if link.outwardIssue.key in by_key:
-                        output.write(
-                            f'  "{issue.key}" -> "{link.outwardIssue.key}"\n'
-                        )
+                    if link.outwardIssue.key in seen:
+                        yield f'  "{issue.key}" -> "{link.outwardIssue.key}"\n'
                     else:
-                        logging.debug(
-                            "Skipping external link {.key} -> {.key}".format(
-                                issue, link.outwardIssue
-                            )
+                        pending.setdefault(link.outwardIssue.key, []).append(
+                            issue.key
                         )
                 else:
                     logging.debug(
                         f"Skipping inward link \
                             {link.inwardIssue.key} -> {issue.key}"
                     )
+        for source in pending.pop(issue.key, ()):
+            yield f'  "{source}" -> "{issue.key}"\n'
+
+    for target, sources in pending.items():
+        for source in sources:
+            logging.debug(f"Skipping external link {source} -> {target}")
+
+    # Setup ranks (caller-defined, but probably indicate a release or cycle)
+    if ranks:
+        yield '  node [fontname="monospace", shape=none]\n'
+        yield "  {}\n".format(" -> ".join(f'"{r}"' for r in ranks))
+        for rank in ranks:
+            items = [rank] + by_rank.get(str(rank), [])
+            yield "  {{ rank=same; {} }}\n".format(
+                "; ".join(f'"{item}"' for item in items)
+            )
 
-    output.write("}\n")
-    return output.getvalue()
+    yield "}\n"
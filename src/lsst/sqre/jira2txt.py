@@ -1,7 +1,4 @@
-import io
 import sys
-from collections import OrderedDict
-from csv import DictWriter
 
 try:
     # Python 3
@@ -10,22 +7,49 @@ except ImportError:
     # Python 2
     from urlparse import urljoin
 
-from tabulate import tabulate
-
-from lsst.sqre.jirakit import cycles, dm_to_dlp_cycle, get_issues_by_key
+from .jirakit import (
+    CALENDAR,
+    dm_to_dlp_cycle,
+    get_issues_by_key_groups,
+    key_order,
+)
+from .pivot import Pivot
+from .records import RECORD_FIELDS
 
 
 def jira2txt(
-    issues, csv=False, show_key=True, show_title=False, url_base=None
+    issues,
+    csv=False,
+    show_key=True,
+    show_title=False,
+    url_base=None,
+    calendar=CALENDAR,
+    group_wbs=False,
+):
+    return pivot_issues(
+        issues, csv, show_key, show_title, url_base, calendar, group_wbs
+    ).to_text(csv)
+
+
+def pivot_issues(
+    issues,
+    csv=False,
+    show_key=True,
+    show_title=False,
+    url_base=None,
+    calendar=CALENDAR,
+    group_wbs=False,
 ):
-    def makeRow(wbs, cycles, blank=None):
-        row = OrderedDict()
-        row["WBS"] = wbs
-        for cycle in cycles():
-            row[cycle] = blank
-        return row
-
-    table = []
+    # Return a Pivot with a row for each issue, or if group_wbs is set for
+    # each WBS element, and a column for each cycle. The issues in the same
+    # WBS element and cycle share a cell, one per line; they are not
+    # hyperlinked.
+    pivot = Pivot(
+        ("WBS",),
+        calendar,
+        fill="" if csv else "-",
+        separator="\n" if group_wbs else None,
+    )
     for issue in issues:
         if not issue.fields.fixVersions:
             print("No release assigned to", issue.key, file=sys.stderr)
@@ -40,47 +64,45 @@ def jira2txt(
         else:
             WBS = "None"
 
-        row = makeRow(WBS, cycles, "" if csv else "-")
+        row = pivot.row(WBS, key=WBS if group_wbs else None)
 
         if show_title and show_key:
-            row[cyc] = issue.key + ": " + issue.fields.summary
+            text = issue.key + ": " + issue.fields.summary
         elif show_title:
-            row[cyc] = issue.fields.summary
+            text = issue.fields.summary
         elif show_key:
-            row[cyc] = issue.key
+            text = issue.key
+        else:
+            text = pivot.fill
 
         # In CSV mode we can include a URL to the actual issue
-        if csv and url_base:
-            row[cyc] = _make_csv_hyperlink_from_issue(
-                url_base, issue, row[cyc]
-            )
+        if csv and url_base and not group_wbs:
+            text = _make_csv_hyperlink_from_issue(url_base, issue, text)
 
-        table.append(row)
+        pivot.add(row, cyc, text)
 
-    return _table2text(table, csv)
+    return pivot
 
 
-def jirakpm2txt(issues, server, csv=False, url_base=None):
+def jirakpm2txt(issues, server, csv=False, url_base=None, calendar=CALENDAR):
+    return pivot_kpms(issues, server, csv, url_base, calendar).to_text(csv)
+
+
+def pivot_kpms(issues, server, csv=False, url_base=None, calendar=CALENDAR):
+    # Return a Pivot with a row for each Key Metric and a column for each
+    # cycle, holding the values of the metric in the related DM issues.
+    #
     # JIRA fields lookup for DM/DLP project:
     #  customfield_10900: cycle
     #  customfield_11000: metric
     #  customfield_11001: units
-    def make_row(kpm, blank=None):
-        row = OrderedDict()
-        row["KPM"] = kpm.key
-        row["Title"] = kpm.fields.summary
-        row[
-            "Target"
-        ] = f"{kpm.fields.customfield_11000} {kpm.fields.customfield_11001}"
-        for cycle in cycles():
-            row[cycle] = blank
-        return row
-
-    # For each KPM we need to request the` "Relates to" issues.
-    table = []
+
+    # First pass: collect the "Relates to" issues of every KPM, so that they
+    # can all be requested from JIRA in a few bulk queries rather than one
+    # query per KPM.
+    kpms = []
     for i in issues:
         relates = []
-        metric_unit = str(i.fields.customfield_11001)
 
         duplicates = False
         for link in i.fields.issuelinks:
@@ -98,41 +120,69 @@ def jirakpm2txt(issues, server, csv=False, url_base=None):
         if duplicates:
             continue
 
-        row = make_row(i)
+        kpms.append((i, relates))
 
+    related_by_key = _get_related_issues(
+        server, [relates for _, relates in kpms]
+    )
+
+    # Second pass: build the table from the issues fetched above.
+    pivot = Pivot(("KPM", "Title", "Target"), calendar)
+    for i, relates in kpms:
+        metric_unit = str(i.fields.customfield_11001)
+
+        kpm = i.key
         # Insert URL to DLP ticket if required
         if csv and url_base:
-            row["KPM"] = _make_csv_hyperlink_from_issue(
-                url_base, i, row["KPM"]
-            )
-
-        if len(relates):
-            related_issues = get_issues_by_key(server, relates)
-            for dm in related_issues:
-                if not hasattr(dm.fields, "customfield_10900"):
-                    print(f"Cycle missing from {dm} via {i}", file=sys.stderr)
-                    break
-                cyc = dm.fields.customfield_10900
-                if cyc is None:
-                    print(f"Cycle missing from {dm} via {i}", file=sys.stderr)
-                    break
-                cyc = dm_to_dlp_cycle(cyc)
-                row[cyc] = dm.fields.customfield_11000
-                if str(dm.fields.customfield_11001) != metric_unit:
-                    print(
-                        f"{i}: Unit mismatch between DLP KPM and {dm} \
-                            ({metric_unit} != {dm.fields.customfield_11001})",
-                        file=sys.stderr,
-                    )
-                # In CSV mode we can include a URL to the actual issue
-                if csv and url_base:
-                    row[cyc] = _make_csv_hyperlink_from_issue(
-                        url_base, dm, row[cyc]
-                    )
-
-        table.append(row)
-
-    return _table2text(table, csv)
+            kpm = _make_csv_hyperlink_from_issue(url_base, i, kpm)
+        row = pivot.row(
+            kpm,
+            i.fields.summary,
+            f"{i.fields.customfield_11000} {i.fields.customfield_11001}",
+        )
+
+        # Visit the related issues in descending key order, as JIRA returns
+        # them for a query for this KPM alone, however they were chunked.
+        related_issues = sorted(
+            (
+                related_by_key[key]
+                for key in set(relates)
+                if key in related_by_key
+            ),
+            key=lambda dm: key_order(dm.key),
+            reverse=True,
+        )
+        for dm in related_issues:
+            if not hasattr(dm.fields, "customfield_10900"):
+                print(f"Cycle missing from {dm} via {i}", file=sys.stderr)
+                break
+            cyc = dm.fields.customfield_10900
+            if cyc is None:
+                print(f"Cycle missing from {dm} via {i}", file=sys.stderr)
+                break
+            cyc = dm_to_dlp_cycle(cyc)
+            value = dm.fields.customfield_11000
+            if str(dm.fields.customfield_11001) != metric_unit:
+                print(
+                    f"{i}: Unit mismatch between DLP KPM and {dm} \
+                        ({metric_unit} != {dm.fields.customfield_11001})",
+                    file=sys.stderr,
+                )
+            # In CSV mode we can include a URL to the actual issue
+            if csv and url_base:
+                value = _make_csv_hyperlink_from_issue(url_base, dm, value)
+            pivot.set(row, cyc, value)
+
+    return pivot
+
+
+def _get_related_issues(server, key_groups):
+    # Fetch the issues named in key_groups (a sequence of lists of keys) in
+    # as few queries as possible. Returns a dict mapping key to issue.
+    related = get_issues_by_key_groups(
+        server, key_groups, fields=RECORD_FIELDS
+    )
+    return {issue.key: issue for issue in related}
 
 
 def _make_csv_hyperlink_from_issue(url_base, issue, text):
@@ -140,20 +190,3 @@ def _make_csv_hyperlink_from_issue(url_base, issue, text):
     # Base URL is the JIRA server
     fragment = "browse/" + issue.key
     return f'=HYPERLINK("{urljoin(url_base, fragment)}","{text}")'
-
-
-def _table2text(table, csv=False):
-    # Converts a dict of rows to either plain text table or CSV
-    if csv:
-        # In Python 2, DictWriter wants to write to a buffer of bytes. In
-        # Python 3, it wants to write to a buffer of unicode.
-        if sys.version_info[0] == 2:
-            buf = io.BytesIO()
-        else:
-            buf = io.StringIO()
-        writer = DictWriter(buf, fieldnames=table[0].keys())
-        writer.writeheader()
-        writer.writerows(table)
-        return buf.getvalue()
-    else:
-        return tabulate(table, headers="keys", tablefmt="pipe")
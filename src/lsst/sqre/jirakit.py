@@ -1,44 +1,166 @@
 """
 Module for helper apps relating to the LSST-DM reporting cycle and LSST-SIMS
 work planning.
+
+The jira and requests packages account for most of the time taken to import
+this module, so they are only imported when a JIRA client is first needed.
 """
 
 
+import importlib
+import os
 import re
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from io import StringIO
 
-from jira import JIRA
+from .blockgraph import BlocksGraph
+from .metrics import active, bind
+from .records import RECORD_FIELDS, IssueRecord
+
+# Names imported from other packages when first used, with the modules which
+# provide them.
+LAZY_IMPORTS = {
+    "JIRA": "jira",
+    "JIRAError": "jira",
+    "Issue": "jira.resources",
+    "RequestException": "requests",
+    "HTTPAdapter": "requests.adapters",
+}
 
-SERVER = "https://jira.lsstcorp.org/"
+SERVER = os.environ.get("JIRAKIT_SERVER", "https://jira.lsstcorp.org/")
 MAX_RESULTS = None  # Fetch all results
+KEY_CHUNK_SIZE = 200  # Maximum number of keys in an "issuekey in" query
+WBS_CHUNK_SIZE = 20  # Maximum number of WBS prefixes in a combined query
+MAX_WORKERS = 4  # Maximum number of concurrent queries to JIRA
+PAGE_SIZE = 100  # Number of issues to request per page of search results
+# Connections kept open to each JIRA server.
+POOL_SIZE = int(os.environ.get("JIRAKIT_POOL_SIZE", 10))
+PAGE_RETRIES = 2  # Number of times to retry fetching a page of results
+RETRY_DELAY = 1  # Seconds to wait before the first retry
+
+RFC_QUERY = "project=RFC AND status = Adopted ORDER BY key ASC"
+RFC_MAX_RESULTS = 20000
+TRIGGER_LINK = "Gantt: start-finish"  # Links RFCs to the work they trigger
+
+
+# The DLP cycles, in order, as they were defined in JIRA at the time of
+# writing. Use get_calendar to read the current list from JIRA.
+CYCLES = (
+    "S14",
+    "W15",
+    "S15",
+    "W16",
+    "X16",
+    "F16",
+    "S17",
+    "F17",
+    "S18",
+    "F18",
+    "S19",
+    "F19",
+    "S20",
+    "F20",
+    "S21",
+    "F21",
+    "W21",  # At time of writing, W21 is defined in JIRA.
+    "S22",
+    "F22",
+    "W22",
+)
+
+# Names of DLP fixVersions which represent cycles (e.g. S17, W21).
+DLP_CYCLE = re.compile(r"^[SWXF]\d\d$")
+
+# Names of cycles in the DM project (e.g. "Winter 2016"); see
+# dm_to_dlp_cycle.
+DM_CYCLE = re.compile(r"\w?([SWxF])\w+\s\d*(\d\d)$")
+
+
+class CycleCalendar:
+    """An ordered sequence of cycle names, each mapped to an integer rank.
+
+    Iterating over a calendar yields the cycle names in order, so it may be
+    used wherever the tuple returned by cycles() is accepted.
+    """
+
+    def __init__(self, names):
+        self.names = tuple(names)
+        self.ranks = {name: rank for rank, name in enumerate(self.names)}
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.ranks
+
+    def __getitem__(self, index):
+        return self.names[index]
+
+    def rank(self, name):
+        """Return the position of cycle name in the calendar."""
+        try:
+            return self.ranks[name]
+        except KeyError:
+            raise ValueError(f"{name} is not a known cycle")
+
+    def compare(self, a, b):
+        """Return negative, zero or positive as cycle a is before, the same
+        as, or after cycle b.
+        """
+        return self.rank(a) - self.rank(b)
+
+    @classmethod
+    def from_versions(cls, versions):
+        """Make a calendar from a sequence of JIRA project versions, in the
+        order JIRA holds them, ignoring those which are not cycles.
+        """
+        return cls(
+            version.name
+            for version in versions
+            if DLP_CYCLE.match(version.name)
+        )
+
+
+CALENDAR = CycleCalendar(CYCLES)
+
+
+@lru_cache(maxsize=None)
+def get_calendar(server, project="DLP"):
+    # Return a CycleCalendar of the cycles defined as fixVersions of project.
+    # The versions are only fetched from JIRA on the first call for each
+    # server and project.
+    jira = get_client(server)
+    return CycleCalendar.from_versions(jira.project_versions(project))
 
 
 def cycles():
-    return (
-        "S14",
-        "W15",
-        "S15",
-        "W16",
-        "X16",
-        "F16",
-        "S17",
-        "F17",
-        "S18",
-        "F18",
-        "S19",
-        "F19",
-        "S20",
-        "F20",
-        "S21",
-        "F21",
-        "W21",  # At time of writing, W21 is defined in JIRA.
-        "S22",
-        "F22",
-        "W22",
-    )
+    return CYCLES
 
 
 def build_query(issue_types, wbs):
+    # wbs may be a single WBS prefix (e.g. "02C.04*"), a list of them, or
+    # None for all issues of the given types.
+    if wbs is not None and not isinstance(wbs, str):
+        wbs = list(wbs)
+        if len(wbs) == 1:
+            wbs = wbs[0]
+        else:
+            return (
+                "project = DLP AND issuetype in ({}) AND ({}) "
+                "ORDER BY wbs ASC, fixVersion DESC".format(
+                    ", ".join(issue_types),
+                    " OR ".join(f'wbs ~ "{prefix}"' for prefix in wbs),
+                )
+            )
     if wbs is None:
         return (
             "project = DLP AND issuetype in (%s) "
@@ -53,6 +175,14 @@ def build_query(issue_types, wbs):
         )
 
 
+def key_order(key):
+    """Return a sort key for the issue key, ordering issues as JIRA does for
+    ``ORDER BY key`` (e.g. DM-9 before DM-10).
+    """
+    project, _, number = key.rpartition("-")
+    return (project, int(number)) if number.isdigit() else (key, 0)
+
+
 def basic_auth_from_file(auth_file_path=None):
     """Get basic auth from a two line file."""
     if auth_file_path is None:
@@ -76,32 +206,578 @@ def get_issue_links(issue, linkTypeName=None):
         return [link for link in links if link.type.name in linkTypeName]
 
 
-def get_issues(server, query, max_results=MAX_RESULTS):
-    return JIRA(dict(server=server)).search_issues(
-        query, maxResults=max_results
+def __getattr__(name):
+    # Import the names in LAZY_IMPORTS when they are first used.
+    if name not in LAZY_IMPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(LAZY_IMPORTS[name]), name)
+    globals()[name] = value
+    return value
+
+
+def _lazy(name):
+    # Return one of the LAZY_IMPORTS, importing it if necessary. Looked up
+    # on the module, so that it may be replaced (e.g. by tests).
+    return getattr(sys.modules[__name__], name)
+
+
+def _connect(server, basic_auth=None, pool_size=POOL_SIZE, record_dir=None):
+    # Return a new JIRA client for server, keeping up to pool_size
+    # connections to it open. If record_dir is given, every response is
+    # also recorded there (see lsst.sqre.fixtures). Responses are counted
+    # into whichever profile (see lsst.sqre.metrics) is active on the
+    # thread which receives them.
+    jira = _lazy("JIRA")(options=dict(server=server), basic_auth=basic_auth)
+    jira._session.hooks["response"].append(_count_response)
+    _mount(jira, pool_size, record_dir)
+    return jira
+
+
+def _mount(jira, pool_size, record_dir):
+    # Give the session of jira a pool of pool_size connections, closing the
+    # pools of the adapters it replaces (connections in use are closed once
+    # their requests are done).
+    session = jira._session
+    prefixes = ("https://", "http://")
+    replaced = {session.adapters.get(prefix) for prefix in prefixes}
+    if record_dir:
+        from .fixtures import record_to
+
+        record_to(session, record_dir, pool_maxsize=pool_size)
+    else:
+        adapter = _lazy("HTTPAdapter")(pool_maxsize=pool_size)
+        for prefix in prefixes:
+            session.mount(prefix, adapter)
+    replaced -= {session.adapters.get(prefix) for prefix in prefixes}
+    for adapter in replaced - {None}:
+        adapter.close()
+
+
+def _count_response(response, *args, **kwargs):
+    # A requests response hook.
+    profile = active()
+    if profile is not None:
+        profile.count_response(response, *args, **kwargs)
+
+
+class ClientRegistry:
+    """A thread-safe registry of JIRA clients, holding one for each server
+    and set of credentials, so that every caller in a process shares its
+    connections (and the client's start-up requests are made only once).
+
+    Clients are not shared with processes forked from this one (e.g.
+    Gunicorn workers): the registry is emptied in the child, which makes its
+    own.
+
+    Args:
+        pool_size: Default number of connections kept open to each server.
+    """
+
+    def __init__(self, pool_size=POOL_SIZE):
+        self.pool_size = pool_size
+        self._reset()
+        _REGISTRIES.add(self)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._clients)
+
+    def get(self, server, basic_auth=None, pool_size=None):
+        """Return the client for server and basic_auth, creating it if
+        necessary.
+
+        If the JIRAKIT_RECORD environment variable names a directory, the
+        client records every response there (see `lsst.sqre.fixtures`).
+
+        Args:
+            server: URL of the JIRA server.
+            basic_auth: (username, password) tuple, or None.
+            pool_size: Number of connections to keep open to the server, if
+                more than the default; the pool of an existing client is
+                enlarged if necessary.
+        """
+        from .fixtures import RECORD_ENV
+
+        pool_size = max(pool_size or 0, self.pool_size)
+        record_dir = os.environ.get(RECORD_ENV)
+        # The class is part of the key so that a replacement (e.g. in
+        # tests) is used once installed.
+        key = (
+            _lazy("JIRA"),
+            server.rstrip("/"),
+            None if basic_auth is None else tuple(basic_auth),
+            record_dir,
+        )
+        with self._lock:
+            entry = self._clients.get(key)
+            if entry is None:
+                jira = _connect(server, basic_auth, pool_size, record_dir)
+                entry = self._clients[key] = [jira, pool_size]
+            elif entry[1] < pool_size:
+                _mount(entry[0], pool_size, record_dir)
+                entry[1] = pool_size
+            return entry[0]
+
+    def clear(self):
+        """Close and forget every client."""
+        with self._lock:
+            clients = [jira for jira, _ in self._clients.values()]
+            self._clients.clear()
+        for jira in clients:
+            jira.close()
+
+    def _reset(self):
+        # Another thread may have held the lock when the process forked, so
+        # the child gets a new one.
+        self._lock = threading.Lock()
+        self._clients = {}
+
+
+# Every ClientRegistry, each of which is reset in forked processes.
+_REGISTRIES = weakref.WeakSet()
+
+
+def _reset_registries():
+    for registry in list(_REGISTRIES):
+        registry._reset()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_registries)
+
+
+# The clients shared by this process.
+CLIENTS = ClientRegistry()
+
+
+def get_client(server, basic_auth=None, auth_file=None, pool_size=None):
+    """Return the shared JIRA client for server and credentials.
+
+    Args:
+        server: URL of the JIRA server.
+        basic_auth: (username, password) tuple, or None.
+        auth_file: If given, the credentials are read from this file, as
+            by `basic_auth_from_file`, in place of basic_auth.
+        pool_size: Minimum number of connections to keep open to the
+            server.
+    """
+    if auth_file is not None:
+        basic_auth = basic_auth_from_file(auth_file)
+    return CLIENTS.get(server, basic_auth, pool_size)
+
+
+def get_issues(
+    server,
+    query,
+    max_results=MAX_RESULTS,
+    store=None,
+    fields=None,
+    max_workers=MAX_WORKERS,
+    page_size=PAGE_SIZE,
+):
+    # If store (an lsst.sqre.issuestore.IssueStore) is given, it is brought
+    # up to date with only those issues which have changed since the query
+    # was last run, and the results are returned from it. If fields (e.g.
+    # RECORD_FIELDS) is given, only those fields are requested from JIRA and
+    # compact IssueRecords are returned in place of jira.Issue objects.
+    #
+    # Otherwise, the first page of results is fetched to find the total
+    # number of issues, then the remaining pages are fetched concurrently
+    # on up to max_workers threads. Results are returned in the order given
+    # by the query.
+    jira = get_client(server)
+    if store is not None:
+        return store.sync(jira, query, max_results, fields=fields)
+    raws = _search_pages(
+        jira, query, fields, max_results, page_size, max_workers
+    )
+    return _make_issues(jira, raws, fields)
+
+
+def _make_issues(jira, raws, fields):
+    # Convert raw JSON issues to IssueRecords if fields were requested, or
+    # jira.Issue objects otherwise.
+    if fields is not None:
+        server = jira._options["server"]
+        return [IssueRecord.from_raw(raw, server) for raw in raws]
+    Issue = _lazy("Issue")
+    return [Issue(jira._options, jira._session, raw=raw) for raw in raws]
+
+
+def _search_pages(jira, query, fields, max_results, page_size, max_workers):
+    # Return the raw JSON of the issues matching query, fetching all pages
+    # after the first concurrently.
+    first = _search_page(jira, query, 0, page_size, fields)
+    offsets, page_size, total = _remaining_pages(first, max_results, page_size)
+    pages = [first]
+    if offsets:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            pages.extend(
+                pool.map(
+                    bind(
+                        lambda start: _search_page(
+                            jira, query, start, page_size, fields
+                        )
+                    ),
+                    offsets,
+                )
+            )
+    return _merge_pages(pages, total)
+
+
+def _remaining_pages(first, max_results, page_size):
+    # Given the first page of search results, return the offsets of the
+    # remaining pages, the page size to use for them, and the total number
+    # of results wanted.
+    raws = first.get("issues", [])
+    total = first.get("total", len(raws))
+    if max_results:
+        total = min(total, max_results)
+    # The server may return fewer results per page than were requested.
+    page_size = first.get("maxResults") or len(raws) or page_size
+    return range(len(raws), total, page_size), page_size, total
+
+
+def _merge_pages(pages, total):
+    # Join pages of results in order. If issues moved between pages while
+    # they were being fetched, they may appear twice.
+    seen = set()
+    unique = []
+    for page in pages:
+        for raw in page.get("issues", []):
+            if len(unique) >= total:
+                return unique
+            if raw["key"] not in seen:
+                seen.add(raw["key"])
+                unique.append(raw)
+    return unique
+
+
+def _search_page(jira, query, start, page_size, fields, retries=PAGE_RETRIES):
+    # Return the JSON of one page of search results, retrying with an
+    # increasing delay if the request fails.
+    for attempt in range(retries + 1):
+        try:
+            return jira.search_issues(
+                query,
+                startAt=start,
+                maxResults=page_size,
+                fields=None if fields is None else list(fields),
+                json_result=True,
+            )
+        except (_lazy("JIRAError"), _lazy("RequestException")):
+            if attempt == retries:
+                raise
+            time.sleep(RETRY_DELAY * 2**attempt)
+
+
+def iter_issues(server, query, page_size=PAGE_SIZE, fields=None):
+    # Yield the issues matching query, fetching them from JIRA one page at a
+    # time, so that the caller can start work before the search completes.
+    # fields is as for get_issues.
+    jira = get_client(server)
+    if fields is not None:
+        yield from _iter_records(jira, query, fields, page_size=page_size)
+        return
+    start = 0
+    while True:
+        page = jira.search_issues(query, startAt=start, maxResults=page_size)
+        yield from page
+        start += len(page)
+        if not len(page) or page.total is None or start >= page.total:
+            break
+
+
+def _iter_records(jira, query, fields, max_results=None, page_size=PAGE_SIZE):
+    # Yield IssueRecords for the issues matching query, requesting only the
+    # given fields. The JSON responses are converted directly, without
+    # building jira.Issue objects.
+    server = jira._options["server"]
+    start = 0
+    while not max_results or start < max_results:
+        page = jira.search_issues(
+            query,
+            startAt=start,
+            maxResults=page_size,
+            fields=list(fields),
+            json_result=True,
+        )
+        raws = page.get("issues", [])
+        if max_results:
+            raws = raws[: max_results - start]
+        for raw in raws:
+            yield IssueRecord.from_raw(raw, server)
+        start += len(raws)
+        if not raws or start >= page.get("total", 0):
+            break
+
+
+def get_issues_by_key(
+    server,
+    keys,
+    chunk_size=KEY_CHUNK_SIZE,
+    max_workers=MAX_WORKERS,
+    fields=None,
+):
+    # Given an iterable of issue keys (DM-1234, DLP-543) return all in a
+    # list. Duplicate keys are ignored. Long key lists are split into chunks
+    # of at most chunk_size keys, which are fetched concurrently.
+    return get_issues_by_key_groups(
+        server, ([key] for key in keys), chunk_size, max_workers, fields
+    )
+
+
+def get_issues_by_key_groups(
+    server,
+    key_groups,
+    chunk_size=KEY_CHUNK_SIZE,
+    max_workers=MAX_WORKERS,
+    fields=None,
+):
+    # Given an iterable of groups (lists) of issue keys, return all the
+    # issues in a list. The groups are packed into queries by
+    # _pack_key_groups; a key shared with an earlier group is only fetched
+    # with that group, so the issues of one group may come from several
+    # queries and their relative order is not that of a query for the group
+    # alone. Callers which depend on the order within a group must sort
+    # them. Results are returned chunk by chunk, in the order in which the
+    # keys were supplied, no matter in which order the concurrent queries
+    # complete. fields is as for get_issues.
+    @bind
+    def fetch(chunk):
+        return get_issues(server, _key_query(chunk), fields=fields)
+
+    chunks = _pack_key_groups(key_groups, chunk_size)
+    if len(chunks) <= 1:
+        results = [fetch(chunk) for chunk in chunks]
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            results = list(pool.map(fetch, chunks))
+
+    issues = []
+    seen = set()
+    for chunk_issues in results:
+        for issue in chunk_issues:
+            if issue.key not in seen:
+                seen.add(issue.key)
+                issues.append(issue)
+    return issues
+
+
+def get_issues_by_wbs(
+    server,
+    issue_types,
+    prefixes,
+    fields=None,
+    chunk_size=WBS_CHUNK_SIZE,
+    max_workers=MAX_WORKERS,
+):
+    # Return an OrderedDict mapping each of the WBS prefixes to a list of
+    # the issues of the given types under it, in the order given by
+    # build_query. The prefixes are combined into queries of up to
+    # chunk_size prefixes each, which are made concurrently, and the results
+    # partitioned by match_wbs. fields is as for get_issues.
+    prefixes = list(OrderedDict.fromkeys(prefixes))
+    chunks = []
+    for start in range(0, len(prefixes), chunk_size):
+        end = start + chunk_size
+        chunks.append(prefixes[start:end])
+
+    @bind
+    def fetch(chunk):
+        issues = get_issues(
+            server, build_query(issue_types, chunk), fields=fields
+        )
+        return partition_by_wbs(issues, chunk)
+
+    if len(chunks) <= 1:
+        results = [fetch(chunk) for chunk in chunks]
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            results = list(pool.map(fetch, chunks))
+
+    partitions = OrderedDict()
+    for result in results:
+        partitions.update(result)
+    return partitions
+
+
+def partition_by_wbs(issues, prefixes):
+    # Return an OrderedDict mapping each of the WBS prefixes to a list of
+    # the issues which match it, in their original order. An issue which
+    # matches several prefixes appears under each.
+    partitions = OrderedDict((prefix, []) for prefix in prefixes)
+    for issue in issues:
+        wbs = getattr(issue.fields, "customfield_10500", None)
+        if not wbs:
+            continue
+        for prefix, matched in partitions.items():
+            if match_wbs(wbs, prefix):
+                matched.append(issue)
+    return partitions
+
+
+def match_wbs(wbs, prefix):
+    """Return whether WBS element wbs is selected by prefix.
+
+    A prefix ending in "*" selects every element which starts with the rest
+    of it; any other prefix selects that element and those below it (e.g.
+    "02C.04" selects "02C.04" and "02C.04.01", but not "02C.041").
+    """
+    if prefix.endswith("*"):
+        return wbs.startswith(prefix[:-1])
+    return wbs == prefix or wbs.startswith(prefix + ".")
+
+
+# A node in a tree of issues: an issue, and a list of EpicNodes for the
+# issues below it.
+EpicNode = namedtuple("EpicNode", ["issue", "children"])
+
+
+def get_epic_tree(
+    server,
+    query,
+    link_type,
+    children=False,
+    basic_auth=None,
+    chunk_size=KEY_CHUNK_SIZE,
+    max_workers=MAX_WORKERS,
+):
+    # Return a list of EpicNodes, one for each epic matching query. The
+    # children of each are the issues it links to by outward links of
+    # link_type (e.g. "Containment" sub-epics). If children is set, the
+    # children of those are the issues in that epic, ordered by key.
+    #
+    # The whole tree is fetched in a fixed number of bulk queries (the
+    # matching epics, their linked issues by key, and the issues in all of
+    # those by Epic Link), however many epics there are.
+    jira = get_client(server, basic_auth)
+    server = jira._options["server"]
+
+    def search_chunks(make_query, keys, fields):
+        # Return the raw JSON of the issues matching make_query for each
+        # chunk of keys.
+        def fetch(chunk):
+            return _search_pages(
+                jira, make_query(chunk), fields, None, PAGE_SIZE, max_workers
+            )
+
+        chunks = _pack_key_groups([keys], chunk_size)
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            return [
+                raw for raws in pool.map(bind(fetch), chunks) for raw in raws
+            ]
+
+    epics = _make_issues(
+        jira,
+        _search_pages(
+            jira, query, RECORD_FIELDS, None, PAGE_SIZE, max_workers
+        ),
+        RECORD_FIELDS,
     )
+    links = [
+        [
+            link.outwardIssue.key
+            for link in epic.fields.issuelinks
+            if link.type.name == link_type and hasattr(link, "outwardIssue")
+        ]
+        for epic in epics
+    ]
+    linked = {
+        raw["key"]: IssueRecord.from_raw(raw, server)
+        for raw in search_chunks(
+            _key_query, [key for keys in links for key in keys], RECORD_FIELDS
+        )
+    }
+
+    members = {}
+    if children and linked:
+        epic_link = _field_id(jira, "Epic Link")
+        for raw in search_chunks(
+            _epic_link_query, list(linked), RECORD_FIELDS + (epic_link,)
+        ):
+            members.setdefault(raw["fields"].get(epic_link), []).append(
+                EpicNode(IssueRecord.from_raw(raw, server), [])
+            )
+
+    return [
+        EpicNode(
+            epic,
+            [
+                EpicNode(linked[key], members.get(key, []))
+                for key in keys
+                if key in linked
+            ],
+        )
+        for epic, keys in zip(epics, links)
+    ]
+
+
+def _field_id(jira, name):
+    # Return the ID of the (custom) field with the given name.
+    for field in jira.fields():
+        if field["name"] == name:
+            return field["id"]
+    raise KeyError(f"No field named {name}")
 
 
-def get_issues_by_key(server, keys):
-    # Given an iterable of issue keys (DM-1234, DLP-543)
-    # return all in a list. Currently there may be issues if the key list
-    # is extremely long.
-    # convert the list to an "in" query
-    query = "issuekey in (" + " ,".join(keys) + ")"
-    return get_issues(server, query, max_results=None)
+def _epic_link_query(keys):
+    # Convert a list of epic keys to a query for the issues in those epics.
+    return "'Epic Link' in (" + ", ".join(keys) + ") ORDER BY key"
 
 
-def compare(a, b, ordering=cycles()):
+def _key_query(keys):
+    # Convert a list of keys to an "in" query.
+    return "issuekey in (" + " ,".join(keys) + ")"
+
+
+def _pack_key_groups(key_groups, chunk_size):
+    # Pack groups of keys into chunks of at most chunk_size keys, dropping
+    # keys which have already been seen. A group is never split across
+    # chunks unless it is larger than chunk_size on its own.
+    chunks = []
+    chunk = []
+    seen = set()
+    for group in key_groups:
+        new_keys = [key for key in dict.fromkeys(group) if key not in seen]
+        seen.update(new_keys)
+        if chunk and len(chunk) + len(new_keys) > chunk_size:
+            chunks.append(chunk)
+            chunk = []
+        while len(new_keys) > chunk_size:
+            chunks.append(new_keys[:chunk_size])
+            new_keys = new_keys[chunk_size:]
+        chunk.extend(new_keys)
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def compare(a, b, ordering=None):
     # Returns negative if a appears before b in ordering, zero if a
-    # and b are at the same position, positive if a is after b.
-    if ordering.index(a) < ordering.index(b):
+    # and b are at the same position, positive if a is after b. ordering is a
+    # CycleCalendar or a sequence of cycle names, and defaults to CALENDAR.
+    if ordering is None:
+        ordering = CALENDAR
+    elif not isinstance(ordering, CycleCalendar):
+        ordering = _calendar(tuple(ordering))
+    difference = ordering.compare(a, b)
+    if difference < 0:
         return -1
-    elif ordering.index(a) == ordering.index(b):
+    elif difference == 0:
         return 0
     else:
         return 1
 
 
+@lru_cache(maxsize=16)
+def _calendar(names):
+    # Return a CycleCalendar of the tuple names, reusing the one made for
+    # the same names on an earlier call, so that compare does not index the
+    # names again for every comparison.
+    return CycleCalendar(names)
+
+
 def get_cycle(issue):
     # Return the name of the first entry in the fixVersions field of issue.
     return issue.fields.fixVersions[0].name
@@ -118,15 +794,17 @@ def good_block(blocker, blocked, compare_fn=compare):
 
 def get_dependents(key, issues, visited=None):
     # Return the set of keys of all milestones which are blocked by the given
-    # key. We use visited to avoid getting stuck in cycles in the graph; note
-    # that we don't report such cycles explicitly, but they should usually be
-    # apparent from the bad blocks report.
+    # key. We use visited to avoid getting stuck in cycles in the graph; keys
+    # in visited are not followed. To find the dependents of many issues,
+    # build a BlocksGraph once instead.
     dependents = set()
-    if not visited:
-        visited = []
-    if key not in visited:
-        visited.append(key)
-        for link in issues[key].fields.issuelinks:
+    visited = set(visited or ())
+    if key in visited:
+        return dependents
+    visited.add(key)
+    stack = [key]
+    while stack:
+        for link in issues[stack.pop()].fields.issuelinks:
             if (
                 link.type.name == "Blocks"
                 and hasattr(link, "outwardIssue")
@@ -134,25 +812,59 @@ def get_dependents(key, issues, visited=None):
             ):
                 if link.outwardIssue.fields.issuetype.name == "Milestone":
                     dependents.add(link.outwardIssue.key)
-                dependents = dependents.union(
-                    get_dependents(link.outwardIssue.key, issues, visited)
-                )
+                if link.outwardIssue.key not in visited:
+                    visited.add(link.outwardIssue.key)
+                    stack.append(link.outwardIssue.key)
     return dependents
 
 
-def get_bad_blocks(issues, compare_fn=compare):
+def get_bad_blocks(issues, compare_fn=None, graph=None, calendar=None):
     # Return a list of (blocker_key, blocked_key) tuples for all bad blocks in
     # the set of issues, where a "bad block" is defined as the blocked issue
-    # being scheduled for a cycle earlier than its blocker.
+    # being scheduled for a cycle earlier than its blocker. Blocks are listed
+    # in the order of the issues. graph is a BlocksGraph of issues; it is
+    # built if not supplied. Cycles are ordered by compare_fn if given,
+    # otherwise by their ranks in calendar (default CALENDAR).
+    if graph is None:
+        graph = BlocksGraph(issues)
+    milestones = [
+        (key, issue)
+        for key, issue in issues.items()
+        if issue.fields.issuetype.name == "Milestone"
+    ]
+    if compare_fn is not None:
+        return [
+            (blocker_key, blocked_key)
+            for blocker_key, blocker in milestones
+            for blocked_key in graph.iter_dependents(blocker_key)
+            if not good_block(blocker, issues[blocked_key], compare_fn)
+        ]
+
+    if calendar is None:
+        calendar = CALENDAR
+    ranks = {}
+
+    def rank(key):
+        if key not in ranks:
+            ranks[key] = calendar.rank(get_cycle(issues[key]))
+        return ranks[key]
+
     return [
         (blocker_key, blocked_key)
-        for blocker_key, blocker in issues.items()
-        for blocked_key in get_dependents(blocker_key, issues)
-        if blocker.fields.issuetype.name == "Milestone"
-        and not good_block(blocker, issues[blocked_key], compare_fn)
+        for blocker_key, _ in milestones
+        for blocked_key in graph.iter_dependents(blocker_key)
+        if rank(blocker_key) > rank(blocked_key)
     ]
 
 
+def get_blocking_cycles(issues, graph=None):
+    # Return a list of cycles of blocks in the set of issues, each a sorted
+    # list of the keys of the issues which block each other.
+    if graph is None:
+        graph = BlocksGraph(issues)
+    return graph.cycles()
+
+
 def get_unscheduled_milestones(issues):
     # Return a list of keys of all Milestones which do not have a fixVersion
     # defined.
@@ -191,57 +903,354 @@ def get_scheduled_issues(issues, issuetype):
     ]
 
 
-def check_sanity(issues):
+def check_sanity(issues, report_cycles=False, calendar=None):
     output = StringIO()
     issues = {issue.key: issue for issue in issues}
 
     # Check for unscheduled milestones
     for key in sorted(get_unscheduled_milestones(issues)):
-        output.write(
-            "Milestone {} [{}] is not scheduled in any cycle.\n".format(
-                key, issues[key].fields.customfield_10500
-            )
-        )
+        output.write(_unscheduled_line(key, issues[key]))
         del issues[
             key
         ]  # Trim the issue so it doesn't break the bad blocks check
 
     # Check for milestones which are scheduled in more than one cycle
     for key in sorted(get_multiply_scheduled_milestones(issues)):
-        output.write(
-            "Milestone {} [{}] scheduled in multiple cycles: {}.\n".format(
-                key,
-                issues[key].fields.customfield_10500,
-                ", ".join(v.name for v in issues[key].fields.fixVersions),
-            )
-        )
+        output.write(_multiply_scheduled_line(key, issues[key]))
 
     # Check for meta-epics which are schedule (they shouldn't be)
     for key in sorted(get_scheduled_issues(issues, "Meta-epic")):
-        issue = issues[key]
-        output.write(
-            "{} {} [{}] has been scheduled: {}.\n".format(
-                issue.fields.issuetype.name,
-                key,
-                issue.fields.customfield_10500,
-                ", ".join(v.name for v in issues[key].fields.fixVersions),
-            )
-        )
+        output.write(_scheduled_line(key, issues[key]))
 
     # Check for bad blocks
-    bad_blocks = get_bad_blocks(issues)
+    graph = BlocksGraph(issues)
+    bad_blocks = get_bad_blocks(issues, graph=graph, calendar=calendar)
     for blocker, blocked in bad_blocks:
-        output.write(
-            "{} ({}) [{}] blocks {} ({}) [{}].\n".format(
-                blocker,
-                get_cycle(issues[blocker]),
-                issues[blocker].fields.customfield_10500,
-                blocked,
-                get_cycle(issues[blocked]),
-                issues[blocked].fields.customfield_10500,
-            )
+        output.write(_bad_block_line(issues, blocker, blocked))
+
+    # Check for cycles of blocks
+    if report_cycles:
+        for cycle in get_blocking_cycles(issues, graph):
+            output.write(_cycle_line(cycle))
+
+    return output.getvalue()
+
+
+def _unscheduled_line(key, issue):
+    return "Milestone {} [{}] is not scheduled in any cycle.\n".format(
+        key, issue.fields.customfield_10500
+    )
+
+
+def _multiply_scheduled_line(key, issue):
+    return "Milestone {} [{}] scheduled in multiple cycles: {}.\n".format(
+        key,
+        issue.fields.customfield_10500,
+        ", ".join(v.name for v in issue.fields.fixVersions),
+    )
+
+
+def _scheduled_line(key, issue):
+    return "{} {} [{}] has been scheduled: {}.\n".format(
+        issue.fields.issuetype.name,
+        key,
+        issue.fields.customfield_10500,
+        ", ".join(v.name for v in issue.fields.fixVersions),
+    )
+
+
+def _bad_block_line(issues, blocker, blocked):
+    return "{} ({}) [{}] blocks {} ({}) [{}].\n".format(
+        blocker,
+        get_cycle(issues[blocker]),
+        issues[blocker].fields.customfield_10500,
+        blocked,
+        get_cycle(issues[blocked]),
+        issues[blocked].fields.customfield_10500,
+    )
+
+
+def _cycle_line(cycle):
+    return "Blocking cycle: {}.\n".format(" -> ".join(cycle))
+
+
+# The result of IncrementalSanity.update: the new report, and lists of the
+# lines which have been added to it and resolved since the last.
+SanityDiff = namedtuple("SanityDiff", ["report", "added", "resolved"])
+
+
+class IncrementalSanity:
+    """The result of `check_sanity` on a set of issues, kept up to date as
+    issues change.
+
+    When issues are updated, only the scheduling checks of those issues and
+    the bad blocks involving their ancestors (the issues which block them,
+    directly or indirectly, before or after the update) are recomputed, as
+    are any cycles of blocks passing through them.
+
+    The report is the same as that of `check_sanity` on the current issues,
+    except that cycles of blocks are listed in the order of their first
+    issues rather than in an order determined by the whole graph. Issues
+    are taken to be Milestones or not by their own issue types rather than
+    those recorded in the links to them.
+
+    Args:
+        issues: Iterable of issues.
+        report_cycles: Also report cycles of blocks.
+        calendar: A `CycleCalendar` by which bad blocks are judged;
+            defaults to `CALENDAR`.
+    """
+
+    def __init__(self, issues, report_cycles=False, calendar=None):
+        self.report_cycles = report_cycles
+        self.calendar = CALENDAR if calendar is None else calendar
+        self.issues = {}
+        self._position = {}
+        self._outward = {}
+        self._inward = {}
+        self._scheduling = {}
+        self._bad_blocks = {}
+        self._cycles = []
+        self.update(issues)
+
+    def report(self):
+        """Return the current report, as `check_sanity` would."""
+        return "".join(self._lines())
+
+    def update(self, issues, removed=()):
+        """Replace or add issues, and remove those with keys in removed.
+
+        Returns:
+            A `SanityDiff`.
+        """
+        before = self._lines()
+        issues = list(issues)
+        changed = {issue.key for issue in issues} | set(removed)
+        affected = self._ancestors(changed)
+
+        for key in removed:
+            self._remove(key)
+        for issue in issues:
+            self._remove(issue.key)
+            self._add(issue)
+
+        affected |= self._ancestors(changed)
+        for key in changed:
+            self._check_scheduling(key)
+        for key in affected:
+            self._check_blocks(key)
+        if self.report_cycles:
+            self._update_cycles(changed)
+
+        after = self._lines()
+        unchanged = set(before) & set(after)
+        return SanityDiff(
+            "".join(after),
+            [line for line in after if line not in unchanged],
+            [line for line in before if line not in unchanged],
+        )
+
+    def _add(self, issue):
+        key = issue.key
+        self.issues[key] = issue
+        if key not in self._position:
+            self._position[key] = len(self._position)
+        self._outward[key] = [
+            link.outwardIssue.key
+            for link in issue.fields.issuelinks
+            if link.type.name == "Blocks" and hasattr(link, "outwardIssue")
+        ]
+        for target in self._outward[key]:
+            self._inward.setdefault(target, set()).add(key)
+
+    def _remove(self, key):
+        if self.issues.pop(key, None) is None:
+            return
+        for target in self._outward.pop(key):
+            self._inward[target].discard(key)
+        self._scheduling.pop(key, None)
+        self._bad_blocks.pop(key, None)
+
+    def _in_graph(self, key):
+        # Unscheduled milestones are left out of the graph, as in
+        # check_sanity.
+        issue = self.issues.get(key)
+        return issue is not None and not get_unscheduled_milestones(
+            {key: issue}
+        )
+
+    def _is_milestone(self, key):
+        return self.issues[key].fields.issuetype.name == "Milestone"
+
+    def _ancestors(self, keys):
+        # Return keys and the issues in the graph which block any of them.
+        found = set(keys)
+        stack = [key for key in keys if self._in_graph(key)]
+        while stack:
+            for source in self._inward.get(stack.pop(), ()):
+                if source not in found and self._in_graph(source):
+                    found.add(source)
+                    stack.append(source)
+        return found
+
+    def _dependents(self, key):
+        # Return the keys of the issues in the graph blocked by key.
+        found = set()
+        stack = [key]
+        while stack:
+            for target in self._outward[stack.pop()]:
+                if target not in found and self._in_graph(target):
+                    found.add(target)
+                    stack.append(target)
+        return found
+
+    def _check_scheduling(self, key):
+        self._scheduling.pop(key, None)
+        if key not in self.issues:
+            return
+        issue = self.issues[key]
+        single = {key: issue}
+        # Each finding is numbered by the order in which check_sanity
+        # reports that kind of finding.
+        if get_unscheduled_milestones(single):
+            findings = [(0, _unscheduled_line(key, issue))]
+        elif get_multiply_scheduled_milestones(single):
+            findings = [(1, _multiply_scheduled_line(key, issue))]
+        else:
+            findings = []
+        if get_scheduled_issues(single, "Meta-epic"):
+            findings.append((2, _scheduled_line(key, issue)))
+        if findings:
+            self._scheduling[key] = findings
+
+    def _check_blocks(self, key):
+        self._bad_blocks.pop(key, None)
+        if not self._in_graph(key) or not self._is_milestone(key):
+            return
+        rank = self.calendar.rank(get_cycle(self.issues[key]))
+        bad = [
+            blocked
+            for blocked in self._dependents(key)
+            if self._is_milestone(blocked)
+            and self.calendar.rank(get_cycle(self.issues[blocked])) < rank
+        ]
+        if bad:
+            self._bad_blocks[key] = sorted(bad, key=self._position.get)
+
+    def _update_cycles(self, changed):
+        # Every cycle which may have changed is within the region made up of
+        # the strongly connected groups (the issues which both block and are
+        # blocked by an issue) of the changed issues and of the members of
+        # the old cycles through them, which the change may have split.
+        # Being a union of whole groups, the region holds the same cycles as
+        # the whole graph does; the other old cycles are unaffected.
+        dropped = [
+            cycle for cycle in self._cycles if changed.intersection(cycle)
+        ]
+        region = set()
+        for key in set(changed).union(*dropped):
+            if key not in region and self._in_graph(key):
+                region |= (self._dependents(key) | {key}) & self._ancestors(
+                    [key]
+                )
+        graph = BlocksGraph(
+            {key: self.issues[key] for key in self._ordered(region)}
         )
+        found = graph.cycles()
+        members = set(changed).union(region, *found)
+        self._cycles = [
+            cycle for cycle in self._cycles if not members.intersection(cycle)
+        ] + [self._ordered(cycle) for cycle in found]
+        self._cycles.sort(key=lambda cycle: self._position[cycle[0]])
+
+    def _ordered(self, keys):
+        return sorted(keys, key=self._position.get)
+
+    def _lines(self):
+        # Return the lines of the report, in the order check_sanity writes
+        # them.
+        lines = [
+            line
+            for _, key, line in sorted(
+                (kind, key, line)
+                for key, findings in self._scheduling.items()
+                for kind, line in findings
+            )
+        ]
+        for blocker in self._ordered(self._bad_blocks):
+            lines.extend(
+                _bad_block_line(self.issues, blocker, blocked)
+                for blocked in self._bad_blocks[blocker]
+            )
+        lines.extend(_cycle_line(cycle) for cycle in self._cycles)
+        return lines
+
+
+def get_triggers(rfc):
+    # Return a list of the keys of issues triggered by rfc.
+    return [
+        link.outwardIssue.key
+        for link in rfc.fields.issuelinks
+        if link.type.name == TRIGGER_LINK and hasattr(link, "outwardIssue")
+    ]
+
+
+def classify_rfcs(rfcs, statuses):
+    # Given a list of Adopted RFCs and a dict mapping the keys of the issues
+    # they trigger to status names, return lists of the RFCs without any
+    # triggered work and of those whose triggered work is all complete.
+    # Triggered issues missing from statuses are ignored.
+    adopted_no_triggers = []
+    adopted_done = []
+    for rfc in rfcs:
+        triggers = get_triggers(rfc)
+        if not triggers:
+            adopted_no_triggers.append(rfc)
+            continue
+        states = [statuses[key] for key in triggers if key in statuses]
+        # Triggered RFCs don't count as real work
+        valids = [s for s in states if s not in ("Invalid", "Implemented")]
+        if not valids and states:
+            # indicates that there are no triggered tickets in reality
+            adopted_no_triggers.append(rfc)
+        elif all(status == "Done" for status in valids):
+            adopted_done.append(rfc)
+    return adopted_no_triggers, adopted_done
 
+
+def rfc_status(server, query=RFC_QUERY, max_results=RFC_MAX_RESULTS):
+    # Return a report listing the Adopted RFCs which need action: those
+    # without triggered work, and those with all triggered work complete.
+    # The status of every triggered issue is fetched in bulk.
+    rfcs = get_issues(
+        server, query, max_results=max_results, fields=RECORD_FIELDS
+    )
+    triggered = get_issues_by_key(
+        server,
+        (key for rfc in rfcs for key in get_triggers(rfc)),
+        fields=("status",),
+    )
+    statuses = {issue.key: str(issue.fields.status) for issue in triggered}
+    adopted_no_triggers, adopted_done = classify_rfcs(rfcs, statuses)
+
+    output = StringIO()
+    output.write("Retrieved {} candidate ADOPTED RFCs\n".format(len(rfcs)))
+    for rfc in rfcs:
+        for link in rfc.fields.issuelinks:
+            if link.type.name == "Duplicate":
+                # A duplicate should not be in ADOPTED state
+                output.write(
+                    "WARNING: {} is marked as a duplicate\n".format(rfc.key)
+                )
+    output.write("The following RFCs are ADOPTED without triggered work:\n")
+    for rfc in adopted_no_triggers:
+        output.write("\t{}: {}\n".format(rfc.key, rfc.fields.summary))
+    output.write("\n")
+    output.write(
+        "The following RFCs are ADOPTED with all triggered work COMPLETED:\n"
+    )
+    for rfc in adopted_done:
+        output.write("\t{}: {}\n".format(rfc.key, rfc.fields.summary))
     return output.getvalue()
 
 
@@ -254,8 +1263,12 @@ def dm_to_dlp_cycle(dmcycle):
     # Fall 1234   | F34
     # Winter 1234 | W34
     # [There is no year with both spring & summer]
-    matcher = re.compile(r"\w?([SWxF])\w+\s\d*(\d\d)$")
-    matched = matcher.search(str(dmcycle))
+    return _dm_to_dlp_cycle(str(dmcycle))
+
+
+@lru_cache(maxsize=None)
+def _dm_to_dlp_cycle(dmcycle):
+    matched = DM_CYCLE.search(dmcycle)
     if matched:
         parts = matched.groups()
         return "{}{}".format(*(s.upper() for s in parts))
@@ -1,13 +1,16 @@
 #!/usr/bin/env python
 
+import hmac
+import logging
+import mimetypes
 import os
-from contextlib import contextmanager
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
 from functools import partial
-from shutil import rmtree
-from tempfile import mkdtemp
+from itertools import chain
 
 import flask
-import graphviz
 
 try:
     # Python 3
@@ -16,14 +19,41 @@ except ImportError:
     # Python 2
     from urlparse import urljoin
 
-from lsst.sqre.jira2dot import attr_func, jira2dot, rank_func
-from lsst.sqre.jira2txt import jira2txt, jirakpm2txt
-from lsst.sqre.jirakit import (
+from .cache import (
+    DEFAULT_SIZE,
+    DEFAULT_TTL,
+    CachedResponse,
+    ResponseCache,
+    make_response,
+)
+from .jira2dot import attr_func, iter_jira2dot, jira2dot, rank_func
+from .jira2txt import jira2txt, jirakpm2txt, pivot_issues
+from .jirakit import (
+    CALENDAR,
     SERVER,
     build_query,
     check_sanity,
-    cycles,
+    get_calendar,
     get_issues,
+    iter_issues,
+    rfc_status,
+)
+from .metrics import (
+    Metrics,
+    Profile,
+    activate,
+    activate_iter,
+    stage,
+    timed,
+    wbs_prefix,
+)
+from .prewarm import DEFAULT_JITTER, DEFAULT_WORKERS, Prewarmer
+from .records import RECORD_FIELDS
+from .render import GraphRenderer, RenderQueueFull, RenderTimeout
+from .snapshot import (
+    DEFAULT_SYNC_INTERVAL,
+    PROJECT_TYPES,
+    IssueSnapshot,
 )
 
 DEFAULT_FMT = "pdf"
@@ -31,91 +61,596 @@ DEFAULT_FMT = "pdf"
 # Supported formats. A request for anything else throws a 404.
 FMTS = {"dot", "eps", "fig", "pdf", "svg", "png", "ps", "svg"}
 
+# Key in the WSGI environment of the requests made by the prewarmer, which
+# render the page afresh and replace it in the cache. It cannot be set by
+# clients.
+REFRESH = "jirakit.refresh"
+
+# Endpoints whose pages may be refreshed by the prewarmer.
+PREWARM_ENDPOINTS = {
+    "get_formatted_graph",
+    "get_csv",
+    "get_tab",
+    "get_sanity",
+    "get_kpm",
+    "get_rfc",
+}
+
+# Appended, by mimetype, to a streamed response which fails part-way, so
+# that it cannot be mistaken for a complete one.
+ERROR_MARKERS = {
+    "text/html": "\n<strong>Error: this page is incomplete ({})</strong>\n",
+    "text/vnd.graphviz": "\n// Error: this graph is incomplete ({})\n",
+}
+
+logger = logging.getLogger(__name__)
+
+
+def fetch_issues(
+    server,
+    issue_types,
+    prefixes,
+    snapshot=None,
+    stream=True,
+    calendar=CALENDAR,
+):
+    # Return the issues of issue_types under the WBS prefixes. If snapshot
+    # (an lsst.sqre.snapshot.IssueSnapshot) holds them, they are taken from
+    # it, ordered by calendar as JIRA orders fixVersions; otherwise they are
+    # fetched from JIRA, and recorded in snapshot if given. If stream is
+    # set, they are fetched from JIRA a page at a time as they are consumed.
+    if snapshot is not None and snapshot.covers(issue_types, prefixes):
+        return snapshot.select(issue_types, prefixes, calendar=calendar)
+    fetch = iter_issues if stream else get_issues
+    issues = fetch(
+        server, build_query(issue_types, prefixes), fields=RECORD_FIELDS
+    )
+    if snapshot is None:
+        return issues
+    issues = snapshot.record(issue_types, prefixes, issues)
+    return issues if stream else list(issues)
+
+
+def sync_snapshot(server, snapshot, issue_types=PROJECT_TYPES):
+    # Replace the contents of snapshot with every issue of issue_types,
+    # fetched in a single query.
+    snapshot.sync(
+        issue_types,
+        partial(
+            get_issues,
+            server,
+            build_query(issue_types, None),
+            fields=RECORD_FIELDS,
+        ),
+    )
+
+
+def snapshot_status(snapshot):
+    # Describe snapshot (None if there is none) for /cache.
+    if snapshot is None:
+        return None
+    issuetypes, fix_versions = snapshot.counts()
+    return {
+        "issues": len(snapshot),
+        "age": snapshot.age(),
+        "issuetypes": issuetypes,
+        "fixVersions": fix_versions,
+    }
+
+
+def render_text(fetch, generator):
+    # Return the output of generator, which takes an iterable of issues and
+    # returns a string, as an HTML response. The issues are those returned
+    # by fetch, which takes no arguments.
+    with stage("fetch"):
+        issues = fetch()
+    with stage("transform"):
+        text = generator(issues)
+    return make_response("<pre>" + text + "</pre>", "text/html")
+
+
+def stream_text(fetch, generator):
+    # As render_text, for a generator returning an iterable of strings
+    # (e.g. pivot_csv), which are yielded as they are made. Nothing is
+    # yielded until the first issue has arrived.
+    issues = prefetch(timed("fetch", fetch()))
+    with stage("transform"):
+        lines = generator(issues)
+    yield "<pre>"
+    yield from timed("transform", lines)
+    yield "</pre>"
+
+
+def prefetch(issues):
+    # Return an iterator over issues which has already taken the first of
+    # them, so that a failure to fetch the first page is raised here rather
+    # than once the response has begun.
+    iterator = iter(issues)
+    for first in iterator:
+        return chain((first,), iterator)
+    return iter(())
+
+
+def split_wbs(wbs):
+    # Several WBS prefixes may be requested at once, separated by commas;
+    # they are fetched in a single query.
+    return wbs.split(",")
+
+
+def pivot_csv(issues, **kwargs):
+    # Return an iterator over the lines of the CSV table of issues; kwargs
+    # are as for pivot_issues.
+    return pivot_issues(issues, csv=True, **kwargs).iter_csv()
 
-@contextmanager
-def tempdir():
-    dirname = mkdtemp()
+
+def render_dot(fetch, calendar=CALENDAR):
+    # Yield the dot source for the graph as the issues returned by fetch
+    # arrive, starting once the first has arrived.
+    yield from timed(
+        "transform",
+        iter_jira2dot(
+            prefetch(timed("fetch", fetch())),
+            attr_func=attr_func,
+            rank_func=rank_func,
+            ranks=calendar,
+        ),
+    )
+
+
+def render_graph(fetch, fmt, renderer, calendar=CALENDAR):
+    with stage("fetch"):
+        issues = fetch()
+    with stage("transform"):
+        source = jira2dot(
+            issues,
+            attr_func=attr_func,
+            rank_func=rank_func,
+            ranks=calendar,
+        )
+    try:
+        with stage("render"):
+            body = renderer.render(source, fmt)
+    except RenderQueueFull:
+        flask.abort(503)
+    except RenderTimeout:
+        flask.abort(504)
+    filename = f"graph{os.path.extsep}{fmt}"
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    return make_response(body, mimetype)
+
+
+def profiled_call(metrics, compute, **labels):
+    # Return a function which calls compute with a profile active, and
+    # records its timings in metrics with the given labels.
+    def call():
+        profile = Profile()
+        with activate(profile):
+            result = compute()
+        metrics.record(profile, **labels)
+        return result
+
+    return call
+
+
+def profiled_stream(metrics, produce, **labels):
+    # As profiled_call, for a function returning an iterable of chunks. The
+    # timings are recorded once the last chunk has been made.
+    def stream():
+        profile = Profile()
+        yield from activate_iter(profile, produce())
+        metrics.record(profile, **labels)
+
+    return stream
+
+
+def send_cached(cache, compute):
+    # Serve a response from the cache, keyed by the request URL, calling
+    # compute to render it if necessary.
+    if flask.request.environ.get(REFRESH):
+        return send_entry(
+            cache, cache.refresh(flask.request.full_path, compute)
+        )
+    return send_entry(
+        cache, cache.get_or_compute(flask.request.full_path, compute)
+    )
+
+
+def send_streamed(cache, produce, mimetype):
+    # Serve a response from the cache, keyed by the request URL, or stream
+    # the chunks yielded by produce to the client as they are made.
+    if flask.request.environ.get(REFRESH):
+        return send_cached(
+            cache, lambda: make_response("".join(produce()), mimetype)
+        )
+    entry = cache.get_or_stream(flask.request.full_path, produce, mimetype)
+    if isinstance(entry, CachedResponse):
+        return send_entry(cache, entry)
+    # The first chunk is made before the response begins, so that if it
+    # fails the client receives an error status.
+    chunks = mark_errors(entry, flask.request.full_path, mimetype)
+    return flask.Response(prefetch(chunks), mimetype=mimetype)
+
+
+def mark_errors(chunks, url, mimetype):
+    # Yield chunks. If making them fails after the first has been sent (and
+    # so the status can no longer be changed), log the error and end the
+    # response with an ERROR_MARKERS line instead of truncating it. Failed
+    # responses are not cached.
+    sent = False
     try:
-        yield dirname
-    finally:
-        rmtree(dirname, ignore_errors=True)
+        for chunk in chunks:
+            sent = True
+            yield chunk
+    except Exception as error:
+        if not sent:
+            raise
+        logger.exception("Failed to stream %s", url)
+        yield ERROR_MARKERS.get(mimetype, "\nError: incomplete ({})\n").format(
+            type(error).__name__
+        )
 
 
-def render_text(server, query, generator):
-    return "<pre>%s</pre>" % (generator(get_issues(server, query)))
+def send_entry(cache, entry):
+    # Clients which already hold the current version receive a 304.
+    response = flask.Response(entry.body, mimetype=entry.mimetype)
+    response.set_etag(entry.etag)
+    response.last_modified = datetime.fromtimestamp(
+        entry.created, timezone.utc
+    )
+    response.cache_control.max_age = cache.ttl
+    return response.make_conditional(flask.request)
 
 
-def build_server(server):
+def build_server(
+    server,
+    cache_ttl=DEFAULT_TTL,
+    cache_size=DEFAULT_SIZE,
+    renderer=None,
+    jira_cycles=False,
+    timing_log=False,
+    webhooks=False,
+    webhook_secret=None,
+    prewarm=(),
+    prewarm_interval=None,
+    prewarm_popular=0,
+    prewarm_workers=DEFAULT_WORKERS,
+    prewarm_jitter=DEFAULT_JITTER,
+    project_snapshot=False,
+    sync_interval=DEFAULT_SYNC_INTERVAL,
+):
+    # If jira_cycles is set, cycles are read from the DLP fixVersions when
+    # first needed rather than taken from CALENDAR. The time taken by each
+    # stage of every uncached response is served at /metrics, and if
+    # timing_log is set also logged (see lsst.sqre.metrics).
+    #
+    # If webhooks is set, the issues fetched for the /wbs/ routes are kept
+    # in an IssueSnapshot and served from it thereafter. It is updated by
+    # JIRA webhooks posted to /webhook (with ?secret=webhook_secret, if
+    # given), which also discard the cached pages they affect.
+    #
+    # If project_snapshot is set, every DLP issue of the PROJECT_TYPES is
+    # instead fetched in one query, and the /wbs/ and /kpm routes select
+    # their issues from the resulting snapshot. It is synced again on a
+    # background thread started by the first request made sync_interval
+    # seconds or more after the last sync (requests are meanwhile served
+    # from the previous one), and may also be kept current by webhooks.
+    #
+    # The pages at the URLs in prewarm, and the prewarm_popular most
+    # requested, are refreshed in the cache every prewarm_interval seconds
+    # (by default, a little less than cache_ttl) by an
+    # lsst.sqre.prewarm.Prewarmer, which is held in the app config and is
+    # started by calling its start method. If there is nothing to prewarm,
+    # or caching is disabled, there is no prewarmer and the config holds
+    # None. The age of every cached page, and the state of the prewarmer,
+    # are served at /cache.
     app = flask.Flask(__name__)
 
+    def calendar():
+        return get_calendar(server) if jira_cycles else CALENDAR
+
+    if renderer is None:
+        renderer = GraphRenderer()
+    cache = ResponseCache(ttl=cache_ttl, max_entries=cache_size)
+    app.config["RESPONSE_CACHE"] = cache
+    metrics = Metrics(log=timing_log)
+    app.config["METRICS"] = metrics
+    snapshot = IssueSnapshot(server) if webhooks or project_snapshot else None
+    app.config["SNAPSHOT"] = snapshot
+    sync_lock = threading.Lock()
+
+    def sync():
+        # Sync the snapshot if it is out of date. Only the first sync is
+        # waited for; later ones are made on a background thread.
+        age = snapshot.age()
+        if age is not None and age < sync_interval:
+            return
+        if age is None:
+            with sync_lock:
+                if snapshot.age() is None:
+                    with stage("sync"):
+                        sync_snapshot(server, snapshot)
+        elif sync_lock.acquire(blocking=False):
+            threading.Thread(target=resync, name="sync", daemon=True).start()
+
+    def resync():
+        # Called on a background thread holding sync_lock.
+        try:
+            sync_snapshot(server, snapshot)
+        except Exception:
+            logger.exception("Failed to sync the snapshot")
+        finally:
+            sync_lock.release()
+
+    def refresh(url):
+        # Render the page at url and replace it in the cache.
+        response = app.test_client().get(
+            url, environ_overrides={REFRESH: True}
+        )
+        if response.status_code != 200:
+            raise RuntimeError(f"{url} returned {response.status}")
+
+    prewarmer = None
+    if (prewarm or prewarm_popular) and cache_ttl > 0 and cache_size > 0:
+        prewarmer = Prewarmer(
+            refresh,
+            urls=prewarm,
+            interval=(
+                0.8 * cache_ttl
+                if prewarm_interval is None
+                else prewarm_interval
+            ),
+            jitter=prewarm_jitter,
+            max_workers=prewarm_workers,
+            popular=prewarm_popular,
+        )
+    elif prewarm or prewarm_popular:
+        logger.warning("Caching is disabled, so no pages will be prewarmed")
+    app.config["PREWARMER"] = prewarmer
+
+    @app.after_request
+    def count_hit(response):
+        request = flask.request
+        if (
+            prewarmer is not None
+            and request.endpoint in PREWARM_ENDPOINTS
+            and not request.environ.get(REFRESH)
+            and response.status_code in (200, 304)
+        ):
+            prewarmer.hit(request.full_path.rstrip("?"))
+        return response
+
+    # The issue types and WBS prefixes (None for any) on which each page
+    # depends, keyed by request URL, for the most recently requested pages.
+    views = OrderedDict()
+    views_lock = threading.Lock()
+
+    def track(issue_types, prefixes):
+        with views_lock:
+            views[flask.request.full_path] = (issue_types, prefixes)
+            views.move_to_end(flask.request.full_path)
+            while len(views) > 2 * cache_size:
+                views.popitem(last=False)
+
+    def source(issue_types, wbs, stream=True):
+        # Return a function which fetches the issues of issue_types under
+        # wbs (comma-separated WBS prefixes, or None for any) for the
+        # current request.
+        prefixes = None if wbs is None else split_wbs(wbs)
+        track(issue_types, prefixes)
+
+        def fetch():
+            if project_snapshot:
+                sync()
+            return fetch_issues(
+                server, issue_types, prefixes, snapshot, stream, calendar()
+            )
+
+        return fetch
+
     @app.route("/wbs/<wbs>", defaults={"fmt": DEFAULT_FMT})
     @app.route("/wbs/<fmt>/<wbs>")
     def get_formatted_graph(fmt, wbs):
         if fmt not in FMTS:
             flask.abort(404)
-        issues = get_issues(
-            server, build_query(("Milestone", "Meta-epic"), wbs)
-        )
-        graph = graphviz.Source(
-            jira2dot(
-                issues,
-                attr_func=attr_func,
-                rank_func=rank_func,
-                ranks=cycles(),
+        if fmt == "dot":
+            return send_streamed(
+                cache,
+                profiled_stream(
+                    metrics,
+                    partial(
+                        render_dot,
+                        source(("Milestone", "Meta-epic"), wbs),
+                        calendar(),
+                    ),
+                    route="/wbs/dot",
+                    wbs=wbs_prefix(wbs),
+                ),
+                "text/vnd.graphviz",
+            )
+        return send_cached(
+            cache,
+            profiled_call(
+                metrics,
+                partial(
+                    render_graph,
+                    source(("Milestone", "Meta-epic"), wbs, stream=False),
+                    fmt,
+                    renderer,
+                    calendar(),
+                ),
+                route=f"/wbs/{fmt}",
+                wbs=wbs_prefix(wbs),
             ),
-            format=fmt,
         )
-        with tempdir() as dirname:
-            graph.render("graph", cleanup=True, directory=dirname)
-            return flask.send_file(
-                os.path.join(dirname, f"graph{os.path.extsep}{fmt}")
-            )
 
     @app.route("/wbs/csv/<wbs>")
     def get_csv(wbs):
-        return render_text(
-            server,
-            build_query(("Milestone",), wbs),
-            partial(
-                jira2txt,
-                csv=True,
-                show_key=True,
-                show_title=True,
-                url_base=(
-                    urljoin(server, "/browse")
-                    if flask.request.args.get("link")
-                    else ""
+        return send_streamed(
+            cache,
+            profiled_stream(
+                metrics,
+                partial(
+                    stream_text,
+                    source(("Milestone",), wbs),
+                    partial(
+                        pivot_csv,
+                        show_key=True,
+                        show_title=True,
+                        calendar=calendar(),
+                        url_base=(
+                            urljoin(server, "/browse")
+                            if flask.request.args.get("link")
+                            else ""
+                        ),
+                        group_wbs=bool(flask.request.args.get("group")),
+                    ),
                 ),
+                route="/wbs/csv",
+                wbs=wbs_prefix(wbs),
             ),
+            "text/html",
         )
 
     @app.route("/wbs/tab/<wbs>")
     def get_tab(wbs):
-        return render_text(
-            server,
-            build_query(("Milestone",), wbs),
-            partial(jira2txt, csv=False),
+        return send_cached(
+            cache,
+            profiled_call(
+                metrics,
+                partial(
+                    render_text,
+                    source(("Milestone",), wbs, stream=False),
+                    partial(
+                        jira2txt,
+                        csv=False,
+                        calendar=calendar(),
+                        group_wbs=bool(flask.request.args.get("group")),
+                    ),
+                ),
+                route="/wbs/tab",
+                wbs=wbs_prefix(wbs),
+            ),
         )
 
     @app.route("/wbs/sanity/<wbs>")
     def get_sanity(wbs):
         def sanity_wrapper(issues):
-            return check_sanity(issues) or "No errors found."
+            return (
+                check_sanity(issues, calendar=calendar()) or "No errors found."
+            )
 
-        return render_text(
-            server,
-            build_query(("Milestone", "Meta-epic"), wbs),
-            sanity_wrapper,
+        return send_cached(
+            cache,
+            profiled_call(
+                metrics,
+                partial(
+                    render_text,
+                    source(("Milestone", "Meta-epic"), wbs, stream=False),
+                    sanity_wrapper,
+                ),
+                route="/wbs/sanity",
+                wbs=wbs_prefix(wbs),
+            ),
         )
 
     @app.route("/kpm")
     def get_kpm():
-        return render_text(
-            server,
-            build_query(('"Key Metric"',), None),
-            partial(jirakpm2txt, server=server, csv=False),
+        if project_snapshot:
+            fetch = source(('"Key Metric"',), None, stream=False)
+        else:
+            fetch = partial(
+                get_issues,
+                server,
+                build_query(('"Key Metric"',), None),
+                fields=RECORD_FIELDS,
+            )
+        # The metrics come from issues in other projects too, so any change
+        # may affect them.
+        track(None, None)
+        return send_cached(
+            cache,
+            profiled_call(
+                metrics,
+                partial(
+                    render_text,
+                    fetch,
+                    partial(
+                        jirakpm2txt,
+                        server=server,
+                        csv=False,
+                        calendar=calendar(),
+                    ),
+                ),
+                route="/kpm",
+                wbs="",
+            ),
+        )
+
+    @app.route("/rfc")
+    def get_rfc():
+        return send_cached(
+            cache,
+            profiled_call(
+                metrics,
+                lambda: make_response(
+                    "<pre>" + rfc_status(server) + "</pre>", "text/html"
+                ),
+                route="/rfc",
+                wbs="",
+            ),
+        )
+
+    @app.route("/metrics")
+    def get_metrics():
+        return flask.Response(
+            metrics.render(), mimetype="text/plain; version=0.0.4"
         )
 
+    @app.route("/cache")
+    def get_cache():
+        now = cache.clock()
+        return flask.jsonify(
+            ttl=cache.ttl,
+            entries=[
+                {
+                    "url": url,
+                    "age": now - entry.created,
+                    "bytes": len(entry.body),
+                    "mimetype": entry.mimetype,
+                }
+                for url, entry in cache.items()
+            ],
+            prewarm=None if prewarmer is None else prewarmer.status(),
+            snapshot=snapshot_status(snapshot),
+        )
+
+    if webhooks:
+
+        @app.route("/webhook", methods=["POST"])
+        def post_webhook():
+            secret = flask.request.args.get("secret", "")
+            if webhook_secret and not hmac.compare_digest(
+                secret, webhook_secret
+            ):
+                flask.abort(403)
+            try:
+                change = snapshot.apply(flask.request.get_json(silent=True))
+            except ValueError as error:
+                return flask.jsonify(error=str(error)), 400
+
+            # Discard the cached pages which the change affects.
+            with views_lock:
+                invalidated = [
+                    url
+                    for url, (issue_types, prefixes) in views.items()
+                    if change.affects(issue_types, prefixes)
+                ]
+            for url in invalidated:
+                cache.discard(url)
+            return flask.jsonify(
+                event=change.event, key=change.key, invalidated=invalidated
+            )
+
     return app
 
 
@@ -123,5 +658,15 @@ def build_server(server):
 #
 # $ gunicorn -w2 -b 0.0.0.0:8080 lsst.sqre.jiraserver:app
 #
-# Server name is not configurable for now.
-app = build_server(SERVER)
+# Server name is not configurable for now. The app is only built when first
+# used, so that importing this module (e.g. for build_server) does not.
+def __getattr__(name):
+    if name != "app":
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    with _app_lock:
+        if "app" not in globals():
+            globals()["app"] = build_server(SERVER)
+    return globals()["app"]
+
+
+_app_lock = threading.Lock()
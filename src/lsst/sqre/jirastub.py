@@ -0,0 +1,472 @@
+"""
+Module for a local stand-in for a JIRA server.
+
+The stub serves a fixed set of issues through the parts of the JIRA REST API
+used by jirakit (``serverInfo``, ``field``, ``search``, ``issue`` and project
+``versions``), so that the library, `lsst.sqre.jiraserver` and the scripts in
+``bin/`` can be pointed at it with ``--server`` and run without the
+production JIRA.
+
+Searches are evaluated against the issues with a small subset of JQL: field
+comparisons with ``=``, ``!=``, ``~``, ``!~``, ``<``, ``<=``, ``>``, ``>=``,
+``in`` and ``not in``, combined with ``AND``, ``OR``, ``NOT`` and
+parentheses, followed by an optional ``ORDER BY``. Dates are compared to the
+minute, ignoring time zones. A request which exactly matches a recorded
+fixture (see `lsst.sqre.fixtures`) is answered with the recording instead.
+"""
+
+import re
+import time
+from datetime import datetime, timedelta, timezone
+
+import flask
+
+from .fixtures import fixture_key
+
+PAGE_SIZE = 50  # Maximum number of issues returned per page of a search
+LATENCY = 0.0  # Seconds by which every response is delayed
+
+# The fields known to the stub, as returned by /rest/api/2/field. The JQL
+# names of custom fields are matched without regard to case.
+FIELDS = [
+    {"id": "summary", "name": "Summary", "custom": False},
+    {"id": "description", "name": "Description", "custom": False},
+    {"id": "issuetype", "name": "Issue Type", "custom": False},
+    {"id": "fixVersions", "name": "Fix Version/s", "custom": False},
+    {"id": "resolution", "name": "Resolution", "custom": False},
+    {"id": "status", "name": "Status", "custom": False},
+    {"id": "issuelinks", "name": "Linked Issues", "custom": False},
+    {"id": "updated", "name": "Updated", "custom": False},
+    {"id": "duedate", "name": "Due Date", "custom": False},
+    {"id": "project", "name": "Project", "custom": False},
+    {"id": "customfield_10500", "name": "WBS", "custom": True},
+    {"id": "customfield_10502", "name": "Team", "custom": True},
+    {"id": "customfield_10900", "name": "Cycle", "custom": True},
+    {"id": "customfield_11000", "name": "Metric Value", "custom": True},
+    {"id": "customfield_11001", "name": "Metric Units", "custom": True},
+    {"id": "customfield_10600", "name": "Epic Link", "custom": True},
+]
+
+# JQL names which differ from the names of the fields they search.
+JQL_ALIASES = {
+    "fixversion": "fixVersions",
+    "type": "issuetype",
+    "issuetype": "issuetype",
+}
+
+TOKEN = re.compile(
+    r"""\s*(?:
+        (?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+        |(?P<op>!=|!~|>=|<=|=|~|<|>|\(|\)|,)
+        |(?P<word>[^\s"'=!~<>(),]+)
+    )""",
+    re.VERBOSE,
+)
+
+DATE_FORMATS = ("%Y/%m/%d %H:%M", "%Y-%m-%d %H:%M", "%Y/%m/%d", "%Y-%m-%d")
+
+# Dates relative to the present, such as "-15m", and the units they may use.
+RELATIVE_DATE = re.compile(r"^-(\d+)([mhdw])$")
+RELATIVE_UNITS = {"m": "minutes", "h": "hours", "d": "days", "w": "weeks"}
+
+
+class JqlError(ValueError):
+    """Raised when a query is not in the subset of JQL understood."""
+
+
+def tokenize(jql):
+    """Split a JQL query into a list of (kind, text) tokens, where kind is
+    "string", "op" or "word".
+    """
+    tokens = []
+    position = 0
+    jql = jql.rstrip()
+    while position < len(jql):
+        match = TOKEN.match(jql, position)
+        if match is None or match.end() == position:
+            raise JqlError(f"Cannot parse {jql[position:]!r}")
+        kind = match.lastgroup
+        text = match.group(kind)
+        if kind == "string":
+            text = re.sub(r"\\(.)", r"\1", text[1:-1])
+        tokens.append((kind, text))
+        position = match.end()
+    return tokens
+
+
+class Query:
+    """A parsed JQL query.
+
+    Args:
+        jql: The query.
+        fields: List of field descriptions, as `FIELDS`.
+    """
+
+    def __init__(self, jql, fields=FIELDS):
+        self._ids = {}
+        for field in fields:
+            self._ids[field["id"].lower()] = field["id"]
+            self._ids[field["name"].lower()] = field["id"]
+        self._ids.update(JQL_ALIASES)
+        self._tokens = tokenize(jql)
+        self._position = 0
+        if not self._tokens or self._peek_word() == "order":
+            self.match = _always
+        else:
+            self.match = self._parse_or()
+        self.order_by = self._parse_order_by()
+        if self._position < len(self._tokens):
+            raise JqlError(f"Unexpected {self._tokens[self._position][1]!r}")
+
+    def filter(self, issues):
+        """Return a list of the issues (raw JSON) matching the query, in the
+        order it specifies.
+        """
+        matched = [issue for issue in issues if self.match(issue)]
+        # Sort by each key in turn, least significant first.
+        for field, descending in reversed(self.order_by):
+            matched.sort(
+                key=lambda issue: _sort_key(self._values(issue, field)),
+                reverse=descending,
+            )
+        return matched
+
+    def _peek(self):
+        if self._position < len(self._tokens):
+            return self._tokens[self._position]
+        return None
+
+    def _peek_word(self):
+        token = self._peek()
+        if token is not None and token[0] == "word":
+            return token[1].lower()
+        return None
+
+    def _next(self):
+        if self._position >= len(self._tokens):
+            raise JqlError("Unexpected end of query")
+        token = self._tokens[self._position]
+        self._position += 1
+        return token
+
+    def _expect(self, text):
+        kind, found = self._next()
+        if found.lower() != text:
+            raise JqlError(f"Expected {text!r}, found {found!r}")
+
+    def _parse_or(self):
+        terms = [self._parse_and()]
+        while self._peek_word() == "or":
+            self._next()
+            terms.append(self._parse_and())
+        if len(terms) == 1:
+            return terms[0]
+        return lambda issue: any(term(issue) for term in terms)
+
+    def _parse_and(self):
+        terms = [self._parse_not()]
+        while self._peek_word() == "and":
+            self._next()
+            terms.append(self._parse_not())
+        if len(terms) == 1:
+            return terms[0]
+        return lambda issue: all(term(issue) for term in terms)
+
+    def _parse_not(self):
+        if self._peek_word() == "not":
+            self._next()
+            term = self._parse_not()
+            return lambda issue: not term(issue)
+        if self._peek() == ("op", "("):
+            self._next()
+            term = self._parse_or()
+            self._expect(")")
+            return term
+        return self._parse_clause()
+
+    def _parse_clause(self):
+        _, name = self._next()
+        field = self._field_id(name)
+        kind, op = self._next()
+        op = op.lower()
+        if op == "not":
+            self._expect("in")
+            op = "not in"
+        if op in ("in", "not in"):
+            self._expect("(")
+            values = []
+            while True:
+                values.append(self._next()[1])
+                _, separator = self._next()
+                if separator == ")":
+                    break
+                if separator != ",":
+                    raise JqlError(f"Expected ',' or ')', found {separator!r}")
+            test = _membership(values, op == "not in")
+        elif kind == "op" and op in _COMPARISONS:
+            test = _COMPARISONS[op](self._next()[1])
+        else:
+            raise JqlError(f"Unsupported operator {op!r}")
+        return lambda issue: test(self._values(issue, field))
+
+    def _parse_order_by(self):
+        if self._peek_word() != "order":
+            return []
+        self._next()
+        self._expect("by")
+        order_by = []
+        while True:
+            _, name = self._next()
+            descending = False
+            if self._peek_word() in ("asc", "desc"):
+                descending = self._next()[1].lower() == "desc"
+            order_by.append((self._field_id(name), descending))
+            if self._peek() == ("op", ","):
+                self._next()
+            else:
+                return order_by
+
+    def _field_id(self, name):
+        if name.lower() in ("key", "issuekey", "id", "issue"):
+            return "key"
+        try:
+            return self._ids[name.lower()]
+        except KeyError:
+            raise JqlError(f"Unknown field {name!r}")
+
+    def _values(self, issue, field):
+        # Return a list of the (string) values of field in issue.
+        if field == "key":
+            return [issue["key"]]
+        if field == "project":
+            return [issue["key"].split("-")[0]]
+        return _strings(issue.get("fields", {}).get(field))
+
+
+def _strings(value):
+    # Convert a JSON field value to a list of strings.
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return [s for item in value for s in _strings(item)]
+    if isinstance(value, dict):
+        for name in ("name", "value", "key"):
+            if name in value:
+                return [str(value[name])]
+        return []
+    return [str(value)]
+
+
+def _always(issue):
+    return True
+
+
+def _membership(values, negate):
+    values = {value.lower() for value in values}
+
+    def test(found):
+        return any(v.lower() in values for v in found) != negate
+
+    return test
+
+
+def _contains(pattern, negate=False):
+    # JIRA text search; a trailing * matches any suffix.
+    pattern = pattern.lower()
+
+    def test(found):
+        for value in found:
+            value = value.lower()
+            if pattern.endswith("*"):
+                if value.startswith(pattern[:-1]):
+                    return not negate
+            elif pattern in value:
+                return not negate
+        return negate
+
+    return test
+
+
+def _ordered(compare):
+    def make_test(limit):
+        limit = _comparable(limit)
+        return lambda found: any(
+            compare(_comparable(value), limit) for value in found
+        )
+
+    return make_test
+
+
+_COMPARISONS = {
+    "=": lambda value: _membership([value], False),
+    "!=": lambda value: _membership([value], True),
+    "~": lambda value: _contains(value),
+    "!~": lambda value: _contains(value, negate=True),
+    "<": _ordered(lambda a, b: a < b),
+    "<=": _ordered(lambda a, b: a <= b),
+    ">": _ordered(lambda a, b: a > b),
+    ">=": _ordered(lambda a, b: a >= b),
+}
+
+
+def _comparable(value):
+    # Dates in JQL or in JIRA's timestamps are converted to "YYYY-MM-DD
+    # HH:MM" strings, which compare correctly; anything else is unchanged.
+    # Relative dates are taken to be in UTC.
+    match = RELATIVE_DATE.match(value)
+    if match is not None:
+        delta = timedelta(**{RELATIVE_UNITS[match[2]]: int(match[1])})
+        return (datetime.now(timezone.utc) - delta).strftime("%Y-%m-%d %H:%M")
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).strftime("%Y-%m-%d %H:%M")
+        except ValueError:
+            pass
+    if re.match(r"\d{4}-\d\d-\d\dT\d\d:\d\d", value):
+        return value[:16].replace("T", " ")
+    return value
+
+
+def _sort_key(values):
+    # Issue keys sort by project then number; missing values sort last.
+    if not values:
+        return (1, ())
+    value = values[0]
+    match = re.match(r"^([A-Z][A-Z0-9]*)-(\d+)$", value)
+    if match:
+        return (0, (match.group(1), int(match.group(2))))
+    return (0, ("", value))
+
+
+def _project_fields(issue, names):
+    # Return a copy of issue with only the requested fields.
+    if not names or any(name in ("*all", "*navigable") for name in names):
+        return issue
+    projected = {k: v for k, v in issue.items() if k != "fields"}
+    projected["fields"] = {
+        name: issue.get("fields", {}).get(name)
+        for name in names
+        if not name.startswith("-")
+    }
+    return projected
+
+
+def _requested_fields(args):
+    # Fields may be given as a comma-separated list, repeated, or both.
+    return [
+        name for value in args.getlist("fields") for name in value.split(",")
+    ]
+
+
+def build_stub(
+    issues,
+    fixtures=None,
+    page_size=PAGE_SIZE,
+    latency=LATENCY,
+    fields=FIELDS,
+    versions=None,
+):
+    """Return a Flask application serving issues through the JIRA REST API.
+
+    Args:
+        issues: List of the raw JSON of the issues to serve.
+        fixtures: Dict of recorded responses, as returned by
+            `lsst.sqre.fixtures.load_fixtures`, which are served in
+            preference to searching issues.
+        page_size: Maximum number of issues in each page of search results.
+        latency: Seconds by which to delay every response.
+        fields: List of field descriptions, as `FIELDS`.
+        versions: Dict mapping project key to a list of version names. By
+            default, the fixVersions of the project's issues are used, in
+            the order in which they first appear.
+    """
+    app = flask.Flask(__name__)
+    fixtures = fixtures or {}
+    by_key = {issue["key"]: issue for issue in issues}
+
+    @app.before_request
+    def delay():
+        if latency:
+            time.sleep(latency)
+
+    @app.before_request
+    def replay():
+        key = fixture_key(
+            flask.request.method,
+            flask.request.path,
+            flask.request.args.items(multi=True),
+        )
+        fixture = fixtures.get(key)
+        if fixture is not None:
+            return flask.jsonify(fixture["body"]), fixture["status"]
+
+    @app.route("/rest/api/2/serverInfo")
+    def server_info():
+        return flask.jsonify(
+            baseUrl=flask.request.host_url.rstrip("/"),
+            version="7.0.0",
+            versionNumbers=[7, 0, 0],
+            deploymentType="Server",
+            serverTitle="jirakit stub",
+        )
+
+    @app.route("/rest/api/2/field")
+    def get_fields():
+        return flask.jsonify(fields)
+
+    @app.route("/rest/api/2/search", methods=["GET", "POST"])
+    def search():
+        args = flask.request.args
+        if flask.request.method == "POST":
+            body = flask.request.get_json(silent=True) or {}
+            args = _PostArgs(body)
+        try:
+            matched = Query(args.get("jql", ""), fields).filter(issues)
+        except JqlError as error:
+            return flask.jsonify(errorMessages=[str(error)]), 400
+        start = int(args.get("startAt", 0))
+        size = min(int(args.get("maxResults", page_size)), page_size)
+        end = start + size
+        names = _requested_fields(args)
+        return flask.jsonify(
+            startAt=start,
+            maxResults=size,
+            total=len(matched),
+            issues=[_project_fields(i, names) for i in matched[start:end]],
+        )
+
+    @app.route("/rest/api/2/issue/<key>")
+    def get_issue(key):
+        if key not in by_key:
+            return flask.jsonify(errorMessages=["Issue does not exist"]), 404
+        names = _requested_fields(flask.request.args)
+        return flask.jsonify(_project_fields(by_key[key], names))
+
+    @app.route("/rest/api/2/project/<project>/versions")
+    def get_versions(project):
+        if versions is not None:
+            names = versions.get(project, [])
+        else:
+            names = {}
+            for issue in issues:
+                if issue["key"].split("-")[0] == project:
+                    for version in issue["fields"].get("fixVersions") or []:
+                        names.setdefault(version["name"])
+        return flask.jsonify(
+            [{"id": str(n), "name": name} for n, name in enumerate(names)]
+        )
+
+    return app
+
+
+class _PostArgs:
+    # Gives a POSTed search body the interface of request.args.
+    def __init__(self, body):
+        self._body = body
+
+    def get(self, name, default=None):
+        return self._body.get(name, default)
+
+    def getlist(self, name):
+        value = self._body.get(name) or []
+        return [value] if isinstance(value, str) else list(value)
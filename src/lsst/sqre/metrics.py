@@ -0,0 +1,300 @@
+"""
+Module for timing the stages of jirakit requests, and reporting the timings
+in the Prometheus text format or as structured logs.
+
+A `Profile` collects the time spent in each stage of one request (fetching
+issues from JIRA, transforming them into a graph or table, and rendering the
+result), together with the number of pages of search results and bytes
+received from JIRA. While a profile is active on a thread, the `stage` and
+`timed` helpers record into it, and JIRA clients made by
+`lsst.sqre.jirakit` count their responses into it; when no profile is
+active they do nothing.
+"""
+
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Upper bounds, in seconds, of the histogram buckets.
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# Metric names, with their Prometheus types and help texts.
+METRICS = OrderedDict(
+    [
+        (
+            "jirakit_request_seconds",
+            ("histogram", "Time taken to produce an uncached response."),
+        ),
+        (
+            "jirakit_stage_seconds",
+            ("histogram", "Time spent in each stage of producing a response."),
+        ),
+        (
+            "jirakit_fetch_pages_total",
+            ("counter", "Pages of search results fetched from JIRA."),
+        ),
+        (
+            "jirakit_fetch_bytes_total",
+            ("counter", "Bytes of responses received from JIRA."),
+        ),
+    ]
+)
+
+# Top-level WBS elements (e.g. 02C), by which requests are labelled.
+WBS_ELEMENT = re.compile(r"^\d\d[A-Z]?$")
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+class Profile:
+    """The time spent in each stage of one request.
+
+    Stages may be nested; time spent in an inner stage is not counted
+    towards the stage around it, so the times of all stages add up to the
+    time spent in any of them.
+
+    Args:
+        clock: Function returning the current time in seconds.
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.started = clock()
+        self.seconds = OrderedDict()
+        self.pages = 0
+        self.bytes = 0
+        self._stack = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        """Count the time spent in a with block towards stage name."""
+        now = self.clock()
+        if self._stack:
+            self._add(self._stack[-1], now)
+        self._stack.append([name, now])
+        try:
+            yield
+        finally:
+            now = self.clock()
+            self._add(self._stack.pop(), now)
+            if self._stack:
+                self._stack[-1][1] = now
+
+    def _add(self, frame, now):
+        name, since = frame
+        self.seconds[name] = self.seconds.get(name, 0.0) + now - since
+        frame[1] = now
+
+    def elapsed(self):
+        """Return the time since the profile was created."""
+        return self.clock() - self.started
+
+    def count_response(self, response, *args, **kwargs):
+        # A requests response hook. May be called from any thread.
+        size = len(response.content or b"")
+        with self._lock:
+            self.bytes += size
+            if response.request.path_url.split("?")[0].endswith("/search"):
+                self.pages += 1
+
+    def as_dict(self):
+        """Return the timings as a dict suitable for JSON."""
+        return {
+            "seconds": self.elapsed(),
+            "stages": dict(self.seconds),
+            "pages": self.pages,
+            "bytes": self.bytes,
+        }
+
+
+def active():
+    """Return the profile active on this thread, or None."""
+    return getattr(_local, "profile", None)
+
+
+@contextmanager
+def activate(profile):
+    """Make profile the active profile on this thread for a with block."""
+    previous = active()
+    _local.profile = profile
+    try:
+        yield profile
+    finally:
+        _local.profile = previous
+
+
+def bind(func):
+    """Return a function which calls func with the profile active on this
+    thread (if any) active, on whichever thread it is called.
+    """
+    profile = active()
+
+    def call(*args, **kwargs):
+        with activate(profile):
+            return func(*args, **kwargs)
+
+    return call
+
+
+def activate_iter(profile, iterable):
+    # Yield the items of iterable, with profile active while each is made.
+    # Streamed responses are produced after the view function has returned.
+    iterator = iter(iterable)
+    while True:
+        with activate(profile):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+@contextmanager
+def stage(name):
+    """Count the time spent in a with block towards stage name of the
+    active profile, if any.
+    """
+    profile = active()
+    if profile is None:
+        yield
+    else:
+        with profile.stage(name):
+            yield
+
+
+def timed(name, iterable):
+    # Yield the items of iterable, counting the time taken to make each
+    # towards stage name of the active profile.
+    iterator = iter(iterable)
+    while True:
+        with stage(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """A thread-safe collection of histograms and counters of request
+    timings, labelled by route and WBS prefix.
+
+    Args:
+        buckets: Upper bounds of the histogram buckets, in seconds.
+        log: If set, the timings of every recorded profile are also logged
+            as a line of JSON.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, log=False):
+        self.buckets = tuple(sorted(buckets))
+        self.log = log
+        self._lock = threading.Lock()
+        self._values = {name: {} for name in METRICS}
+
+    def observe(self, name, value, **labels):
+        """Add value to histogram name with the given labels."""
+        key = _label_key(labels)
+        with self._lock:
+            series = self._values[name]
+            if key not in series:
+                series[key] = _Histogram(self.buckets)
+            series[key].observe(value)
+
+    def inc(self, name, value=1, **labels):
+        """Add value to counter name with the given labels."""
+        key = _label_key(labels)
+        with self._lock:
+            series = self._values[name]
+            series[key] = series.get(key, 0) + value
+
+    def record(self, profile, **labels):
+        """Add the timings of profile to the metrics, with the given
+        labels.
+        """
+        self.observe("jirakit_request_seconds", profile.elapsed(), **labels)
+        for name, seconds in profile.seconds.items():
+            self.observe(
+                "jirakit_stage_seconds", seconds, stage=name, **labels
+            )
+        self.inc("jirakit_fetch_pages_total", profile.pages, **labels)
+        self.inc("jirakit_fetch_bytes_total", profile.bytes, **labels)
+        if self.log:
+            logger.info(json.dumps(dict(labels, **profile.as_dict())))
+
+    def render(self):
+        """Return the metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for name, (kind, help_text) in METRICS.items():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for key, value in sorted(self._values[name].items()):
+                    if kind == "counter":
+                        lines.append(f"{name}{_labels(key)} {value}")
+                        continue
+                    for bound, count in zip(value.buckets, value.counts):
+                        le = key + (("le", _number(bound)),)
+                        lines.append(f"{name}_bucket{_labels(le)} {count}")
+                    le = key + (("le", "+Inf"),)
+                    lines.append(f"{name}_bucket{_labels(le)} {value.count}")
+                    lines.append(f"{name}_sum{_labels(key)} {value.sum!r}")
+                    lines.append(f"{name}_count{_labels(key)} {value.count}")
+        return "\n".join(lines) + "\n"
+
+
+def wbs_prefix(wbs):
+    """Return the label of a request for wbs: its top-level WBS element,
+    ``multiple`` for a comma-separated list, or ``other`` if it is not a
+    WBS prefix. The labels are drawn from a small set, so that clients
+    cannot add series to the metrics without limit.
+    """
+    if not wbs:
+        return ""
+    if "," in wbs:
+        return "multiple"
+    element = wbs.rstrip("*").split(".")[0]
+    return element if WBS_ELEMENT.match(element) else "other"
+
+
+def _label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _labels(key):
+    if not key:
+        return ""
+    return "{%s}" % ",".join(
+        '{}="{}"'.format(
+            name,
+            value.replace("\\", "\\\\")
+            .replace('"', '\\"')
+            .replace("\n", "\\n"),
+        )
+        for name, value in key
+    )
+
+
+def _number(value):
+    return repr(float(value))
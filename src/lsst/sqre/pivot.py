@@ -0,0 +1,129 @@
+"""
+Module for pivoting issues into tables with one column per cycle.
+
+A `Pivot` holds each row as a list of cells indexed by the rank of the cycle
+in a `lsst.sqre.jirakit.CycleCalendar`, rather than as a dict keyed by cycle
+name, and writes the table as CSV one row at a time.
+"""
+
+import csv
+import io
+from itertools import chain
+
+from .jirakit import CALENDAR, CycleCalendar
+
+
+class Pivot:
+    """A table with some leading columns followed by one column per cycle.
+
+    Rows are created with `row`, which returns the index of the row for use
+    with `set`, `add` and `get`. Giving a key to `row` returns the existing
+    row with that key, if there is one, so that several issues (e.g. those
+    in one WBS element) can share a row.
+
+    Cycles which are not in the calendar are given columns of their own
+    after those of the calendar, in the order in which they are first seen.
+
+    Args:
+        columns: Names of the leading columns.
+        calendar: Ordered cycle names, or a `CycleCalendar`.
+        fill: Value of cells to which nothing has been set.
+        separator: If given, a value added to a cell which already holds one
+            is joined to it with separator; otherwise it replaces it.
+    """
+
+    def __init__(self, columns, calendar=CALENDAR, fill="", separator=None):
+        if not isinstance(calendar, CycleCalendar):
+            calendar = CycleCalendar(calendar)
+        self.columns = tuple(columns)
+        self.calendar = calendar
+        self.fill = fill
+        self.separator = separator
+        self._extra = {}
+        self._leading = []
+        self._cells = []
+        self._keys = {}
+
+    def __len__(self):
+        return len(self._leading)
+
+    @property
+    def header(self):
+        """Names of all the columns."""
+        return list(self.columns) + list(self.calendar) + list(self._extra)
+
+    def row(self, *values, key=None):
+        """Return the index of the row with key, or of a new row whose
+        leading columns hold values.
+        """
+        if key is not None and key in self._keys:
+            return self._keys[key]
+        index = len(self._leading)
+        self._leading.append(list(values))
+        self._cells.append([None] * len(self.calendar))
+        if key is not None:
+            self._keys[key] = index
+        return index
+
+    def get(self, index, cycle):
+        """Return the value in row index for cycle, or None."""
+        rank = self._rank(cycle)
+        cells = self._cells[index]
+        return cells[rank] if rank < len(cells) else None
+
+    def set(self, index, cycle, value):
+        """Set the value in row index for cycle."""
+        rank = self._rank(cycle)
+        cells = self._cells[index]
+        if rank >= len(cells):
+            cells.extend([None] * (rank + 1 - len(cells)))
+        cells[rank] = value
+
+    def add(self, index, cycle, value):
+        """Add value to row index for cycle, joining it to any value already
+        there if there is a separator.
+        """
+        previous = self.get(index, cycle)
+        if self.separator is not None and previous is not None:
+            value = f"{previous}{self.separator}{value}"
+        self.set(index, cycle, value)
+
+    def rows(self):
+        """Yield each row as a list of values, with empty cells filled."""
+        width = len(self.calendar) + len(self._extra)
+        for leading, cells in zip(self._leading, self._cells):
+            row = leading + [
+                self.fill if value is None else value for value in cells
+            ]
+            row.extend([self.fill] * (width - len(cells)))
+            yield row
+
+    def iter_csv(self):
+        """Yield the table as CSV, one line at a time, starting with the
+        header.
+        """
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        for row in chain([self.header], self.rows()):
+            writer.writerow(row)
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+
+    def to_text(self, csv=False):
+        """Return the table as CSV, or as a plain text table."""
+        if csv:
+            return "".join(self.iter_csv())
+        from tabulate import tabulate
+
+        return tabulate(
+            list(self.rows()), headers=self.header, tablefmt="pipe"
+        )
+
+    def _rank(self, cycle):
+        rank = self.calendar.ranks.get(cycle)
+        if rank is not None:
+            return rank
+        if cycle not in self._extra:
+            self._extra[cycle] = len(self.calendar) + len(self._extra)
+        return self._extra[cycle]
@@ -0,0 +1,208 @@
+"""
+Module for refreshing the pages cached by jiraserver in the background.
+
+A `Prewarmer` refreshes a set of page URLs on an interval, so that requests
+for them are always answered from the cache rather than waiting for JIRA and
+Graphviz. The set is made up of configured URLs (see `prewarm_urls`) and,
+optionally, the URLs most requested recently. Each URL is refreshed at a
+jittered interval, so that refreshes do not all reach JIRA at once, and no
+more than a fixed number are refreshed at a time.
+"""
+
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_FMTS = ("pdf", "sanity")  # Formats pre-warmed for each WBS prefix
+DEFAULT_WORKERS = 2  # Maximum number of pages refreshed at a time
+DEFAULT_JITTER = 0.1  # Fraction by which the interval is randomly varied
+
+logger = logging.getLogger(__name__)
+
+
+def prewarm_urls(prefixes, fmts=DEFAULT_FMTS, kpm=True):
+    """Return the URLs of the pages in each of fmts for each WBS prefix,
+    followed by that of the Key Metrics page if kpm is set.
+    """
+    urls = [f"/wbs/{fmt}/{prefix}" for prefix in prefixes for fmt in fmts]
+    if kpm:
+        urls.append("/kpm")
+    return urls
+
+
+class Prewarmer:
+    """Refreshes pages in the background.
+
+    Args:
+        refresh: Function taking a URL, which renders the page and replaces
+            it in the cache. Exceptions are logged and reported by `status`.
+        urls: URLs which are always refreshed; each is first refreshed as
+            soon as the prewarmer runs.
+        interval: Seconds between refreshes of each URL; must be positive.
+        jitter: Fraction by which each interval is randomly lengthened or
+            shortened.
+        max_workers: Maximum number of URLs refreshed at a time.
+        popular: Number of the most requested URLs (see `hit`) which are
+            also refreshed. Request counts are halved every interval, so
+            that URLs which are no longer requested drop out.
+        clock: Function returning the current time in seconds.
+        rng: A `random.Random` used for the jitter.
+
+    Raises:
+        ValueError: If interval is not positive.
+    """
+
+    def __init__(
+        self,
+        refresh,
+        urls=(),
+        interval=240,
+        jitter=DEFAULT_JITTER,
+        max_workers=DEFAULT_WORKERS,
+        popular=0,
+        clock=time.time,
+        rng=None,
+    ):
+        if interval <= 0:
+            raise ValueError(f"Prewarm interval must be positive: {interval}")
+        self.refresh = refresh
+        self.urls = list(urls)
+        self.interval = interval
+        self.jitter = jitter
+        self.max_workers = max_workers
+        self.popular = popular
+        self.clock = clock
+        self.rng = random.Random() if rng is None else rng
+        self._lock = threading.Lock()
+        self._hits = Counter()
+        self._decayed = clock()
+        self._next = {url: self._decayed for url in self.urls}
+        self._status = {}
+        self._running = set()
+        self._executor = None
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def hit(self, url):
+        """Count a request for url towards its popularity."""
+        if self.popular > 0:
+            with self._lock:
+                self._hits[url] += 1
+
+    def due(self):
+        """Return the URLs which should be refreshed now, and schedule their
+        next refreshes.
+        """
+        now = self.clock()
+        with self._lock:
+            self._select(now)
+            urls = [
+                url
+                for url, when in self._next.items()
+                if when <= now and url not in self._running
+            ]
+            for url in urls:
+                self._next[url] = now + self._jittered()
+                self._running.add(url)
+        return urls
+
+    def run_once(self, wait=False):
+        """Start refreshing the URLs which are due.
+
+        Args:
+            wait: If set, refresh them on this thread and return once they
+                are done; otherwise hand them to the worker threads.
+
+        Returns:
+            The URLs refreshed.
+        """
+        urls = self.due()
+        for url in urls:
+            if wait:
+                self._refresh(url)
+            else:
+                self._executor.submit(self._refresh, url)
+        return urls
+
+    def start(self, tick=1.0):
+        """Refresh pages on a background thread, checking every tick seconds
+        for those which are due.
+        """
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="prewarm"
+        )
+        self._thread = threading.Thread(
+            target=self._run, args=(tick,), name="prewarm", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background thread, waiting for refreshes in progress."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._executor.shutdown()
+
+    def status(self):
+        """Return a dict describing, for each URL being refreshed, when it
+        was last refreshed (`refreshed`), how long that took (`seconds`),
+        the error if it failed (`error`), and when it is next due (`next`).
+        """
+        with self._lock:
+            self._select(self.clock())
+            return {
+                url: dict(self._status.get(url, {}), next=when)
+                for url, when in self._next.items()
+            }
+
+    def _run(self, tick):
+        while not self._stopped.wait(tick):
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("Failed to schedule refreshes")
+
+    def _refresh(self, url):
+        started = self.clock()
+        error = None
+        try:
+            self.refresh(url)
+        except Exception as exc:
+            logger.exception("Failed to refresh %s", url)
+            error = str(exc) or type(exc).__name__
+        with self._lock:
+            self._running.discard(url)
+            self._status[url] = {
+                "refreshed": started,
+                "seconds": self.clock() - started,
+                "error": error,
+            }
+
+    def _jittered(self):
+        return self.interval * (1 + self.rng.uniform(-1, 1) * self.jitter)
+
+    def _select(self, now):
+        # Update the URLs being refreshed with the most popular. Must be
+        # called with the lock held.
+        while now - self._decayed >= self.interval:
+            self._decayed += self.interval
+            for url in list(self._hits):
+                self._hits[url] //= 2
+                if not self._hits[url]:
+                    del self._hits[url]
+        wanted = set(self.urls)
+        popular = [
+            url for url, _ in self._hits.most_common() if url not in wanted
+        ]
+        wanted.update(popular[: self.popular])
+        for url in list(self._next):
+            if url not in wanted:
+                del self._next[url]
+                self._status.pop(url, None)
+        for url in wanted:
+            if url not in self._next:
+                # The page was requested recently, so is already cached.
+                self._next[url] = now + self._jittered()
@@ -0,0 +1,131 @@
+"""
+Module for compact, read-only records of JIRA issues.
+
+`jira.Issue` objects keep the complete JSON returned by JIRA, plus a tree of
+resource objects built from it. The records here keep only the fields that
+jirakit reads, in objects with ``__slots__``, while offering the same
+attribute interface (``issue.key``, ``issue.fields.issuetype.name``,
+``issue.fields.issuelinks`` and so on), so they can be used wherever an
+issue is expected.
+"""
+
+import sys
+
+# The fields read by jirakit:
+#  customfield_10500: WBS
+#  customfield_10502: Team
+#  customfield_10900: cycle (DM project)
+#  customfield_11000: metric value
+#  customfield_11001: metric units
+RECORD_FIELDS = (
+    "summary",
+    "description",
+    "issuetype",
+    "fixVersions",
+    "resolution",
+    "status",
+    "issuelinks",
+    "updated",
+    "duedate",
+    "customfield_10500",
+    "customfield_10502",
+    "customfield_10900",
+    "customfield_11000",
+    "customfield_11001",
+)
+
+
+class Named:
+    """A named JIRA value, such as an issue type, status, version or the
+    option chosen in a select field.
+    """
+
+    __slots__ = ("name", "value")
+
+    def __init__(self, name=None, value=None):
+        self.name = name
+        self.value = value
+
+    def __str__(self):
+        return self.name if self.name is not None else str(self.value)
+
+    def __repr__(self):
+        return f"Named({str(self)!r})"
+
+
+class IssueFields:
+    """The fields of an issue. Fields which were not retrieved from JIRA are
+    absent, as they are from `jira.Issue.fields`.
+    """
+
+    __slots__ = RECORD_FIELDS
+
+
+class IssueLink:
+    """A link between issues. Exactly one of ``inwardIssue`` and
+    ``outwardIssue`` is present.
+    """
+
+    __slots__ = ("type", "inwardIssue", "outwardIssue")
+
+
+class IssueRecord:
+    """A compact record of a JIRA issue."""
+
+    __slots__ = ("key", "id", "fields", "_server")
+
+    def __init__(self, key, id=None, fields=None, server=""):
+        self.key = key
+        self.id = id
+        self.fields = IssueFields() if fields is None else fields
+        self._server = server
+
+    def __str__(self):
+        return self.key
+
+    def __repr__(self):
+        return f"<IssueRecord {self.key}>"
+
+    def permalink(self):
+        """Return the URL of the issue in the JIRA web interface."""
+        return f"{self._server}/browse/{self.key}"
+
+    @classmethod
+    def from_raw(cls, raw, server=""):
+        """Make a record from the JSON representation of an issue returned by
+        the JIRA REST API. Fields not in RECORD_FIELDS are discarded.
+        """
+        server = sys.intern(server.rstrip("/"))
+        fields = IssueFields()
+        for name, value in raw.get("fields", {}).items():
+            if name == "issuelinks":
+                fields.issuelinks = [
+                    _link_from_raw(link, server) for link in value
+                ]
+            elif name in IssueFields.__slots__:
+                setattr(fields, name, _value_from_raw(value))
+        return cls(sys.intern(raw["key"]), raw.get("id"), fields, server)
+
+
+def _value_from_raw(value):
+    # Convert a JSON field value: named objects become Named, lists are
+    # converted element by element, and anything else is kept as is.
+    if isinstance(value, list):
+        return [_value_from_raw(item) for item in value]
+    if isinstance(value, dict):
+        name = value.get("name")
+        return Named(
+            None if name is None else sys.intern(name), value.get("value")
+        )
+    return value
+
+
+def _link_from_raw(raw, server):
+    link = IssueLink()
+    link.type = Named(sys.intern(raw["type"]["name"]))
+    for direction in ("inwardIssue", "outwardIssue"):
+        if direction in raw:
+            setattr(
+                link, direction, IssueRecord.from_raw(raw[direction], server)
+            )
+    return link
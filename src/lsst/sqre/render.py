@@ -0,0 +1,172 @@
+"""
+Module for rendering GraphViz graphs away from the web server's request
+threads.
+
+Graphs are laid out in a pool of worker processes. The rendered files are
+kept in a content-addressed cache, keyed by a hash of the dot source and the
+output format, so that a graph is only ever laid out once per format.
+"""
+
+import hashlib
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from shutil import rmtree
+from tempfile import mkdtemp
+
+MAX_WORKERS = 2  # Number of processes performing layouts
+MAX_QUEUE = 8  # Maximum number of layouts waiting for or in progress
+TIMEOUT = 120  # Seconds to wait for a layout to complete
+MAX_FILES = 256  # Maximum number of rendered files to keep
+
+
+class RenderQueueFull(RuntimeError):
+    """Raised when too many layouts are already waiting to be performed."""
+
+
+class RenderTimeout(RuntimeError):
+    """Raised when a layout does not complete within the timeout."""
+
+
+def render_to_file(source, fmt, path):
+    """Lay out the dot source in format fmt, and write the result to path.
+
+    The result is written to a temporary file first, then moved into place,
+    so that readers never see a partial file.
+    """
+    import graphviz
+
+    dirname = mkdtemp(dir=os.path.dirname(path))
+    try:
+        rendered = graphviz.Source(source, format=fmt).render(
+            "graph", directory=dirname, cleanup=True
+        )
+        os.replace(rendered, path)
+    finally:
+        rmtree(dirname, ignore_errors=True)
+    return path
+
+
+class GraphRenderer:
+    """Render dot source to files on a bounded pool of worker processes.
+
+    Args:
+        cache_dir: Directory for rendered files. A temporary directory is
+            created if None.
+        max_workers: Number of worker processes.
+        max_queue: Maximum number of distinct layouts waiting for or in
+            progress; further requests raise `RenderQueueFull`.
+        timeout: Seconds to wait for a layout before raising
+            `RenderTimeout`.
+        max_files: Maximum number of rendered files to keep in cache_dir;
+            the least recently used are removed first.
+        executor: A `concurrent.futures.Executor` to use in place of a
+            process pool.
+        render_func: Function used to perform the rendering; takes the same
+            arguments as `render_to_file`, and must be picklable if a process
+            pool is used.
+    """
+
+    def __init__(
+        self,
+        cache_dir=None,
+        max_workers=MAX_WORKERS,
+        max_queue=MAX_QUEUE,
+        timeout=TIMEOUT,
+        max_files=MAX_FILES,
+        executor=None,
+        render_func=render_to_file,
+    ):
+        if cache_dir is None:
+            cache_dir = mkdtemp(prefix="jirakit-render-")
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.max_files = max_files
+        self.render_func = render_func
+        self._executor = executor
+        self._max_workers = max_workers
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    @property
+    def executor(self):
+        # Workers are only started when the first layout is needed.
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(self._max_workers)
+            return self._executor
+
+    def path_for(self, source, fmt):
+        """Return the cache path for source rendered in format fmt."""
+        digest = hashlib.sha256(f"{fmt}\0{source}".encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}{os.path.extsep}{fmt}")
+
+    def render(self, source, fmt):
+        """Render source in format fmt and return the resulting bytes."""
+        path = self.path_for(source, fmt)
+        try:
+            with open(path, "rb") as f:
+                body = f.read()
+            os.utime(path)
+            return body
+        except FileNotFoundError:
+            pass
+
+        executor = self.executor
+        with self._lock:
+            future = self._pending.get(path)
+            submitted = future is None
+            if submitted:
+                if len(self._pending) >= self.max_queue:
+                    raise RenderQueueFull(
+                        f"{len(self._pending)} layouts already queued"
+                    )
+                future = executor.submit(self.render_func, source, fmt, path)
+                self._pending[path] = future
+        if submitted:
+            # Called immediately if the future has already completed, so
+            # must not be added while holding the lock.
+            future.add_done_callback(lambda _: self._finished(path))
+
+        try:
+            future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            raise RenderTimeout(
+                f"Layout did not complete in {self.timeout} seconds"
+            )
+        with open(path, "rb") as f:
+            return f.read()
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def _finished(self, path):
+        with self._lock:
+            self._pending.pop(path, None)
+        self._prune()
+
+    def _prune(self):
+        # Remove the least recently used files beyond max_files.
+        try:
+            entries = [
+                entry
+                for entry in os.scandir(self.cache_dir)
+                if entry.is_file()
+            ]
+        except FileNotFoundError:
+            return
+        if len(entries) <= self.max_files:
+            return
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        excess = len(entries) - self.max_files
+        for entry in entries[:excess]:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,413 @@
+"""
+Module for an in-memory snapshot of the issues served by jiraserver, kept up
+to date by JIRA webhooks.
+
+Once the issues of some types under a WBS prefix have been fetched from JIRA
+and recorded in the snapshot, later requests for them (or for any WBS
+prefix below it) are answered from memory. JIRA's "issue created", "issue
+updated" and "issue deleted" webhooks are applied to the snapshot as they
+arrive, so it is only as stale as their delivery.
+
+Alternatively, `IssueSnapshot.sync` replaces the whole snapshot with the
+results of a single query for every issue of some types (e.g. all of
+`PROJECT_TYPES`), after which any WBS prefix is answered from memory.
+Webhooks which arrive while that query is made are applied to its results
+too, so that they are not lost when the old contents are replaced.
+
+The issues are indexed by WBS element in a `WbsIndex`, and by issue type and
+fixVersion, so that selecting the issues for a page does not scan the whole
+snapshot.
+"""
+
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from functools import partial
+
+from .jirakit import CALENDAR, key_order, match_wbs
+from .records import IssueRecord
+
+CREATED = "jira:issue_created"
+UPDATED = "jira:issue_updated"
+DELETED = "jira:issue_deleted"
+WEBHOOK_EVENTS = (CREATED, UPDATED, DELETED)
+
+# Issue types held by a snapshot of the whole DLP project.
+PROJECT_TYPES = ("Milestone", "Meta-epic", '"Key Metric"')
+
+DEFAULT_SYNC_INTERVAL = 900  # Seconds between syncs of a whole snapshot
+
+
+class SnapshotChange(
+    namedtuple("SnapshotChange", ["event", "key", "issuetypes", "wbs"])
+):
+    """A change applied to a snapshot from a webhook: the event, the key of
+    the issue, and the sets of its issue types and WBS elements before and
+    after the change.
+    """
+
+    def affects(self, issue_types, prefixes):
+        """Return whether the change may alter the issues of issue_types
+        (None for any) under prefixes (None for any WBS).
+        """
+        if issue_types is not None and not self.issuetypes.intersection(
+            _type_names(issue_types)
+        ):
+            return False
+        if prefixes is None:
+            return True
+        return any(
+            match_wbs(wbs, prefix) for wbs in self.wbs for prefix in prefixes
+        )
+
+
+def covers(loaded, requested):
+    """Return whether every WBS element selected by the prefix requested is
+    also selected by the prefix loaded (see `lsst.sqre.jirakit.match_wbs`).
+    """
+    if loaded.endswith("*"):
+        return requested.rstrip("*").startswith(loaded[:-1])
+    if requested.endswith("*"):
+        return requested.startswith(loaded + ".")
+    return match_wbs(requested, loaded)
+
+
+class _Node:
+    __slots__ = ("children", "keys")
+
+    def __init__(self):
+        self.children = {}
+        self.keys = {}  # Used as an ordered set
+
+
+class WbsIndex:
+    """A trie of WBS elements, one character per level, holding the keys of
+    the issues in each element.
+
+    Every element selected by a prefix (see `lsst.sqre.jirakit.match_wbs`)
+    lies in a single subtree of the trie, so they are found without looking
+    at any others. Not thread-safe.
+    """
+
+    def __init__(self):
+        self._root = _Node()
+
+    def add(self, wbs, key):
+        """Add the issue key to element wbs."""
+        node = self._root
+        for char in wbs:
+            node = node.children.setdefault(char, _Node())
+        node.keys[key] = None
+
+    def remove(self, wbs, key):
+        """Remove the issue key from element wbs, if it is there."""
+        path = [self._root]
+        for char in wbs:
+            node = path[-1].children.get(char)
+            if node is None:
+                return
+            path.append(node)
+        path[-1].keys.pop(key, None)
+        # Prune the nodes left empty.
+        for depth in range(len(wbs), 0, -1):
+            if path[depth].keys or path[depth].children:
+                break
+            del path[depth - 1].children[wbs[depth - 1]]
+
+    def select(self, prefix):
+        """Yield the keys of the issues in the elements selected by prefix,
+        ordered by WBS.
+        """
+        star = prefix.endswith("*")
+        node = self._find(prefix[:-1] if star else prefix)
+        if node is None:
+            return
+        if star:
+            yield from _walk(node)
+            return
+        yield from node.keys
+        if "." in node.children:
+            yield from _walk(node.children["."])
+
+    def _find(self, wbs):
+        node = self._root
+        for char in wbs:
+            node = node.children.get(char)
+            if node is None:
+                return None
+        return node
+
+
+def _walk(node):
+    # Yield the keys in the subtree below node, in lexical order of WBS.
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        yield from node.keys
+        stack.extend(
+            node.children[char] for char in sorted(node.children, reverse=True)
+        )
+
+
+class IssueSnapshot:
+    """A thread-safe, in-memory copy of the issues under some WBS prefixes.
+
+    Args:
+        server: Base URL of the JIRA server, used for issue permalinks.
+        clock: Function returning the current time in seconds.
+    """
+
+    def __init__(self, server="", clock=time.time):
+        self.server = server
+        self.clock = clock
+        self.synced = None
+        self._lock = threading.Lock()
+        self._pending = None  # Webhook changes made during a sync
+        self._issues = OrderedDict()
+        self._loaded = []
+        self._by_wbs = WbsIndex()
+        self._by_type = {}
+        self._by_version = {}
+
+    def __len__(self):
+        with self._lock:
+            return len(self._issues)
+
+    def covers(self, issue_types, prefixes):
+        """Return whether the snapshot holds all the issues of issue_types
+        under every one of prefixes (None for any WBS).
+        """
+        types = _type_names(issue_types)
+        prefixes = ["*"] if prefixes is None else prefixes
+        with self._lock:
+            return all(
+                any(
+                    types <= loaded_types and covers(loaded, prefix)
+                    for loaded_types, loaded in self._loaded
+                )
+                for prefix in prefixes
+            )
+
+    def record(self, issue_types, prefixes, issues):
+        """Yield issues, the complete results of a query for issue_types
+        under prefixes (None for any WBS), adding each to the snapshot.
+        Once the last has been yielded, the snapshot covers issue_types and
+        prefixes.
+        """
+        for issue in issues:
+            with self._lock:
+                self._put(issue)
+            yield issue
+        prefixes = ["*"] if prefixes is None else prefixes
+        with self._lock:
+            self._loaded.extend(
+                (_type_names(issue_types), prefix) for prefix in prefixes
+            )
+
+    def sync(self, issue_types, fetch):
+        """Replace the contents of the snapshot with the issues returned by
+        fetch, a function taking no arguments which makes a query for all
+        the issues of issue_types under any WBS.
+
+        The new contents are fetched and indexed before they replace the
+        old, so that the snapshot may be read (and webhooks applied) in the
+        meantime; the changes made by those webhooks are then made to the
+        new contents too. Only one sync may be made at a time.
+        """
+        with self._lock:
+            self._pending = []
+        try:
+            replacement = IssueSnapshot(self.server)
+            for issue in fetch():
+                replacement._put(issue)
+        except BaseException:
+            with self._lock:
+                self._pending = None
+            raise
+        replacement._loaded = [(_type_names(issue_types), "*")]
+        with self._lock:
+            for event, issue in self._pending:
+                replacement._change(event, issue)
+            self._pending = None
+            self._issues = replacement._issues
+            self._by_wbs = replacement._by_wbs
+            self._by_type = replacement._by_type
+            self._by_version = replacement._by_version
+            self._loaded = [(_type_names(issue_types), "*")]
+            self.synced = self.clock()
+
+    def age(self):
+        """Return the seconds since the snapshot was last synced, or None if
+        it never has been.
+        """
+        return None if self.synced is None else self.clock() - self.synced
+
+    def select(self, issue_types, prefixes, fix_versions=None, calendar=None):
+        """Return a list of the issues of issue_types under any of prefixes
+        (None for any WBS), in the order of the query `build_query` makes
+        for them: by key if prefixes is None, and otherwise by WBS and then
+        by fixVersion, latest first.
+
+        If fix_versions is given, only issues with at least one of those
+        fixVersions are returned. fixVersions are ordered as in calendar
+        (a `lsst.sqre.jirakit.CycleCalendar`; defaults to `CALENDAR`).
+        Issues in the same WBS element and fixVersion are kept in the order
+        in which they were recorded.
+        """
+        if prefixes is None:
+            order = _by_key
+        else:
+            order = partial(
+                _by_wbs, CALENDAR if calendar is None else calendar
+            )
+        prefixes = ["*"] if prefixes is None else prefixes
+        with self._lock:
+            keys = dict.fromkeys(
+                key
+                for prefix in prefixes
+                for key in self._by_wbs.select(prefix)
+            )
+            wanted = _union(self._by_type, _type_names(issue_types))
+            if fix_versions is not None:
+                wanted &= _union(self._by_version, fix_versions)
+            issues = [self._issues[key] for key in keys if key in wanted]
+        issues.sort(key=order)
+        return issues
+
+    def counts(self):
+        """Return the number of issues of each issue type and with each
+        fixVersion, as dicts.
+        """
+        with self._lock:
+            return (
+                {name: len(keys) for name, keys in self._by_type.items()},
+                {name: len(keys) for name, keys in self._by_version.items()},
+            )
+
+    def apply(self, payload):
+        """Apply the JSON payload of a JIRA issue webhook to the snapshot.
+
+        Issues which are not in the snapshot are only added if it covers
+        them.
+
+        Returns:
+            A `SnapshotChange`.
+
+        Raises:
+            ValueError: If the payload is not an issue event.
+        """
+        if not isinstance(payload, dict):
+            raise ValueError("Webhook payload is not a JSON object")
+        event = payload.get("webhookEvent")
+        raw = payload.get("issue")
+        if event not in WEBHOOK_EVENTS or not isinstance(raw, dict):
+            raise ValueError(f"Not an issue event: {event}")
+        if "key" not in raw:
+            raise ValueError("Webhook issue has no key")
+
+        issue = IssueRecord.from_raw(raw, self.server)
+        with self._lock:
+            previous = self._change(event, issue)
+            if self._pending is not None:
+                self._pending.append((event, issue))
+        issues = [issue] if previous is None else [previous, issue]
+        return SnapshotChange(
+            event,
+            issue.key,
+            {_issuetype(issue) for issue in issues} - {None},
+            {_wbs(issue) for issue in issues} - {""},
+        )
+
+    def _change(self, event, issue):
+        # Apply an issue event, returning the issue it replaces or deletes
+        # (or None). Must be called with the lock held.
+        previous = self._issues.get(issue.key)
+        if event == DELETED:
+            if previous is not None:
+                self._unindex(previous)
+                del self._issues[issue.key]
+        elif previous is not None or self._covers_issue(issue):
+            self._put(issue)
+        return previous
+
+    def _put(self, issue):
+        # Add or replace issue, keeping its position (including within its
+        # WBS element) if it is replaced. Must be called with the lock held.
+        previous = self._issues.get(issue.key)
+        moved = previous is None or _wbs(previous) != _wbs(issue)
+        if previous is not None:
+            self._unindex(previous, moved)
+        self._issues[issue.key] = issue
+        if moved:
+            self._by_wbs.add(_wbs(issue), issue.key)
+        self._by_type.setdefault(_issuetype(issue), set()).add(issue.key)
+        for version in _fix_versions(issue):
+            self._by_version.setdefault(version, set()).add(issue.key)
+
+    def _unindex(self, issue, wbs=True):
+        # Must be called with the lock held.
+        if wbs:
+            self._by_wbs.remove(_wbs(issue), issue.key)
+        _discard(self._by_type, _issuetype(issue), issue.key)
+        for version in _fix_versions(issue):
+            _discard(self._by_version, version, issue.key)
+
+    def _covers_issue(self, issue):
+        # Must be called with the lock held.
+        wbs = _wbs(issue)
+        return any(
+            _issuetype(issue) in types and match_wbs(wbs, prefix)
+            for types, prefix in self._loaded
+        )
+
+
+def _type_names(issue_types):
+    # Issue types with spaces are quoted in JQL (e.g. '"Key Metric"').
+    return frozenset(name.strip('"') for name in issue_types)
+
+
+def _issuetype(issue):
+    issuetype = getattr(issue.fields, "issuetype", None)
+    return None if issuetype is None else issuetype.name
+
+
+def _wbs(issue):
+    return getattr(issue.fields, "customfield_10500", None) or ""
+
+
+def _by_key(issue):
+    # Sort key for "ORDER BY key ASC".
+    return key_order(issue.key)
+
+
+def _by_wbs(calendar, issue):
+    # Sort key for "ORDER BY wbs ASC, fixVersion DESC", by the first
+    # fixVersion of issue. As in JIRA, issues without a fixVersion come
+    # before all others in descending order; versions which are not in
+    # calendar come before it, by name.
+    versions = getattr(issue.fields, "fixVersions", None)
+    if not versions:
+        return (_wbs(issue), 0, 0, "")
+    name = versions[0].name
+    if name in calendar:
+        return (_wbs(issue), 2, -calendar.rank(name), "")
+    return (_wbs(issue), 1, 0, name)
+
+
+def _fix_versions(issue):
+    return {
+        version.name
+        for version in getattr(issue.fields, "fixVersions", None) or ()
+    }
+
+
+def _union(index, names):
+    return set().union(*(index.get(name, ()) for name in names))
+
+
+def _discard(index, name, key):
+    keys = index.get(name)
+    if keys is not None:
+        keys.discard(key)
+        if not keys:
+            del index[name]
@@ -0,0 +1,198 @@
+"""
+Module for generating synthetic JIRA projects shaped like DLP.
+
+The projects are returned as the raw JSON of each issue, as the JIRA REST API
+would return it, so they can be converted with
+`lsst.sqre.records.IssueRecord.from_raw`, served by `lsst.sqre.jirastub`, or
+written out as fixtures. The same arguments and seed always produce the same
+project.
+"""
+
+import random
+
+from .jirakit import CYCLES
+
+# DM cycle names for each DLP cycle letter; see jirakit.dm_to_dlp_cycle.
+DM_SEASONS = {"S": "Summer", "W": "Winter", "X": "Extra", "F": "Fall"}
+
+UNITS = ("arcsec", "mmag", "percent", "seconds")
+
+
+def _link(link_type, direction, key, issuetype):
+    return {
+        "type": {"name": link_type},
+        direction: {"key": key, "fields": {"issuetype": {"name": issuetype}}},
+    }
+
+
+def _issue(key, issuetype, summary, fields=None):
+    raw = {
+        "key": key,
+        "id": key.split("-")[1],
+        "fields": {
+            "summary": summary,
+            "description": None,
+            "issuetype": {"name": issuetype},
+            "fixVersions": [],
+            "resolution": None,
+            "status": {"name": "To Do"},
+            "issuelinks": [],
+            "updated": "2016-05-04T10:11:12.000-0700",
+        },
+    }
+    if fields:
+        raw["fields"].update(fields)
+    return raw
+
+
+def _add_link(link_type, source, target):
+    # Link source to target, adding the link to both issues as JIRA does.
+    source_type = source["fields"]["issuetype"]["name"]
+    target_type = target["fields"]["issuetype"]["name"]
+    source["fields"]["issuelinks"].append(
+        _link(link_type, "outwardIssue", target["key"], target_type)
+    )
+    target["fields"]["issuelinks"].append(
+        _link(link_type, "inwardIssue", source["key"], source_type)
+    )
+
+
+def generate_project(
+    count,
+    seed=0,
+    depth=5,
+    fanout=2,
+    cycles=0,
+    meta_fraction=0.2,
+    misscheduled=0.05,
+    unscheduled=0.01,
+    calendar=CYCLES,
+    project="DLP",
+):
+    """Return a list of count issues (raw JSON) shaped like the DLP project.
+
+    Issues are Milestones and Meta-epics with WBS codes under 02C, arranged
+    in chains of Blocks links depth issues long. Issues earlier in a chain
+    are scheduled in earlier cycles, apart from a fraction which are
+    deliberately misscheduled.
+
+    Args:
+        count: Number of issues.
+        seed: Seed for the random number generator.
+        depth: Number of issues in each chain of blocks.
+        fanout: Number of issues each issue blocks in the next layer of its
+            chain group.
+        cycles: Number of extra links from the end of a chain back to its
+            start, creating cycles of blocks.
+        meta_fraction: Fraction of issues which are Meta-epics (and are not
+            scheduled).
+        misscheduled: Fraction of Milestones scheduled in a random cycle.
+        unscheduled: Fraction of Milestones with no fixVersion.
+        calendar: Ordered cycle names to schedule issues in.
+        project: Project key.
+    """
+    rng = random.Random(seed)
+    issues = []
+    for n in range(count):
+        # Issues are grouped in WBS elements of up to 100 issues.
+        wbs = "02C.{:02d}.{:02d}".format(n // 10000 + 1, n // 100 % 100 + 1)
+        if rng.random() < meta_fraction:
+            issuetype = "Meta-epic"
+        else:
+            issuetype = "Milestone"
+        issue = _issue(
+            f"{project}-{n + 1}",
+            issuetype,
+            f"Synthetic {issuetype.lower()} {n + 1}",
+            {"customfield_10500": wbs},
+        )
+        if issuetype == "Milestone" and rng.random() >= unscheduled:
+            layer = n % depth
+            span = max(len(calendar) - depth, 1)
+            if rng.random() < misscheduled:
+                cycle = rng.choice(calendar)
+            else:
+                start = n // depth % span
+                cycle = calendar[min(start + layer, len(calendar) - 1)]
+            issue["fields"]["fixVersions"] = [{"name": cycle}]
+        issues.append(issue)
+
+    # Issue n is in layer n % depth of its chain group; each blocks up to
+    # fanout issues in the next layer of the same group of depth * fanout.
+    group = depth * fanout
+    for n, issue in enumerate(issues):
+        if n % depth == depth - 1:
+            continue
+        base = n - n % group
+        layer = n % depth + 1
+        targets = [
+            base + layer + depth * k
+            for k in range(fanout)
+            if base + layer + depth * k < count
+        ]
+        for target in rng.sample(targets, min(fanout, len(targets))):
+            _add_link("Blocks", issue, issues[target])
+
+    for _ in range(min(cycles, count // depth)):
+        start = rng.randrange(count // depth) * depth
+        end = min(start + depth - 1, count - 1)
+        if end > start:
+            _add_link("Blocks", issues[end], issues[start])
+    return issues
+
+
+def generate_kpms(
+    count,
+    seed=0,
+    related=3,
+    calendar=CYCLES,
+    project="DLP",
+    dm_project="DM",
+    first=1,
+):
+    """Return a list of count Key Metric issues (raw JSON) and a list of the
+    DM project issues they relate to, in the shape read by
+    `lsst.sqre.jira2txt.jirakpm2txt`.
+
+    Args:
+        count: Number of Key Metric issues.
+        seed: Seed for the random number generator.
+        related: Number of DM issues related to each Key Metric.
+        calendar: Ordered cycle names to schedule the DM issues in.
+        project: Project key of the Key Metric issues.
+        dm_project: Project key of the related issues.
+        first: Number of the first Key Metric's key, so that they can follow
+            on from those of a project made by `generate_project`.
+    """
+    rng = random.Random(seed)
+    kpms = []
+    dms = []
+    for n in range(count):
+        units = rng.choice(UNITS)
+        kpm = _issue(
+            f"{project}-{n + first}",
+            "Key Metric",
+            f"Synthetic metric {n + 1}",
+            {
+                "customfield_11000": rng.randint(1, 100),
+                "customfield_11001": units,
+            },
+        )
+        for index in sorted(rng.sample(range(len(calendar)), related)):
+            cycle = calendar[index]
+            dm = _issue(
+                f"{dm_project}-{len(dms) + 1}",
+                "Epic",
+                f"{kpm['fields']['summary']} in {cycle}",
+                {
+                    "customfield_10900": {
+                        "value": f"{DM_SEASONS[cycle[0]]} 20{cycle[1:]}"
+                    },
+                    "customfield_11000": rng.randint(1, 100),
+                    "customfield_11001": units,
+                },
+            )
+            _add_link("Relates", kpm, dm)
+            dms.append(dm)
+        kpms.append(kpm)
+    return kpms, dms
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+
+
+import random
+import unittest
+from types import SimpleNamespace
+
+import src.lsst.sqre.blockgraph as blockgraph
+
+
+def make_issues(count, edges, milestones):
+    issues = {
+        f"DLP-{n}": SimpleNamespace(
+            key=f"DLP-{n}",
+            fields=SimpleNamespace(
+                issuetype=SimpleNamespace(
+                    name="Milestone" if n in milestones else "Meta-epic"
+                ),
+                issuelinks=[],
+            ),
+        )
+        for n in range(count)
+    }
+    for source, target in edges:
+        issues[f"DLP-{source}"].fields.issuelinks.append(
+            SimpleNamespace(
+                type=SimpleNamespace(name="Blocks"),
+                outwardIssue=issues[f"DLP-{target}"],
+            )
+        )
+    return issues
+
+
+def reachable_milestones(key, issues):
+    # Straightforward reference implementation.
+    found = set()
+    seen = set()
+    stack = [key]
+    while stack:
+        for link in issues[stack.pop()].fields.issuelinks:
+            target = link.outwardIssue
+            if target.fields.issuetype.name == "Milestone":
+                found.add(target.key)
+            if target.key not in seen:
+                seen.add(target.key)
+                stack.append(target.key)
+    return found
+
+
+class BlocksGraphTest(unittest.TestCase):
+    def testRandomGraphs(self):
+        rng = random.Random(42)
+        for _ in range(20):
+            count = rng.randint(1, 40)
+            edges = [
+                (rng.randrange(count), rng.randrange(count))
+                for _ in range(rng.randint(0, 2 * count))
+            ]
+            milestones = set(rng.sample(range(count), count // 2))
+            issues = make_issues(count, edges, milestones)
+            graph = blockgraph.BlocksGraph(issues)
+            for key in issues:
+                self.assertEqual(
+                    graph.dependents(key), reachable_milestones(key, issues)
+                )
+
+    def testCycles(self):
+        issues = make_issues(
+            5, [(0, 1), (1, 2), (2, 0), (3, 3), (3, 4)], {0, 1, 2, 3, 4}
+        )
+        graph = blockgraph.BlocksGraph(issues)
+        self.assertEqual(
+            sorted(graph.cycles()), [["DLP-0", "DLP-1", "DLP-2"], ["DLP-3"]]
+        )
+        self.assertEqual(
+            graph.dependents("DLP-1"), {"DLP-0", "DLP-1", "DLP-2"}
+        )
+        self.assertEqual(graph.dependents("DLP-4"), set())
+
+    def testDeepChain(self):
+        count = 20000
+        issues = make_issues(
+            count, [(n, n + 1) for n in range(count - 1)], {count - 1}
+        )
+        graph = blockgraph.BlocksGraph(issues)
+        self.assertEqual(graph.dependents("DLP-0"), {f"DLP-{count - 1}"})
+        self.assertEqual(graph.cycles(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
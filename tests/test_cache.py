@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+
+import threading
+import unittest
+
+import src.lsst.sqre.cache as cache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class ResponseCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.calls = 0
+
+    def compute(self, body="body"):
+        self.calls += 1
+        return cache.make_response(body, "text/plain", created=self.clock())
+
+    def testExpiry(self):
+        c = cache.ResponseCache(ttl=10, clock=self.clock)
+        first = c.get_or_compute("a", self.compute)
+        self.assertIs(c.get_or_compute("a", self.compute), first)
+        self.assertEqual(self.calls, 1)
+        self.clock.now += 10
+        c.get_or_compute("a", self.compute)
+        self.assertEqual(self.calls, 2)
+
+    def testEviction(self):
+        c = cache.ResponseCache(ttl=10, max_entries=2, clock=self.clock)
+        c.get_or_compute("a", self.compute)
+        c.get_or_compute("b", self.compute)
+        c.get_or_compute("a", self.compute)
+        c.get_or_compute("c", self.compute)
+        self.assertEqual(len(c), 2)
+        self.assertIsNotNone(c.get("a"))
+        self.assertIsNone(c.get("b"))
+
+    def testDisabled(self):
+        c = cache.ResponseCache(ttl=0, clock=self.clock)
+        c.get_or_compute("a", self.compute)
+        c.get_or_compute("a", self.compute)
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(len(c), 0)
+
+    def testSingleFlight(self):
+        c = cache.ResponseCache(ttl=10, clock=self.clock)
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow_compute():
+            started.set()
+            release.wait()
+            return self.compute()
+
+        results = []
+        leader = threading.Thread(
+            target=lambda: results.append(c.get_or_compute("a", slow_compute))
+        )
+        leader.start()
+        started.wait()
+        followers = [
+            threading.Thread(
+                target=lambda: results.append(
+                    c.get_or_compute("a", slow_compute)
+                )
+            )
+            for _ in range(4)
+        ]
+        for follower in followers:
+            follower.start()
+        release.set()
+        for thread in [leader] + followers:
+            thread.join()
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(len(results), 5)
+        self.assertEqual(len({id(result) for result in results}), 1)
+
+    def testErrorsPropagate(self):
+        c = cache.ResponseCache(ttl=10, clock=self.clock)
+
+        def fail():
+            raise RuntimeError("JIRA unavailable")
+
+        with self.assertRaises(RuntimeError):
+            c.get_or_compute("a", fail)
+        self.assertIsNone(c.get("a"))
+
+    def testRefresh(self):
+        c = cache.ResponseCache(ttl=10, clock=self.clock)
+        old = c.get_or_compute("a", self.compute)
+        self.clock.now += 5
+        new = c.refresh("a", lambda: self.compute("new"))
+        self.assertIsNot(new, old)
+        self.assertIs(c.get_or_compute("a", self.compute), new)
+        self.assertEqual(self.calls, 2)
+
+        self.assertEqual(c.items(), [("a", new)])
+        self.clock.now += 10
+        self.assertEqual(c.items(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,11 +1,22 @@
 #!/usr/bin/env python
 
 
+import io
+import json
+import os
+import tempfile
 import unittest
+from types import SimpleNamespace
 
 import src.lsst.sqre.confluence as confluence
 
 
+def make_issue(key, updated="2017-01-01T00:00:00.000+0000"):
+    return SimpleNamespace(
+        key=key, fields=SimpleNamespace(summary=key.lower(), updated=updated)
+    )
+
+
 class ConfluenceTest(unittest.TestCase):
     def testBold(self):
         istr = "test"
@@ -39,6 +50,63 @@ class ConfluenceTest(unittest.TestCase):
             os.linesep.join(table2),
         )
 
+    def testSectionDigest(self):
+        issues = [make_issue("SIM-1"), make_issue("SIM-2")]
+        digest = confluence.section_digest(issues, "a")
+        self.assertEqual(digest, confluence.section_digest(issues, "a"))
+        self.assertNotEqual(digest, confluence.section_digest(issues, "b"))
+        self.assertNotEqual(digest, confluence.section_digest(issues[:1], "a"))
+        issues[1] = make_issue("SIM-2", "2017-01-02T00:00:00.000+0000")
+        self.assertNotEqual(digest, confluence.section_digest(issues, "a"))
+        issues[1] = make_issue("SIM-2", None)
+        self.assertIsNone(confluence.section_digest(issues, "a"))
+
+    def testPageBuilder(self):
+        calls = []
+
+        def lines(issue):
+            calls.append(issue.key)
+            return [confluence.heading(issue.fields.summary, 2), ""]
+
+        def build(issues, cache):
+            page = confluence.PageBuilder(cache)
+            page.add("Intro", "")
+            for issue in issues:
+                page.section(issue.key, [issue], lambda i=issue: lines(i))
+            out = io.StringIO()
+            page.write(out)
+            return page.made, out.getvalue()
+
+        issues = [make_issue("SIM-1"), make_issue("SIM-2")]
+        expected = "Intro\n\nh2. sim-1\n\nh2. sim-2\n\n"
+        self.assertEqual(build(issues, None), (["SIM-1", "SIM-2"], expected))
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "sections.json")
+            made, text = build(issues, confluence.SectionCache(path))
+            self.assertEqual((made, text), (["SIM-1", "SIM-2"], expected))
+
+            # Nothing has been updated, so nothing is made again.
+            del calls[:]
+            made, text = build(issues, confluence.SectionCache(path))
+            self.assertEqual((made, text, calls), ([], expected, []))
+
+            # Only the updated issue's section is made again, and the
+            # section of the issue no longer on the page is dropped.
+            issues = [make_issue("SIM-2", "2017-02-01T00:00:00.000+0000")]
+            made, text = build(issues, confluence.SectionCache(path))
+            self.assertEqual(
+                (made, text), (["SIM-2"], "Intro\n\nh2. sim-2\n\n")
+            )
+            with open(path) as f:
+                self.assertEqual(list(json.load(f)), ["SIM-2"])
+
+            # A corrupt cache is ignored.
+            with open(path, "w") as f:
+                f.write("{")
+            made, _ = build(issues, confluence.SectionCache(path))
+            self.assertEqual(made, ["SIM-2"])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+
+
+import unittest
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import src.lsst.sqre.issuestore as issuestore
+
+
+def make_raw(key, summary, updated="2016-05-04T10:11:12.000-0700"):
+    return {
+        "key": key,
+        "id": key.split("-")[1],
+        "fields": {"summary": summary, "updated": updated},
+    }
+
+
+class FakeJira:
+    def __init__(self, raws):
+        self._options = {"server": "https://jira.example.com/"}
+        self._session = None
+        self.raws = raws
+        self.queries = []
+        self.changed = []
+
+    def search_issues(self, query, maxResults=50, fields=None):
+        self.queries.append((query, fields))
+        if "updated >=" in query:
+            raws = [self.raws[key] for key in self.changed]
+        elif query.startswith("issuekey in"):
+            raws = [raw for raw in self.raws.values() if raw["key"] in query]
+        else:
+            raws = list(self.raws.values())
+        return [SimpleNamespace(key=raw["key"], raw=raw) for raw in raws]
+
+
+class IssueStoreTest(unittest.TestCase):
+    def testSplitOrderBy(self):
+        self.assertEqual(
+            issuestore.split_order_by("project = DLP ORDER BY key ASC"),
+            ("project = DLP", "ORDER BY key ASC"),
+        )
+        self.assertEqual(
+            issuestore.split_order_by("project = DLP"), ("project = DLP", "")
+        )
+
+    def testUpdatedSinceQuery(self):
+        since = datetime.now(timezone.utc) - timedelta(minutes=9, seconds=30)
+        self.assertEqual(
+            issuestore.updated_since_query(
+                "project = DLP ORDER BY key ASC", since
+            ),
+            '(project = DLP) AND updated >= "-10m" ORDER BY key ASC',
+        )
+
+    def testIncrementalSync(self):
+        jira = FakeJira(
+            {
+                "DLP-1": make_raw("DLP-1", "First"),
+                "DLP-2": make_raw("DLP-2", "Second"),
+            }
+        )
+        store = issuestore.IssueStore(":memory:")
+        query = "project = DLP ORDER BY key ASC"
+
+        issues = store.sync(jira, query)
+        self.assertEqual(
+            [i.fields.summary for i in issues], ["First", "Second"]
+        )
+        self.assertEqual(len(jira.queries), 1)
+
+        jira.queries = []
+        jira.raws["DLP-2"] = make_raw("DLP-2", "Changed")
+        jira.raws["DLP-3"] = make_raw("DLP-3", "Third")
+        jira.changed = ["DLP-2"]
+        issues = store.sync(jira, query)
+        self.assertEqual(
+            [i.fields.summary for i in issues], ["First", "Changed", "Third"]
+        )
+        self.assertEqual(jira.queries[0], (query, "key"))
+        self.assertTrue(jira.queries[1][0].startswith("(project = DLP) AND"))
+        self.assertTrue(jira.queries[1][0].endswith("ORDER BY key ASC"))
+        self.assertEqual(jira.queries[2][0], "issuekey in (DLP-3)")
+
+        # Issues which leave the result set are no longer returned.
+        del jira.raws["DLP-1"]
+        jira.changed = []
+        issues = store.sync(jira, query, max_results=1)
+        self.assertEqual([i.key for i in issues], ["DLP-2"])
+
+
+if __name__ == "__main__":
+    unittest.main()
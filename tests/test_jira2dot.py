@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+
+import unittest
+from types import SimpleNamespace
+
+import src.lsst.sqre.jira2dot as jira2dot
+
+
+def make_issue(key, blocks=()):
+    return SimpleNamespace(
+        key=key,
+        permalink=lambda: f"https://jira.example.com/browse/{key}",
+        fields=SimpleNamespace(
+            issuetype=SimpleNamespace(name="Milestone"),
+            customfield_10500="02C.01",
+            summary=f"Summary of {key}",
+            description=None,
+            resolution=None,
+            fixVersions=[SimpleNamespace(name="S17")],
+            issuelinks=[
+                SimpleNamespace(
+                    type=SimpleNamespace(name="Blocks"),
+                    outwardIssue=SimpleNamespace(key=target),
+                )
+                for target in blocks
+            ],
+        ),
+    )
+
+
+class Jira2DotTest(unittest.TestCase):
+    def testStreamedEdges(self):
+        issues = [
+            make_issue("DLP-1", ["DLP-2", "DLP-9"]),
+            make_issue("DLP-2", ["DLP-1"]),
+        ]
+
+        def rank_func(issue):
+            return issue.fields.fixVersions[0].name
+
+        chunks = list(
+            jira2dot.iter_jira2dot(
+                iter(issues), rank_func=rank_func, ranks=["S17"]
+            )
+        )
+        edges = [chunk.strip() for chunk in chunks if "->" in chunk]
+        self.assertEqual(
+            edges[:2], ['"DLP-2" -> "DLP-1"', '"DLP-1" -> "DLP-2"']
+        )
+        # Edges to issues which never arrive are dropped.
+        self.assertFalse(any("DLP-9" in edge for edge in edges))
+        self.assertIn('  { rank=same; "S17"; "DLP-1"; "DLP-2" }\n', chunks)
+        self.assertEqual(
+            jira2dot.jira2dot(issues, rank_func=rank_func, ranks=["S17"]),
+            "".join(chunks),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
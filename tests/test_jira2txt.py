@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+
+
+import functools
+import re
+import unittest
+from types import SimpleNamespace
+
+import src.lsst.sqre.jira2txt as jira2txt
+import src.lsst.sqre.jirakit as jirakit
+
+
+def make_link(type_name, outward=None, inward=None):
+    link = SimpleNamespace(type=SimpleNamespace(name=type_name))
+    if outward:
+        link.outwardIssue = SimpleNamespace(key=outward)
+    if inward:
+        link.inwardIssue = SimpleNamespace(key=inward)
+    return link
+
+
+def make_kpm(key, relates, units="ms"):
+    return SimpleNamespace(
+        key=key,
+        fields=SimpleNamespace(
+            summary=f"Metric {key}",
+            customfield_11000=10,
+            customfield_11001=units,
+            issuelinks=[make_link("Relates", outward=k) for k in relates],
+        ),
+    )
+
+
+def make_dm(key, cycle, value, units="ms"):
+    return SimpleNamespace(
+        key=key,
+        fields=SimpleNamespace(
+            customfield_10900=cycle,
+            customfield_11000=value,
+            customfield_11001=units,
+        ),
+    )
+
+
+def make_milestone(key, wbs, cycle):
+    return SimpleNamespace(
+        key=key,
+        fields=SimpleNamespace(
+            summary=f"Milestone {key}",
+            customfield_10500=wbs,
+            fixVersions=[SimpleNamespace(name=cycle)],
+        ),
+    )
+
+
+class Jira2TxtTest(unittest.TestCase):
+    def setUp(self):
+        self.issues = [
+            make_milestone("DLP-1", "02C.01", "S17"),
+            make_milestone("DLP-2", "02C.01", "S17"),
+            make_milestone("DLP-3", "02C.01", "F17"),
+            make_milestone("DLP-4", "02C.02", "S17"),
+        ]
+
+    def testRowPerIssue(self):
+        lines = jira2txt.jira2txt(
+            self.issues, csv=True, calendar=("S17", "F17")
+        ).splitlines()
+        self.assertEqual(
+            lines,
+            [
+                "WBS,S17,F17",
+                "02C.01,DLP-1,",
+                "02C.01,DLP-2,",
+                "02C.01,,DLP-3",
+                "02C.02,DLP-4,",
+            ],
+        )
+
+    def testGroupWbs(self):
+        output = jira2txt.jira2txt(
+            self.issues, csv=True, calendar=("S17", "F17"), group_wbs=True
+        )
+        self.assertEqual(
+            output,
+            'WBS,S17,F17\r\n02C.01,"DLP-1\nDLP-2",DLP-3\r\n02C.02,DLP-4,\r\n',
+        )
+
+
+class JiraKpm2TxtTest(unittest.TestCase):
+    def setUp(self):
+        self.dm = {
+            "DM-1": make_dm("DM-1", "Winter 2016", 1),
+            "DM-2": make_dm("DM-2", "Summer 2016", 2),
+            "DM-3": make_dm("DM-3", "Summer 2016", 3),
+            "DM-4": make_dm("DM-4", "Fall 2017", 4),
+        }
+        self.calls = []
+
+        def get_issues(server, query, max_results=None, fields=None):
+            keys = re.findall(r"[A-Z]+-\d+", query)
+            self.calls.append(keys)
+            # Mimic JIRA returning results in descending key order.
+            return sorted(
+                (self.dm[key] for key in keys),
+                key=lambda issue: issue.key,
+                reverse=True,
+            )
+
+        self.jirakit = jirakit
+        self._orig = self.jirakit.get_issues
+        self.jirakit.get_issues = get_issues
+
+    def tearDown(self):
+        self.jirakit.get_issues = self._orig
+
+    def testBulkFetch(self):
+        kpms = [
+            make_kpm("DLP-1", ["DM-1", "DM-2"]),
+            make_kpm("DLP-2", ["DM-2", "DM-3"]),
+            make_kpm("DLP-3", []),
+            make_kpm("DLP-4", ["DM-4", "DM-1"]),
+        ]
+        output = jira2txt.jirakpm2txt(kpms, "server", csv=True)
+        self.assertEqual(len(self.calls), 1)
+        lines = output.splitlines()
+        self.assertEqual(len(lines), 5)
+        # DM-3 and DM-2 share a cycle; the later result (DM-2) wins, as it
+        # would with a query for that KPM alone.
+        self.assertIn("DLP-2,Metric DLP-2,10 ms,", lines[2])
+        self.assertEqual(lines[2].split(",").count("2"), 1)
+        self.assertEqual(lines[2].split(",").count("3"), 0)
+
+    def testChunking(self):
+        related = self.jirakit.get_issues_by_key_groups(
+            "server", [["DM-1", "DM-4"], ["DM-2", "DM-3"]], chunk_size=3
+        )
+        self.assertEqual(self.calls, [["DM-1", "DM-4"], ["DM-2", "DM-3"]])
+        related = jira2txt._get_related_issues(
+            "server", [["DM-1", "DM-4"], ["DM-2", "DM-3"]]
+        )
+        self.assertEqual(set(related), set(self.dm))
+
+    def testSharedKeysAcrossChunks(self):
+        # DM-2 is fetched with DLP-1's chunk, so DLP-2's related issues come
+        # from two queries; its row must be as if it were fetched alone.
+        kpms = [
+            make_kpm("DLP-1", ["DM-1", "DM-2"]),
+            make_kpm("DLP-2", ["DM-3", "DM-2"]),
+        ]
+        expected = jira2txt.jirakpm2txt(kpms, "server", csv=True)
+        orig = jira2txt.get_issues_by_key_groups
+        jira2txt.get_issues_by_key_groups = functools.partial(
+            orig, chunk_size=2
+        )
+        try:
+            del self.calls[:]
+            output = jira2txt.jirakpm2txt(kpms, "server", csv=True)
+        finally:
+            jira2txt.get_issues_by_key_groups = orig
+        self.assertEqual(self.calls, [["DM-1", "DM-2"], ["DM-3"]])
+        self.assertEqual(output, expected)
+        self.assertIn("DLP-2,Metric DLP-2,10 ms,", output)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,19 +1,449 @@
 #!/usr/bin/env python
 
 
+import os
+import subprocess
+import sys
 import unittest
+from types import SimpleNamespace
+
+import requests
 
 import src.lsst.sqre.jirakit as jirakit
+import src.lsst.sqre.jirastub as jirastub
+from src.lsst.sqre.records import IssueRecord
+from src.lsst.sqre.synthetic import generate_project
 
 
 class JiraKitTest(unittest.TestCase):
     def testBasic(self):
         self.assertTrue(True)
 
+    def testLazyImports(self):
+        # The command line tools do not import the JIRA client (or tabulate)
+        # until they need it.
+        code = (
+            "import sys, src.lsst.sqre.jira2txt, src.lsst.sqre.jira2dot;"
+            "print(sorted({'jira', 'requests', 'tabulate'}"
+            " & set(sys.modules)))"
+        )
+        output = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            stdout=subprocess.PIPE,
+            universal_newlines=True,
+        ).stdout
+        self.assertEqual(output, "[]\n")
+        self.assertIs(jirakit.JIRAError, jirakit.__getattr__("JIRAError"))
+        self.assertRaises(AttributeError, getattr, jirakit, "NoSuchName")
+
+    def testClientRegistry(self):
+        made = []
+
+        class FakeJira:
+            def __init__(self, options, basic_auth=None):
+                made.append(self)
+                self.closed = False
+                self._session = requests.Session()
+
+            def close(self):
+                self.closed = True
+
+        orig = jirakit.JIRA
+        jirakit.JIRA = FakeJira
+        try:
+            registry = jirakit.ClientRegistry(pool_size=2)
+            jira = registry.get("https://jira.example.com/")
+            self.assertIs(registry.get("https://jira.example.com"), jira)
+            self.assertIsNot(
+                registry.get("https://jira.example.com/", ("user", "pw")),
+                jira,
+            )
+            self.assertEqual(len(registry), 2)
+            adapters = jira._session.adapters
+            self.assertEqual(adapters["https://"]._pool_maxsize, 2)
+
+            # A larger pool replaces the existing one, which is closed.
+            closed = []
+            adapters["https://"].close = lambda: closed.append(True)
+            self.assertIs(
+                registry.get("https://jira.example.com/", pool_size=8), jira
+            )
+            self.assertEqual(closed, [True])
+            self.assertEqual(adapters["https://"]._pool_maxsize, 8)
+            self.assertIs(adapters["http://"], adapters["https://"])
+            registry.get("https://jira.example.com/", pool_size=4)
+            self.assertEqual(adapters["https://"]._pool_maxsize, 8)
+
+            registry.clear()
+            self.assertTrue(all(client.closed for client in made))
+            jira = registry.get("https://jira.example.com/")
+            self.assertIsNot(jira, made[0])
+
+            # In a forked process the registry is emptied, and its lock
+            # replaced in case another thread held it at the time.
+            registry._lock.acquire()
+            jirakit._reset_registries()
+            self.assertEqual(len(registry), 0)
+            self.assertIsNot(registry.get("https://jira.example.com/"), jira)
+        finally:
+            jirakit.JIRA = orig
+
+    def testPackKeyGroups(self):
+        chunks = jirakit._pack_key_groups(
+            [["A-1", "A-2"], ["A-2", "A-3"], ["A-4", "A-5", "A-6", "A-7"]], 3
+        )
+        self.assertEqual(
+            chunks, [["A-1", "A-2", "A-3"], ["A-4", "A-5", "A-6"], ["A-7"]]
+        )
+
+    def testGetIssuesByKey(self):
+        def get_issues(server, query, max_results=None, fields=None):
+            keys = query.split("(", 1)[1].rstrip(")").split(" ,")
+            return [SimpleNamespace(key=key) for key in reversed(keys)]
+
+        orig = jirakit.get_issues
+        jirakit.get_issues = get_issues
+        try:
+            keys = [f"DM-{n}" for n in range(10)] + ["DM-3"]
+            issues = jirakit.get_issues_by_key(
+                "server", keys, chunk_size=4, max_workers=3
+            )
+        finally:
+            jirakit.get_issues = orig
+        self.assertEqual(
+            [issue.key for issue in issues],
+            ["DM-3", "DM-2", "DM-1", "DM-0"]
+            + ["DM-7", "DM-6", "DM-5", "DM-4"]
+            + ["DM-9", "DM-8"],
+        )
+
+    def testGetIssuesByWbs(self):
+        self.assertEqual(
+            jirakit.build_query(("Milestone",), ["02C.04*"]),
+            jirakit.build_query(("Milestone",), "02C.04*"),
+        )
+        raws = [
+            {
+                "key": f"DLP-{n}",
+                "fields": {
+                    "issuetype": {"name": "Milestone"},
+                    "customfield_10500": wbs,
+                },
+            }
+            for n, wbs in enumerate(
+                ["02C.04", "02C.04.01", "02C.041", "02C.05.01", "02C.06", ""]
+            )
+        ]
+        queries = []
+
+        def get_issues(server, query, max_results=None, fields=None):
+            queries.append(query)
+            query = jirastub.Query(query)
+            return [IssueRecord.from_raw(raw) for raw in query.filter(raws)]
+
+        orig = jirakit.get_issues
+        jirakit.get_issues = get_issues
+        try:
+            partitions = jirakit.get_issues_by_wbs(
+                "server",
+                ("Milestone",),
+                ["02C.04", "02C.05*", "02C.0*", "02C.04", "02D*"],
+                chunk_size=2,
+            )
+        finally:
+            jirakit.get_issues = orig
+        self.assertEqual(len(queries), 2)
+        self.assertIn('(wbs ~ "02C.04" OR wbs ~ "02C.05*")', queries[0])
+        self.assertEqual(
+            {
+                prefix: [issue.key for issue in issues]
+                for prefix, issues in partitions.items()
+            },
+            {
+                "02C.04": ["DLP-0", "DLP-1"],
+                "02C.05*": ["DLP-3"],
+                "02C.0*": ["DLP-0", "DLP-1", "DLP-2", "DLP-3", "DLP-4"],
+                "02D*": [],
+            },
+        )
+        self.assertEqual(
+            list(partitions), ["02C.04", "02C.05*", "02C.0*", "02D*"]
+        )
+
+    def testSearchPages(self):
+        raws = [{"key": f"DM-{n}"} for n in range(23)]
+        failures = {10: 1}
+
+        class FakeJira:
+            def search_issues(
+                self, query, startAt, maxResults, fields, json_result
+            ):
+                # Serve at most 5 per page, failing once at offset 10.
+                if failures.get(startAt):
+                    failures[startAt] -= 1
+                    raise jirakit.JIRAError("Try again")
+                size = min(maxResults, 5)
+                end = startAt + size
+                return {
+                    "total": len(raws),
+                    "maxResults": size,
+                    "issues": raws[startAt:end],
+                }
+
+        orig = jirakit.RETRY_DELAY
+        jirakit.RETRY_DELAY = 0
+        try:
+            pages = jirakit._search_pages(FakeJira(), "q", None, None, 50, 3)
+            self.assertEqual(pages, raws)
+            pages = jirakit._search_pages(FakeJira(), "q", None, 12, 50, 3)
+            self.assertEqual(pages, raws[:12])
+        finally:
+            jirakit.RETRY_DELAY = orig
+
+    def testGetEpicTree(self):
+        def raw(key, links=(), epic=None):
+            return {
+                "key": key,
+                "fields": {
+                    "summary": key,
+                    "issuelinks": [
+                        {
+                            "type": {"name": "Containment"},
+                            "outwardIssue": {"key": target},
+                        }
+                        for target in links
+                    ],
+                    "customfield_1": epic,
+                },
+            }
+
+        raws = [
+            raw("SIM-1", ["SIM-3", "SIM-2"]),
+            raw("SIM-2"),
+            raw("SIM-3"),
+            raw("SIM-4", epic="SIM-3"),
+            raw("SIM-5", epic="SIM-3"),
+            raw("SIM-6", epic="SIM-2"),
+        ]
+        queries = []
+
+        class FakeJira:
+            def __init__(self, options, basic_auth=None):
+                self._options = options
+                self._session = requests.Session()
+
+            def fields(self):
+                return [{"id": "customfield_1", "name": "Epic Link"}]
+
+            def search_issues(self, query, startAt, maxResults, fields, **kw):
+                queries.append(query)
+                if query.startswith("issuekey in"):
+                    found = [r for r in raws if r["key"] in query]
+                elif query.startswith("'Epic Link' in"):
+                    found = [
+                        r
+                        for r in raws
+                        if r["fields"]["customfield_1"]
+                        and r["fields"]["customfield_1"] in query
+                    ]
+                else:
+                    found = raws[:1]
+                return {"total": len(found), "issues": found}
+
+        orig = jirakit.JIRA
+        jirakit.JIRA = FakeJira
+        try:
+            tree = jirakit.get_epic_tree(
+                "https://jira.example.com", "q", "Containment", children=True
+            )
+        finally:
+            jirakit.JIRA = orig
+        self.assertEqual(len(queries), 3)
+        [(epic, sub_epics)] = tree
+        self.assertEqual(epic.key, "SIM-1")
+        self.assertEqual(
+            [
+                (node.issue.key, [child.issue.key for child in node.children])
+                for node in sub_epics
+            ],
+            [("SIM-3", ["SIM-4", "SIM-5"]), ("SIM-2", ["SIM-6"])],
+        )
+
     def testCycle(self):
         c = jirakit.cycles()
         self.assertEqual(c[0], "S14")
 
+    def testCalendar(self):
+        calendar = jirakit.CycleCalendar.from_versions(
+            [SimpleNamespace(name=name) for name in ("S17", "Later", "W21")]
+        )
+        self.assertEqual(list(calendar), ["S17", "W21"])
+        self.assertEqual(calendar.rank("W21"), 1)
+        self.assertLess(calendar.compare("S17", "W21"), 0)
+        self.assertRaises(ValueError, calendar.rank, "Later")
+        self.assertEqual(jirakit.compare("F21", "W21"), -1)
+        self.assertEqual(jirakit.compare("W21", "W21", ("W21",)), 0)
+        self.assertEqual(jirakit.compare("W21", "S17", calendar.names), 1)
+        self.assertIs(
+            jirakit._calendar(calendar.names),
+            jirakit._calendar(tuple(calendar)),
+        )
+
+    def testDmToDlpCycle(self):
+        self.assertEqual(jirakit.dm_to_dlp_cycle("Winter 2016"), "W16")
+        self.assertEqual(jirakit.dm_to_dlp_cycle("Summer 2017"), "S17")
+        self.assertRaises(ValueError, jirakit.dm_to_dlp_cycle, "Later")
+
+    def testBadBlocks(self):
+        def milestone(key, cycle, blocks=()):
+            return SimpleNamespace(
+                key=key,
+                fields=SimpleNamespace(
+                    issuetype=SimpleNamespace(name="Milestone"),
+                    fixVersions=[SimpleNamespace(name=cycle)],
+                    issuelinks=[
+                        SimpleNamespace(
+                            type=SimpleNamespace(name="Blocks"),
+                            outwardIssue=SimpleNamespace(
+                                key=target,
+                                fields=SimpleNamespace(
+                                    issuetype=SimpleNamespace(name="Milestone")
+                                ),
+                            ),
+                        )
+                        for target in blocks
+                    ],
+                ),
+            )
+
+        issues = {
+            "DLP-1": milestone("DLP-1", "F17", ["DLP-2"]),
+            "DLP-2": milestone("DLP-2", "S18", ["DLP-3"]),
+            "DLP-3": milestone("DLP-3", "S17"),
+        }
+        expected = [("DLP-1", "DLP-3"), ("DLP-2", "DLP-3")]
+        self.assertEqual(jirakit.get_bad_blocks(issues), expected)
+        self.assertEqual(
+            jirakit.get_bad_blocks(issues, compare_fn=jirakit.compare),
+            expected,
+        )
+        self.assertEqual(
+            jirakit.get_dependents("DLP-1", issues), {"DLP-2", "DLP-3"}
+        )
+
+    def testIncrementalSanity(self):
+        raws = generate_project(200, seed=5, cycles=3)
+
+        def records():
+            return [IssueRecord.from_raw(raw) for raw in raws]
+
+        sanity = jirakit.IncrementalSanity(records(), report_cycles=True)
+        before = jirakit.check_sanity(records(), True)
+        self.assertEqual(sanity.report(), before)
+
+        # Reschedule one milestone, unschedule another, and close a cycle.
+        first, second = [
+            n
+            for n, raw in enumerate(raws)
+            if raw["fields"]["issuetype"]["name"] == "Milestone"
+            and raw["fields"]["fixVersions"]
+        ][:2]
+        raws[first]["fields"]["fixVersions"] = [{"name": "S14"}]
+        raws[second]["fields"]["fixVersions"] = []
+        raws[8]["fields"]["issuelinks"].append(
+            {
+                "type": {"name": "Blocks"},
+                "outwardIssue": {
+                    "key": raws[0]["key"],
+                    "fields": raws[0]["fields"],
+                },
+            }
+        )
+        changed = [IssueRecord.from_raw(raws[n]) for n in (first, second, 8)]
+        diff = sanity.update(changed)
+        expected = jirakit.check_sanity(records(), True)
+        self.assertEqual(
+            sorted(diff.report.splitlines()), sorted(expected.splitlines())
+        )
+        self.assertIn(
+            f"Milestone DLP-{second + 1} [02C.01.01] is not scheduled in any "
+            "cycle.\n",
+            diff.added,
+        )
+        self.assertTrue(
+            any(line.startswith("Blocking cycle") for line in diff.added)
+        )
+        self.assertEqual(
+            set(diff.resolved),
+            set(before.splitlines(True)) - set(expected.splitlines(True)),
+        )
+        self.assertEqual(sanity.update(changed).added, [])
+
+        # Split a cycle: with DLP-1, DLP-2 and DLP-3 all blocking each other,
+        # remove DLP-3's link, leaving DLP-1 and DLP-2 in a cycle.
+        def milestone(n, blocks):
+            return {
+                "key": f"DLP-{n}",
+                "fields": {
+                    "summary": f"Milestone {n}",
+                    "issuetype": {"name": "Milestone"},
+                    "fixVersions": [{"name": "S17"}],
+                    "customfield_10500": "02C.01",
+                    "issuelinks": [
+                        {
+                            "type": {"name": "Blocks"},
+                            "outwardIssue": {
+                                "key": f"DLP-{target}",
+                                "fields": {"issuetype": {"name": "Milestone"}},
+                            },
+                        }
+                        for target in blocks
+                    ],
+                },
+            }
+
+        raws = [milestone(1, [2]), milestone(2, [1, 3]), milestone(3, [2])]
+        sanity = jirakit.IncrementalSanity(records(), report_cycles=True)
+        self.assertEqual(
+            sanity.report(), "Blocking cycle: DLP-1 -> DLP-2 -> DLP-3.\n"
+        )
+        raws[2] = milestone(3, [])
+        diff = sanity.update([IssueRecord.from_raw(raws[2])])
+        self.assertEqual(diff.report, jirakit.check_sanity(records(), True))
+        self.assertEqual(diff.report, "Blocking cycle: DLP-1 -> DLP-2.\n")
+
+    def testClassifyRfcs(self):
+        def rfc(key, triggers=()):
+            return SimpleNamespace(
+                key=key,
+                fields=SimpleNamespace(
+                    issuelinks=[
+                        SimpleNamespace(
+                            type=SimpleNamespace(name=jirakit.TRIGGER_LINK),
+                            outwardIssue=SimpleNamespace(key=target),
+                        )
+                        for target in triggers
+                    ]
+                ),
+            )
+
+        rfcs = [
+            rfc("RFC-1"),
+            rfc("RFC-2", ["DM-1", "DM-2"]),
+            rfc("RFC-3", ["DM-3"]),
+            rfc("RFC-4", ["DM-1", "DM-4"]),
+        ]
+        statuses = {
+            "DM-1": "Done",
+            "DM-2": "Invalid",
+            "DM-3": "Implemented",
+            "DM-4": "In Progress",
+        }
+        no_triggers, done = jirakit.classify_rfcs(rfcs, statuses)
+        self.assertEqual([r.key for r in no_triggers], ["RFC-1", "RFC-3"])
+        self.assertEqual([r.key for r in done], ["RFC-2"])
+
 
 if __name__ == "__main__":
     unittest.main()
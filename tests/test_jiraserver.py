@@ -0,0 +1,343 @@
+#!/usr/bin/env python
+
+
+import threading
+import unittest
+
+import src.lsst.sqre.jiraserver as jiraserver
+from src.lsst.sqre.records import IssueRecord
+
+
+class JiraServerTest(unittest.TestCase):
+    def setUp(self):
+        self.queries = []
+
+        def get_issues(server, query, max_results=None, fields=None):
+            self.queries.append(query)
+            return []
+
+        self._orig = jiraserver.get_issues, jiraserver.iter_issues
+        jiraserver.get_issues = jiraserver.iter_issues = get_issues
+        app = jiraserver.build_server("https://jira.example.com/")
+        self.client = app.test_client()
+
+    def tearDown(self):
+        jiraserver.get_issues, jiraserver.iter_issues = self._orig
+
+    def testCachedSanity(self):
+        first = self.client.get("/wbs/sanity/02C*")
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.data, b"<pre>No errors found.</pre>")
+        self.assertIsNotNone(first.headers.get("ETag"))
+
+        response = self.client.get("/wbs/sanity/02C*")
+        self.assertEqual(response.data, first.data)
+        self.assertEqual(response.headers["ETag"], first.headers["ETag"])
+        self.assertIsNotNone(response.headers.get("Last-Modified"))
+        self.assertEqual(len(self.queries), 1)
+
+        revalidated = self.client.get(
+            "/wbs/sanity/02C*",
+            headers={"If-None-Match": response.headers["ETag"]},
+        )
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(len(self.queries), 1)
+
+        self.client.get("/wbs/sanity/02D*").data
+        self.assertEqual(len(self.queries), 2)
+
+    def testStreamedDot(self):
+        response = self.client.get("/wbs/dot/02C*")
+        self.assertIsNone(response.headers.get("ETag"))
+        self.assertTrue(response.data.startswith(b'digraph "Diagram" {'))
+        self.assertEqual(response.mimetype, "text/vnd.graphviz")
+
+        # Once the stream has completed it is served from the cache.
+        again = self.client.get("/wbs/dot/02C*")
+        self.assertIsNotNone(again.headers.get("ETag"))
+        self.assertEqual(again.data, response.data)
+        self.assertEqual(len(self.queries), 1)
+
+    def testFetchError(self):
+        # If JIRA fails before the first page arrives, the response has not
+        # begun, and carries an error status.
+        def iter_issues(server, query, max_results=None, fields=None):
+            self.queries.append(query)
+            raise RuntimeError("JIRA went away")
+            yield
+
+        jiraserver.get_issues = jiraserver.iter_issues = iter_issues
+        for path in ["/wbs/csv/02C*", "/wbs/dot/02C*", "/wbs/tab/02C*"]:
+            self.assertEqual(self.client.get(path).status_code, 500)
+        self.assertEqual(self.client.get("/kpm").status_code, 500)
+
+        # Failed pages are not cached.
+        self.assertEqual(self.client.get("/wbs/csv/02C*").status_code, 500)
+        self.assertEqual(len(self.queries), 5)
+
+    def testStreamError(self):
+        # If JIRA fails once the response has begun, it ends with an error
+        # line rather than being cut short.
+        def iter_issues(server, query, max_results=None, fields=None):
+            self.queries.append(query)
+            yield IssueRecord.from_raw(
+                {
+                    "key": "DLP-1",
+                    "fields": {
+                        "summary": "Issue 1",
+                        "issuetype": {"name": "Milestone"},
+                        "fixVersions": [{"name": "S17"}],
+                        "customfield_10500": "02C.04.01",
+                        "issuelinks": [],
+                        "resolution": None,
+                        "description": None,
+                    },
+                }
+            )
+            raise RuntimeError("JIRA went away")
+
+        jiraserver.iter_issues = iter_issues
+        with self.assertLogs(jiraserver.logger, "ERROR"):
+            response = self.client.get("/wbs/dot/02C*")
+            response.data
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'"DLP-1"', response.data)
+        self.assertIn(b"Error: this graph is incomplete", response.data)
+        self.assertFalse(response.data.rstrip().endswith(b"}"))
+
+        # The incomplete page is not cached.
+        with self.assertLogs(jiraserver.logger, "ERROR"):
+            self.client.get("/wbs/dot/02C*").data
+        self.assertEqual(len(self.queries), 2)
+
+    def testRfcStatus(self):
+        calls = []
+
+        def rfc_status(server):
+            calls.append(server)
+            return "Retrieved 0 candidate ADOPTED RFCs\n"
+
+        orig = jiraserver.rfc_status
+        jiraserver.rfc_status = rfc_status
+        try:
+            response = self.client.get("/rfc")
+            self.client.get("/rfc")
+        finally:
+            jiraserver.rfc_status = orig
+        self.assertEqual(
+            response.data, b"<pre>Retrieved 0 candidate ADOPTED RFCs\n</pre>"
+        )
+        self.assertEqual(calls, ["https://jira.example.com/"])
+
+    def testMetrics(self):
+        self.client.get("/wbs/sanity/02C.01*").data
+        self.client.get("/wbs/sanity/02C.01*").data
+        text = self.client.get("/metrics").data.decode()
+        self.assertIn(
+            'jirakit_request_seconds_count{route="/wbs/sanity",'
+            'wbs="02C"} 1\n',
+            text,
+        )
+        self.assertIn(
+            'jirakit_stage_seconds_count{route="/wbs/sanity",stage="fetch",'
+            'wbs="02C"} 1\n',
+            text,
+        )
+
+    def testPrewarm(self):
+        app = jiraserver.build_server(
+            "https://jira.example.com/",
+            prewarm=["/wbs/sanity/02C*", "/kpm"],
+            prewarm_popular=1,
+        )
+        prewarmer = app.config["PREWARMER"]
+        client = app.test_client()
+
+        self.assertEqual(
+            prewarmer.run_once(wait=True), ["/wbs/sanity/02C*", "/kpm"]
+        )
+        self.assertEqual(len(self.queries), 2)
+        client.get("/wbs/sanity/02C*")
+        self.assertEqual(len(self.queries), 2)
+
+        # A refresh replaces the cached page, rather than reading it.
+        prewarmer.refresh("/kpm")
+        self.assertEqual(len(self.queries), 3)
+
+        # The most requested page is added to those refreshed.
+        client.get("/wbs/tab/02D*").data
+        self.assertIn("/wbs/tab/02D*", prewarmer.status())
+        cached = client.get("/cache").get_json()
+        self.assertEqual(
+            sorted(entry["url"] for entry in cached["entries"]),
+            ["/kpm?", "/wbs/sanity/02C*?", "/wbs/tab/02D*?"],
+        )
+        self.assertIsNone(cached["prewarm"]["/kpm"]["error"])
+
+    def testNoPrewarm(self):
+        # Without anything to prewarm, or with caching disabled, there is no
+        # prewarmer for /cache to consult.
+        self.assertIsNone(self.client.application.config["PREWARMER"])
+        with self.assertLogs(jiraserver.logger, "WARNING"):
+            app = jiraserver.build_server(
+                "https://jira.example.com/",
+                cache_ttl=0,
+                prewarm=["/kpm"],
+                prewarm_popular=1,
+            )
+        self.assertIsNone(app.config["PREWARMER"])
+        client = app.test_client()
+        client.get("/wbs/sanity/02C*").data
+        cached = client.get("/cache").get_json()
+        self.assertIsNone(cached["prewarm"])
+        self.assertEqual(cached["entries"], [])
+
+    def testWebhook(self):
+        def raw(n, wbs, cycle):
+            return {
+                "key": f"DLP-{n}",
+                "fields": {
+                    "summary": f"Issue {n}",
+                    "issuetype": {"name": "Milestone"},
+                    "fixVersions": [{"name": cycle}],
+                    "customfield_10500": wbs,
+                    "issuelinks": [],
+                },
+            }
+
+        def iter_issues(server, query, max_results=None, fields=None):
+            self.queries.append(query)
+            return [IssueRecord.from_raw(raw(1, "02C.04.01", "S17"))]
+
+        jiraserver.get_issues = jiraserver.iter_issues = iter_issues
+        client = jiraserver.build_server(
+            "https://jira.example.com/", webhooks=True, webhook_secret="s3"
+        ).test_client()
+
+        self.assertIn(b"DLP-1", client.get("/wbs/tab/02C.04").data)
+        client.get("/wbs/tab/02C.05").data
+        self.assertEqual(len(self.queries), 2)
+
+        def post(payload, secret="s3"):
+            return client.post(f"/webhook?secret={secret}", json=payload)
+
+        self.assertEqual(post({}, secret="wrong").status_code, 403)
+        self.assertEqual(post({"webhookEvent": "x"}).status_code, 400)
+        response = post(
+            {
+                "webhookEvent": "jira:issue_updated",
+                "issue": raw(1, "02C.04.01", "F17"),
+            }
+        )
+        self.assertEqual(
+            response.get_json()["invalidated"], ["/wbs/tab/02C.04?"]
+        )
+        response = post(
+            {
+                "webhookEvent": "jira:issue_created",
+                "issue": raw(2, "02C.04.02", "S18"),
+            }
+        )
+
+        # The page is rendered again from the snapshot, without asking JIRA.
+        table = client.get("/wbs/tab/02C.04").data.decode()
+        self.assertEqual(len(self.queries), 2)
+        self.assertEqual(
+            [line.split("|")[1].strip() for line in table.splitlines()[2:]],
+            ["02C.04.01", "02C.04.02"],
+        )
+        self.assertIn("DLP-2", table)
+
+    def testProjectSnapshot(self):
+        raws = [
+            {
+                "key": f"DLP-{n}",
+                "fields": {
+                    "summary": f"Issue {n}",
+                    "issuetype": {"name": issuetype},
+                    "fixVersions": [{"name": "S17"}],
+                    "customfield_10500": wbs,
+                    "issuelinks": [],
+                },
+            }
+            for n, issuetype, wbs in [
+                (1, "Milestone", "02C.04.01"),
+                (2, "Milestone", "02C.05.01"),
+                (3, "Key Metric", None),
+            ]
+        ]
+
+        def get_issues(server, query, max_results=None, fields=None):
+            self.queries.append(query)
+            return [IssueRecord.from_raw(raw) for raw in raws]
+
+        jiraserver.get_issues = get_issues
+        client = jiraserver.build_server(
+            "https://jira.example.com/", project_snapshot=True
+        ).test_client()
+
+        table = client.get("/wbs/tab/02C.04").data.decode()
+        self.assertIn("DLP-1", table)
+        self.assertNotIn("DLP-2", table)
+        self.assertIn("DLP-2", client.get("/wbs/csv/02C*").data.decode())
+        client.get("/wbs/sanity/02C.05").data
+        self.assertEqual(
+            self.queries,
+            [
+                "project = DLP AND issuetype in "
+                '(Milestone, Meta-epic, "Key Metric") '
+                "ORDER BY key ASC, fixVersion DESC"
+            ],
+        )
+
+    def testBackgroundSync(self):
+        raws = [
+            {
+                "key": "DLP-1",
+                "fields": {
+                    "summary": "Issue 1",
+                    "issuetype": {"name": "Milestone"},
+                    "fixVersions": [{"name": "S17"}],
+                    "customfield_10500": "02C.04.01",
+                    "issuelinks": [],
+                },
+            }
+        ]
+        release = threading.Event()
+
+        def get_issues(server, query, max_results=None, fields=None):
+            self.queries.append(query)
+            if len(self.queries) > 1:
+                release.wait(10)
+            return [IssueRecord.from_raw(raw) for raw in raws]
+
+        jiraserver.get_issues = get_issues
+        client = jiraserver.build_server(
+            "https://jira.example.com/",
+            cache_ttl=0,
+            project_snapshot=True,
+            sync_interval=0,
+        ).test_client()
+        self.assertIn("DLP-1", client.get("/wbs/csv/02C*").data.decode())
+
+        # The next request starts a sync, but is answered from the previous
+        # one without waiting for it.
+        raws[0]["key"] = "DLP-2"
+        self.assertIn("DLP-1", client.get("/wbs/csv/02C*").data.decode())
+        self.assertEqual(len(self.queries), 2)
+        release.set()
+        for thread in threading.enumerate():
+            if thread.name == "sync":
+                thread.join(10)
+        self.assertIn("DLP-2", client.get("/wbs/csv/02C*").data.decode())
+
+    def testLazyApp(self):
+        self.assertNotIn("app", vars(jiraserver))
+        self.assertRaises(AttributeError, getattr, jiraserver, "nothing")
+
+    def testUnknownFormat(self):
+        self.assertEqual(self.client.get("/wbs/xyz/02C*").status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+
+
+import os
+import tempfile
+import threading
+import unittest
+
+from werkzeug.serving import make_server
+
+import src.lsst.sqre.jirakit as jirakit
+import src.lsst.sqre.jirastub as jirastub
+from src.lsst.sqre.fixtures import RECORD_ENV, fixture_issues, load_fixtures
+from src.lsst.sqre.metrics import Profile, activate
+from src.lsst.sqre.records import RECORD_FIELDS
+
+
+def make_raw(n, issuetype="Milestone", wbs="02C.01", cycle="S17"):
+    return {
+        "key": f"DLP-{n}",
+        "id": str(n),
+        "fields": {
+            "summary": f"Issue {n}",
+            "issuetype": {"name": issuetype},
+            "fixVersions": [{"name": cycle}],
+            "customfield_10500": wbs,
+            "updated": f"2016-05-{n:02d}T10:00:00.000-0700",
+            "issuelinks": [],
+        },
+    }
+
+
+ISSUES = [
+    make_raw(1),
+    make_raw(2, "Meta-epic", "02C.02"),
+    make_raw(10, wbs="02C.02", cycle="W16"),
+    make_raw(3, "Epic", "02D.01"),
+]
+
+
+def keys(issues):
+    return [issue["key"] for issue in issues]
+
+
+class Serving:
+    # Run app on a local port for the duration of a with block.
+    def __init__(self, app):
+        self.server = make_server("127.0.0.1", 0, app, threaded=True)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever).start()
+        return self.url
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class JiraStubTest(unittest.TestCase):
+    def testQuery(self):
+        query = jirastub.Query(
+            jirakit.build_query(("Milestone", "Meta-epic"), "02C*")
+        )
+        self.assertEqual(
+            keys(query.filter(ISSUES)), ["DLP-1", "DLP-10", "DLP-2"]
+        )
+        query = jirastub.Query("issuekey in (DLP-10 ,DLP-3) ORDER BY key")
+        self.assertEqual(keys(query.filter(ISSUES)), ["DLP-3", "DLP-10"])
+        query = jirastub.Query(
+            '(project = DLP) AND updated >= "2016/05/03 00:00" ORDER BY key'
+        )
+        self.assertEqual(keys(query.filter(ISSUES)), ["DLP-3", "DLP-10"])
+        query = jirastub.Query('updated >= "-1w"')
+        self.assertEqual(keys(query.filter(ISSUES)), [])
+        query = jirastub.Query("NOT fixVersion = S17 OR issuetype = Epic")
+        self.assertEqual(keys(query.filter(ISSUES)), ["DLP-10", "DLP-3"])
+        self.assertRaises(jirastub.JqlError, jirastub.Query, "summary ?? x")
+
+    def testSearch(self):
+        client = jirastub.build_stub(ISSUES, page_size=2).test_client()
+        page = client.get(
+            "/rest/api/2/search",
+            query_string={
+                "jql": "project = DLP ORDER BY key",
+                "startAt": 2,
+                "maxResults": 50,
+                "fields": "summary",
+            },
+        ).get_json()
+        self.assertEqual(page["total"], 4)
+        self.assertEqual(page["maxResults"], 2)
+        self.assertEqual(keys(page["issues"]), ["DLP-3", "DLP-10"])
+        self.assertEqual(page["issues"][0]["fields"], {"summary": "Issue 3"})
+
+    def testRecordAndReplay(self):
+        query = jirakit.build_query(("Milestone", "Meta-epic"), "02C*")
+        with tempfile.TemporaryDirectory() as directory:
+            os.environ[RECORD_ENV] = directory
+            try:
+                with Serving(jirastub.build_stub(ISSUES, page_size=2)) as url:
+                    issues = jirakit.get_issues(
+                        url, query, fields=RECORD_FIELDS
+                    )
+            finally:
+                del os.environ[RECORD_ENV]
+            fixtures = load_fixtures(directory)
+
+        self.assertEqual(
+            [issue.key for issue in issues], ["DLP-1", "DLP-10", "DLP-2"]
+        )
+        self.assertEqual(issues[1].fields.fixVersions[0].name, "W16")
+        self.assertEqual(
+            sorted(keys(fixture_issues(fixtures))),
+            ["DLP-1", "DLP-10", "DLP-2"],
+        )
+
+        # The recordings are enough to answer the same query again.
+        with Serving(jirastub.build_stub([], fixtures=fixtures)) as url:
+            replayed = jirakit.get_issues(url, query, fields=RECORD_FIELDS)
+        self.assertEqual(
+            [issue.key for issue in replayed], [issue.key for issue in issues]
+        )
+
+    def testSharedClient(self):
+        query = jirakit.build_query(("Milestone", "Meta-epic"), "02C*")
+        with Serving(jirastub.build_stub(ISSUES, page_size=2)) as url:
+            jira = jirakit.get_client(url)
+            profile = Profile()
+            with activate(profile):
+                # Both queries, and the pages fetched concurrently, use the
+                # shared client and count into the active profile.
+                for _ in range(2):
+                    issues = jirakit.get_issues(
+                        url, query, fields=RECORD_FIELDS, max_workers=2
+                    )
+            self.assertIs(jirakit.get_client(url.rstrip("/")), jira)
+            jirakit.get_issues(url, query, fields=RECORD_FIELDS)
+        self.assertEqual(len(issues), 3)
+        self.assertEqual(profile.pages, 4)
+        self.assertGreater(profile.bytes, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+
+import unittest
+
+import src.lsst.sqre.metrics as metrics
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class MetricsTest(unittest.TestCase):
+    def testNestedStages(self):
+        clock = FakeClock()
+        profile = metrics.Profile(clock=clock)
+
+        def issues():
+            for n in range(2):
+                clock.now += 1
+                yield n
+
+        with metrics.activate(profile):
+            with metrics.stage("transform"):
+                clock.now += 0.5
+                list(metrics.timed("fetch", issues()))
+                clock.now += 0.25
+        self.assertIsNone(metrics.active())
+        self.assertEqual(profile.seconds, {"transform": 0.75, "fetch": 2})
+        self.assertEqual(profile.elapsed(), 2.75)
+
+        # Without an active profile, nothing is recorded.
+        self.assertEqual(list(metrics.timed("fetch", [1, 2])), [1, 2])
+
+    def testRender(self):
+        profile = metrics.Profile(clock=FakeClock())
+        profile.seconds["fetch"] = 0.3
+        profile.pages = 2
+        registry = metrics.Metrics(buckets=(1, 0.1))
+        registry.record(profile, route="/wbs/csv", wbs="02C")
+        registry.record(profile, route="/wbs/csv", wbs="02C")
+        text = registry.render()
+        self.assertIn(
+            'jirakit_stage_seconds_bucket{route="/wbs/csv",stage="fetch",'
+            'wbs="02C",le="0.1"} 0\n',
+            text,
+        )
+        self.assertIn(
+            'jirakit_stage_seconds_bucket{route="/wbs/csv",stage="fetch",'
+            'wbs="02C",le="+Inf"} 2\n',
+            text,
+        )
+        self.assertIn(
+            'jirakit_fetch_pages_total{route="/wbs/csv",wbs="02C"} 4\n', text
+        )
+        self.assertIn("# TYPE jirakit_request_seconds histogram\n", text)
+        self.assertEqual(metrics.wbs_prefix("02C.01*"), "02C")
+        self.assertEqual(metrics.wbs_prefix("02C*"), "02C")
+        self.assertEqual(metrics.wbs_prefix("02C.01,02D"), "multiple")
+        self.assertEqual(metrics.wbs_prefix("anything"), "other")
+        self.assertEqual(metrics.wbs_prefix(None), "")
+
+
+if __name__ == "__main__":
+    unittest.main()
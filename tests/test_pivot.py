@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+
+
+import unittest
+
+from src.lsst.sqre.pivot import Pivot
+
+
+class PivotTest(unittest.TestCase):
+    def testRows(self):
+        pivot = Pivot(("WBS",), ("S17", "F17", "S18"), fill="-", separator=";")
+        first = pivot.row("02C.01", key="02C.01")
+        pivot.add(first, "F17", "DLP-1")
+        pivot.add(pivot.row("02C.01", key="02C.01"), "F17", "DLP-2")
+        second = pivot.row("02C.02")
+        pivot.set(second, "S17", "DLP-3")
+        pivot.set(second, "W99", "DLP-4")
+
+        self.assertEqual(len(pivot), 2)
+        self.assertEqual(pivot.get(first, "F17"), "DLP-1;DLP-2")
+        self.assertIsNone(pivot.get(first, "S18"))
+        self.assertEqual(pivot.header, ["WBS", "S17", "F17", "S18", "W99"])
+        self.assertEqual(
+            list(pivot.rows()),
+            [
+                ["02C.01", "-", "DLP-1;DLP-2", "-", "-"],
+                ["02C.02", "DLP-3", "-", "-", "DLP-4"],
+            ],
+        )
+
+    def testCsv(self):
+        pivot = Pivot(("KPM", "Title"), ("S17", "F17"))
+        pivot.set(pivot.row("DLP-1", "Metric, one"), "F17", 10)
+        pivot.row("DLP-2", "Metric two")
+        self.assertEqual(
+            list(pivot.iter_csv()),
+            [
+                "KPM,Title,S17,F17\r\n",
+                'DLP-1,"Metric, one",,10\r\n',
+                "DLP-2,Metric two,,\r\n",
+            ],
+        )
+        self.assertEqual(pivot.to_text(csv=True), "".join(pivot.iter_csv()))
+        self.assertIn("| KPM   | Title", pivot.to_text())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+
+
+import random
+import threading
+import unittest
+
+import src.lsst.sqre.prewarm as prewarm
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class PrewarmerTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.refreshed = []
+
+    def refresh(self, url):
+        self.refreshed.append(url)
+        if url == "/broken":
+            raise RuntimeError("JIRA unavailable")
+
+    def prewarmer(self, urls=(), **kwargs):
+        return prewarm.Prewarmer(
+            self.refresh,
+            urls=urls,
+            interval=100,
+            clock=self.clock,
+            rng=random.Random(0),
+            **kwargs,
+        )
+
+    def testBadInterval(self):
+        for interval in (0, -1):
+            with self.assertRaises(ValueError):
+                prewarm.Prewarmer(self.refresh, ["/a"], interval=interval)
+
+    def testPrewarmUrls(self):
+        self.assertEqual(
+            prewarm.prewarm_urls(["02C*", "02D"], fmts=("pdf",)),
+            ["/wbs/pdf/02C*", "/wbs/pdf/02D", "/kpm"],
+        )
+        self.assertEqual(
+            prewarm.prewarm_urls(["02C*"], kpm=False),
+            ["/wbs/pdf/02C*", "/wbs/sanity/02C*"],
+        )
+
+    def testInterval(self):
+        p = self.prewarmer(["/a", "/b"])
+        self.assertEqual(p.run_once(wait=True), ["/a", "/b"])
+        self.assertEqual(p.run_once(wait=True), [])
+
+        # Each URL is next due within the jitter of the interval.
+        status = p.status()
+        for url in ("/a", "/b"):
+            self.assertGreaterEqual(status[url]["next"], 1090)
+            self.assertLessEqual(status[url]["next"], 1110)
+            self.assertEqual(status[url]["refreshed"], 1000)
+        self.clock.now += 111
+        self.assertEqual(p.run_once(wait=True), ["/a", "/b"])
+        self.assertEqual(self.refreshed, ["/a", "/b", "/a", "/b"])
+
+    def testErrors(self):
+        p = self.prewarmer(["/broken", "/a"])
+        p.run_once(wait=True)
+        status = p.status()
+        self.assertEqual(status["/broken"]["error"], "JIRA unavailable")
+        self.assertIsNone(status["/a"]["error"])
+
+    def testPopular(self):
+        p = self.prewarmer(["/a"], popular=1)
+        for url in ("/b", "/c", "/c"):
+            p.hit(url)
+        self.assertEqual(p.run_once(wait=True), ["/a"])
+        self.assertEqual(sorted(p.status()), ["/a", "/c"])
+
+        # Requests are forgotten over time.
+        self.clock.now += 111
+        self.assertEqual(sorted(p.run_once(wait=True)), ["/a", "/c"])
+        p.hit("/b")
+        p.hit("/b")
+        self.clock.now += 100
+        p.run_once(wait=True)
+        self.assertEqual(sorted(p.status()), ["/a", "/b"])
+
+    def testConcurrency(self):
+        release = threading.Event()
+        running = []
+        peak = []
+
+        def refresh(url):
+            running.append(url)
+            peak.append(len(running))
+            release.wait()
+            running.remove(url)
+
+        p = prewarm.Prewarmer(
+            refresh, urls=["/a", "/b", "/c"], max_workers=2, clock=self.clock
+        )
+        p.start(tick=0.01)
+        try:
+            while len(peak) < 2:
+                threading.Event().wait(0.01)
+            # A page being refreshed is not started again.
+            self.clock.now += 1000
+            threading.Event().wait(0.05)
+            self.assertEqual(len(running), 2)
+        finally:
+            release.set()
+            p.stop()
+        self.assertEqual(max(peak), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+
+import unittest
+
+import src.lsst.sqre.records as records
+
+RAW = {
+    "id": "10001",
+    "key": "DLP-1",
+    "self": "https://jira.example.com/rest/api/2/issue/10001",
+    "fields": {
+        "summary": "Deliver the thing",
+        "description": None,
+        "issuetype": {"name": "Milestone", "id": "10100"},
+        "fixVersions": [{"name": "S17", "id": "1"}],
+        "resolution": None,
+        "status": {"name": "To Do", "id": "3"},
+        "customfield_10500": "02C.03.01",
+        "customfield_10502": {"value": "Data Access", "id": "7"},
+        "customfield_99999": "Not projected",
+        "issuelinks": [
+            {
+                "type": {"name": "Blocks"},
+                "outwardIssue": {
+                    "key": "DLP-2",
+                    "fields": {"issuetype": {"name": "Milestone"}},
+                },
+            },
+            {
+                "type": {"name": "Relates"},
+                "inwardIssue": {"key": "DM-3", "fields": {}},
+            },
+        ],
+    },
+}
+
+
+class IssueRecordTest(unittest.TestCase):
+    def testFromRaw(self):
+        issue = records.IssueRecord.from_raw(RAW, "https://jira.example.com/")
+        self.assertEqual(issue.key, "DLP-1")
+        self.assertEqual(str(issue), "DLP-1")
+        self.assertEqual(
+            issue.permalink(), "https://jira.example.com/browse/DLP-1"
+        )
+        self.assertEqual(issue.fields.issuetype.name, "Milestone")
+        self.assertEqual(issue.fields.fixVersions[0].name, "S17")
+        self.assertEqual(str(issue.fields.status), "To Do")
+        self.assertIsNone(issue.fields.resolution)
+        self.assertEqual(issue.fields.customfield_10502.value, "Data Access")
+        self.assertFalse(hasattr(issue.fields, "customfield_99999"))
+        self.assertFalse(hasattr(issue.fields, "customfield_10900"))
+
+        blocks, relates = issue.fields.issuelinks
+        self.assertEqual(blocks.type.name, "Blocks")
+        self.assertFalse(hasattr(blocks, "inwardIssue"))
+        self.assertEqual(blocks.outwardIssue.key, "DLP-2")
+        self.assertEqual(
+            blocks.outwardIssue.fields.issuetype.name, "Milestone"
+        )
+        self.assertFalse(hasattr(relates, "outwardIssue"))
+        self.assertEqual(relates.inwardIssue.key, "DM-3")
+
+    def testSlots(self):
+        issue = records.IssueRecord.from_raw(RAW)
+        self.assertFalse(hasattr(issue, "__dict__"))
+        self.assertFalse(hasattr(issue.fields, "__dict__"))
+
+
+if __name__ == "__main__":
+    unittest.main()
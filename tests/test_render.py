@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import src.lsst.sqre.render as render
+
+
+class GraphRendererTest(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.calls = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def fake_render(self, source, fmt, path):
+        self.calls.append((source, fmt))
+        self.release.wait()
+        with open(path, "w") as f:
+            f.write(f"{fmt}:{source}")
+        return path
+
+    def make_renderer(self, **kwargs):
+        return render.GraphRenderer(
+            cache_dir=self.cache_dir,
+            executor=ThreadPoolExecutor(2),
+            render_func=self.fake_render,
+            **kwargs,
+        )
+
+    def testContentAddressed(self):
+        renderer = self.make_renderer()
+        self.assertEqual(
+            renderer.render("digraph {}", "pdf"), b"pdf:digraph {}"
+        )
+        self.assertEqual(
+            renderer.render("digraph {}", "pdf"), b"pdf:digraph {}"
+        )
+        self.assertEqual(
+            renderer.render("digraph {}", "svg"), b"svg:digraph {}"
+        )
+        self.assertEqual(len(self.calls), 2)
+        renderer.render("digraph { a }", "pdf")
+        self.assertEqual(len(self.calls), 3)
+
+    def testQueueFull(self):
+        renderer = self.make_renderer(max_queue=1, timeout=0.01)
+        self.release.clear()
+        with self.assertRaises(render.RenderTimeout):
+            renderer.render("digraph { a }", "pdf")
+        with self.assertRaises(render.RenderQueueFull):
+            renderer.render("digraph { b }", "pdf")
+        self.release.set()
+        renderer.shutdown()
+
+    def testPrune(self):
+        renderer = self.make_renderer(max_files=2)
+        for name in "abc":
+            renderer.render(f"digraph {{ {name} }}", "pdf")
+        # Wait for the completion callbacks, which prune the cache.
+        renderer.executor.shutdown(wait=True)
+        self.assertLessEqual(len(os.listdir(self.cache_dir)), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+
+
+import unittest
+
+from src.lsst.sqre.jirakit import CycleCalendar
+from src.lsst.sqre.records import IssueRecord
+from src.lsst.sqre.snapshot import (
+    CREATED,
+    DELETED,
+    UPDATED,
+    IssueSnapshot,
+    WbsIndex,
+    covers,
+)
+
+
+def make_raw(n, wbs, issuetype="Milestone", cycle=None):
+    return {
+        "key": f"DLP-{n}",
+        "fields": {
+            "summary": f"Issue {n}",
+            "issuetype": {"name": issuetype},
+            "fixVersions": [{"name": cycle}] if cycle else [],
+            "customfield_10500": wbs,
+        },
+    }
+
+
+def keys(issues):
+    return [issue.key for issue in issues]
+
+
+class SnapshotTest(unittest.TestCase):
+    def testCovers(self):
+        self.assertTrue(covers("02C*", "02C.04"))
+        self.assertTrue(covers("02C*", "02C.0*"))
+        self.assertFalse(covers("02C.04*", "02C*"))
+        self.assertTrue(covers("02C.04", "02C.04.01"))
+        self.assertTrue(covers("02C.04", "02C.04.*"))
+        self.assertFalse(covers("02C.04", "02C.04*"))
+        self.assertFalse(covers("02C.04", "02C.05"))
+
+    def testRecordAndApply(self):
+        snapshot = IssueSnapshot()
+        types = ("Milestone", "Meta-epic")
+        fetched = [
+            IssueRecord.from_raw(make_raw(1, "02C.04.02")),
+            IssueRecord.from_raw(make_raw(2, "02C.04.01", "Meta-epic")),
+        ]
+        self.assertFalse(snapshot.covers(types, ["02C.04"]))
+        recorded = snapshot.record(types, ["02C.04"], fetched)
+        self.assertEqual(keys(recorded), ["DLP-1", "DLP-2"])
+        self.assertTrue(snapshot.covers(("Milestone",), ["02C.04.01"]))
+        self.assertFalse(snapshot.covers(types, ["02C.04", "02C.05"]))
+        self.assertEqual(
+            keys(snapshot.select(types, ["02C.04"])), ["DLP-2", "DLP-1"]
+        )
+        self.assertEqual(
+            keys(snapshot.select(("Milestone",), ["02C.04"])), ["DLP-1"]
+        )
+
+        # A new issue under a covered prefix is added; others are not.
+        change = snapshot.apply(
+            {"webhookEvent": CREATED, "issue": make_raw(3, "02C.04.03")}
+        )
+        self.assertEqual(change.key, "DLP-3")
+        self.assertTrue(change.affects(("Milestone",), ["02C.04*"]))
+        self.assertFalse(change.affects(("Meta-epic",), ["02C.04*"]))
+        self.assertFalse(change.affects(("Milestone",), ["02C.05*"]))
+        snapshot.apply(
+            {"webhookEvent": CREATED, "issue": make_raw(4, "02C.05.01")}
+        )
+        self.assertEqual(len(snapshot), 3)
+
+        # Moving an issue affects both its old and new WBS.
+        change = snapshot.apply(
+            {"webhookEvent": UPDATED, "issue": make_raw(1, "02C.05.01")}
+        )
+        self.assertEqual(change.wbs, {"02C.04.02", "02C.05.01"})
+        self.assertTrue(change.affects(types, ["02C.04.02"]))
+        self.assertEqual(
+            keys(snapshot.select(types, ["02C.04"])), ["DLP-2", "DLP-3"]
+        )
+
+        snapshot.apply(
+            {"webhookEvent": DELETED, "issue": make_raw(2, "02C.04.01")}
+        )
+        self.assertEqual(
+            keys(snapshot.select(types, ["02C*"])), ["DLP-3", "DLP-1"]
+        )
+        self.assertRaises(ValueError, snapshot.apply, {"webhookEvent": "x"})
+        self.assertRaises(ValueError, snapshot.apply, [])
+
+    def testSelectOrder(self):
+        # Issues are selected in the order of the query JIRA would be asked:
+        # by key for any WBS, and otherwise by WBS, then latest fixVersion.
+        snapshot = IssueSnapshot()
+        snapshot.sync(
+            ("Milestone",),
+            lambda: [
+                IssueRecord.from_raw(make_raw(n, wbs, cycle=cycle))
+                for n, wbs, cycle in [
+                    (1, "02C.04", "W16"),
+                    (2, "02C.04", "S17"),
+                    (3, "02C.03", "F17"),
+                    (4, "02C.04", None),
+                    (10, "02C.04", "S17"),
+                    (11, "02C.04", "Later"),
+                ]
+            ],
+        )
+        self.assertEqual(
+            keys(snapshot.select(("Milestone",), None)),
+            ["DLP-1", "DLP-2", "DLP-3", "DLP-4", "DLP-10", "DLP-11"],
+        )
+        self.assertEqual(
+            keys(snapshot.select(("Milestone",), ["02C*"])),
+            ["DLP-3", "DLP-4", "DLP-11", "DLP-2", "DLP-10", "DLP-1"],
+        )
+        self.assertEqual(
+            keys(
+                snapshot.select(
+                    ("Milestone",),
+                    ["02C.04"],
+                    calendar=CycleCalendar(["S17", "W16"]),
+                )
+            ),
+            ["DLP-4", "DLP-11", "DLP-1", "DLP-2", "DLP-10"],
+        )
+
+    def testWbsIndex(self):
+        index = WbsIndex()
+        for key, wbs in [
+            ("a", "02C.04.01"),
+            ("b", "02C.041"),
+            ("c", "02C.04"),
+            ("d", "02C.03"),
+            ("e", "02C.04.01"),
+        ]:
+            index.add(wbs, key)
+        self.assertEqual(list(index.select("02C.04")), ["c", "a", "e"])
+        self.assertEqual(list(index.select("02C.04*")), ["c", "a", "e", "b"])
+        self.assertEqual(list(index.select("02C*")), ["d", "c", "a", "e", "b"])
+        self.assertEqual(list(index.select("02D*")), [])
+
+        index.remove("02C.04.01", "a")
+        index.remove("02C.04.01", "e")
+        index.remove("02C.05", "x")
+        self.assertEqual(list(index.select("02C.04*")), ["c", "b"])
+        self.assertIsNone(index._find("02C.04."))
+
+    def testSync(self):
+        snapshot = IssueSnapshot(clock=lambda: 1000.0)
+        self.assertIsNone(snapshot.age())
+        snapshot.record(
+            ("Milestone",), ["02D"], [IssueRecord.from_raw(make_raw(9, "02D"))]
+        )
+        snapshot.sync(
+            ("Milestone", "Meta-epic"),
+            lambda: [
+                IssueRecord.from_raw(make_raw(1, "02C.04.02", cycle="S17")),
+                IssueRecord.from_raw(make_raw(2, "02C.05", cycle="F17")),
+                IssueRecord.from_raw(make_raw(3, "02C.04.01", "Meta-epic")),
+            ],
+        )
+        self.assertEqual(snapshot.age(), 0)
+        self.assertTrue(snapshot.covers(("Meta-epic",), ["02Z*"]))
+        self.assertTrue(snapshot.covers(("Milestone",), None))
+        self.assertFalse(snapshot.covers(('"Key Metric"',), None))
+        self.assertEqual(
+            keys(snapshot.select(("Milestone", "Meta-epic"), None)),
+            ["DLP-1", "DLP-2", "DLP-3"],
+        )
+        self.assertEqual(
+            keys(snapshot.select(("Milestone",), ["02C.05", "02C.04"])),
+            ["DLP-1", "DLP-2"],
+        )
+        self.assertEqual(
+            keys(snapshot.select(("Milestone",), None, ["F17", "W18"])),
+            ["DLP-2"],
+        )
+        self.assertEqual(
+            snapshot.counts(),
+            ({"Milestone": 2, "Meta-epic": 1}, {"S17": 1, "F17": 1}),
+        )
+
+        # Webhooks keep the indexes up to date.
+        snapshot.apply(
+            {
+                "webhookEvent": UPDATED,
+                "issue": make_raw(2, "02C.05", cycle="S18"),
+            }
+        )
+        self.assertEqual(
+            keys(snapshot.select(("Milestone",), None, ["F17"])), []
+        )
+        snapshot.apply(
+            {"webhookEvent": DELETED, "issue": make_raw(1, "02C.04.02")}
+        )
+        self.assertEqual(
+            snapshot.counts(),
+            ({"Milestone": 1, "Meta-epic": 1}, {"S18": 1}),
+        )
+
+    def testWebhooksDuringSync(self):
+        snapshot = IssueSnapshot()
+        snapshot.sync(
+            ("Milestone",), lambda: [IssueRecord.from_raw(make_raw(1, "02C"))]
+        )
+
+        def fetch():
+            # The query returns the issues as they were before webhooks
+            # which arrive while it is being made.
+            for event, raw in [
+                (UPDATED, make_raw(1, "02D")),
+                (CREATED, make_raw(2, "02C")),
+                (DELETED, make_raw(3, "02C")),
+                (CREATED, make_raw(4, "02C", "Meta-epic")),
+            ]:
+                snapshot.apply({"webhookEvent": event, "issue": raw})
+            return [IssueRecord.from_raw(make_raw(n, "02C")) for n in (1, 3)]
+
+        snapshot.sync(("Milestone",), fetch)
+        self.assertEqual(
+            keys(snapshot.select(("Milestone",), ["02C"])), ["DLP-2"]
+        )
+        self.assertEqual(
+            keys(snapshot.select(("Milestone",), None)), ["DLP-1", "DLP-2"]
+        )
+        self.assertEqual(len(snapshot), 2)
+
+        # A failed sync leaves the snapshot as it was, and stops recording
+        # webhooks.
+        def fail():
+            raise RuntimeError("JIRA unavailable")
+
+        self.assertRaises(RuntimeError, snapshot.sync, ("Milestone",), fail)
+        self.assertEqual(len(snapshot), 2)
+        self.assertIsNone(snapshot._pending)
+
+
+if __name__ == "__main__":
+    unittest.main()
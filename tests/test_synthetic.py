@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+
+
+import unittest
+
+import src.lsst.sqre.synthetic as synthetic
+from src.lsst.sqre.blockgraph import BlocksGraph
+from src.lsst.sqre.jirakit import check_sanity
+from src.lsst.sqre.records import IssueRecord
+
+
+class SyntheticTest(unittest.TestCase):
+    def testGenerateProject(self):
+        raws = synthetic.generate_project(500, seed=3, cycles=4)
+        self.assertEqual(len(raws), 500)
+        self.assertEqual(
+            raws, synthetic.generate_project(500, seed=3, cycles=4)
+        )
+        self.assertNotEqual(raws, synthetic.generate_project(500, seed=4))
+
+        issues = {raw["key"]: IssueRecord.from_raw(raw) for raw in raws}
+        self.assertEqual(
+            {issue.fields.issuetype.name for issue in issues.values()},
+            {"Milestone", "Meta-epic"},
+        )
+        self.assertEqual(len(BlocksGraph(issues).cycles()), 4)
+        self.assertIn(
+            "Blocking cycle",
+            check_sanity(issues.values(), report_cycles=True),
+        )
+
+    def testGenerateKpms(self):
+        kpms, dms = synthetic.generate_kpms(4, related=2, first=11)
+        self.assertEqual(
+            [kpm["key"] for kpm in kpms][:2], ["DLP-11", "DLP-12"]
+        )
+        self.assertEqual(len(dms), 8)
+        link = dms[0]["fields"]["issuelinks"][0]
+        self.assertEqual(link["inwardIssue"]["key"], "DLP-11")
+
+
+if __name__ == "__main__":
+    unittest.main()